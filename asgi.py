@@ -0,0 +1,11 @@
+from asgiref.wsgi import WsgiToAsgi
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from main import app as flask_app
+from blueprints.api_async import routes as async_api_routes, exception_handlers as async_api_exception_handlers
+
+# ASGI entry point: the slow /api routes run as coroutines on the event loop, everything else is the
+# unchanged Flask app. Run with e.g. `uvicorn asgi:app --host 0.0.0.0 --port 8888 --workers 4`.
+app = Starlette(routes=async_api_routes + [Mount('/', app=WsgiToAsgi(flask_app))],
+                exception_handlers=async_api_exception_handlers)
+app.state.flask_app = flask_app
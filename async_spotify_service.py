@@ -0,0 +1,398 @@
+import asyncio
+import os
+import httpx
+from spotify_service import SpotifyService, endpoint_family, _start_revalidation, _finish_revalidation, _cut_by_deadline, \
+    _refresh_lock, HTTP_TIMEOUT
+from http_client import get_async_http_client, RETRY_STATUS_CODES, RETRY_METHODS
+from request_scheduler import parse_retry_after, INTERACTIVE, BACKGROUND
+from deadline import remaining, expired
+from circuit_breaker import CircuitOpenError
+
+# Seconds between attempts to take a user's refresh lock while another thread or coroutine holds it
+REFRESH_LOCK_POLL = 0.05
+
+async def _acquire(lock):
+    """Take a threading lock without blocking the event loop, so coroutines refreshing a user's token wait
+    on the same lock as SpotifyService threads; polling leaves nothing holding it if the caller is cancelled"""
+    while not lock.acquire(blocking=False):
+        await asyncio.sleep(REFRESH_LOCK_POLL)
+
+# Running background refreshes of stale cache entries; the loop only keeps weak references to tasks
+_revalidation_tasks = set()
+
+def _network_failure(e, deadline=None, timeout=None):
+    if isinstance(e, httpx.TimeoutException) and _cut_by_deadline(deadline, timeout):
+        return False
+    return isinstance(e, httpx.HTTPError)
+
+class AsyncSpotifyService(SpotifyService):
+    """asyncio sibling of SpotifyService for high-concurrency fan-out.
+
+    The API methods are coroutines with the same names and return values as SpotifyService. Responses
+    go through the same shared cache, rate-limit scheduler and token-refresh state, so many calls can
+    be in flight on one event loop without a worker thread each."""
+
+    def __init__(self, client_id=None, client_secret=None, tokens=None, user_id=None, on_token_refresh=None):
+        super().__init__(client_id, client_secret, tokens, user_id=user_id, on_token_refresh=on_token_refresh)
+        # Coroutines are cheap, so crawl more pages at once than the thread pool does; the scheduler still caps the rate
+        self._pagination_concurrency = int(os.environ.get('SPOTIFY_ASYNC_PAGINATION_CONCURRENCY', 16))
+
+    @property
+    def _client(self):
+        return get_async_http_client()
+
+    async def refresh_token(self):
+        """Refresh the access token using the refresh token"""
+        if not self._can_refresh():
+            return False
+        headers, data = self._refresh_request()
+
+        key = self._cache_namespace()
+        lock = _refresh_lock(key)
+        await _acquire(lock)
+        try:
+            if self._adopt_latest_tokens(key):
+                return True
+
+            try:
+                with self._breaker('token').attempt(_network_failure) as call:
+                    response = await self._client.post('https://accounts.spotify.com/api/token', headers=headers, data=data)
+                    call.failed = response.status_code >= 500
+                if response.status_code != 200:
+                    print(f"Error: Token refresh failed with status {response.status_code}. Response: {response.text}")
+                    return False
+                self._store_refreshed_tokens(key, response.json())
+            except Exception as e:
+                print(f"Error during token refresh: {str(e)}")
+                return False
+
+            # on_token_refresh writes to the database, so keep it off the event loop
+            await asyncio.to_thread(self._persist_tokens)
+            return True
+        finally:
+            lock.release()
+
+    async def _send(self, method, url, headers, params=None, data=None, priority=INTERACTIVE, deadline=None, family='library'):
+        """Send one call through the client_id's rate-limit queue, re-queueing after a 429 for Retry-After"""
+        client_key = self.client_id or 'default'
+        breaker = self._breaker(family)
+        response = None
+        server_errors = 0
+        rate_limits = 0
+        while True:
+            if expired(deadline):
+                print("Error: Request deadline passed, dropping Spotify request.")
+                return None
+            breaker.check()
+            if not await self._scheduler.acquire_async(client_key, priority, timeout=remaining(deadline, self._max_queue_wait)):
+                print(f"Error: Waited over {remaining(deadline, self._max_queue_wait):.1f}s for the Spotify rate limit, dropping request.")
+                return None
+            timeout = remaining(deadline, HTTP_TIMEOUT)
+            # Transport retries would each wait the full timeout, so calls with a deadline go without them
+            client = self._client if deadline is None else get_async_http_client(retries=False)
+            with breaker.attempt(lambda e: _network_failure(e, deadline, timeout)) as call:
+                response = await client.request(method, url, headers=headers, params=params,
+                                              json=data if method != 'GET' else None,
+                                              timeout=timeout)
+                call.failed = response.status_code >= 500
+            if response.status_code in RETRY_STATUS_CODES and method in RETRY_METHODS \
+                    and server_errors < self._server_error_retries:
+                backoff = self._server_error_backoff * (2 ** server_errors)
+                # Retry only while the backoff leaves time for another attempt
+                if deadline is None or backoff < deadline.remaining():
+                    await asyncio.sleep(backoff)
+                    server_errors += 1
+                    continue
+            if response.status_code != 429:
+                return response
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            self._scheduler.penalize(client_key, retry_after)
+            if retry_after > remaining(deadline, self._max_queue_wait) or rate_limits >= self._rate_limit_retries:
+                return response
+            rate_limits += 1
+            print(f"Rate limited by Spotify, retrying in {retry_after}s.")
+
+    async def make_api_request(self, endpoint, method='GET', data=None, params=None, cache_expiry=None, use_cache=True,
+                               priority=INTERACTIVE, deadline=None, stale_ok=False):
+        """Make a request to the Spotify API with automatic token refresh and caching for GET requests"""
+        if not self.tokens:
+            print("Error: No tokens available for API request.")
+            return None
+
+        stale_response = None
+        if method == 'GET' and use_cache:
+            cache_key = self._get_cache_key(endpoint, params)
+            expiry = cache_expiry if cache_expiry is not None else self._default_cache_expiry
+            cached_response, stale = await self._cache_call(self._lookup_cache, cache_key, expiry, stale_ok)
+            if cached_response is not None and stale is None:
+                return cached_response
+            if stale == 'revalidate':
+                self._revalidate(endpoint, params, cache_key, expiry)
+                return cached_response
+            stale_response = cached_response
+
+        try:
+            response_data = await self._fetch_shared(endpoint, method, data, params, priority, deadline)
+        except CircuitOpenError:
+            if stale_response is None:
+                raise
+            response_data = None
+        if response_data is None:
+            if stale_response is not None:
+                print(f"Serving a stale cached response for {endpoint} since Spotify did not answer.")
+            return stale_response
+
+        if method == 'GET' and use_cache:
+            await self._cache_call(self._set_to_cache, cache_key, response_data, expiry, stale_ok)
+        return response_data
+
+    async def _cache_call(self, method, *args):
+        """Run a shared cache call in a worker thread when it may touch the SQLite second tier, else on the loop"""
+        if self._cache.l2 is None:
+            # The in-memory tier only takes a lock for a dict lookup; a thread hop would cost more than it saves
+            return method(*args)
+        return await asyncio.to_thread(method, *args)
+
+    def _revalidate(self, endpoint, params, cache_key, expiry):
+        """Refresh a stale cache entry in a task on the running loop unless a refresh is already running"""
+        key = (self._cache_namespace(), cache_key)
+        if not _start_revalidation(key):
+            return
+
+        async def refresh():
+            try:
+                response_data = await self._fetch_shared(endpoint, 'GET', None, params, BACKGROUND, None)
+                if response_data is not None:
+                    await self._cache_call(self._set_to_cache, cache_key, response_data, expiry, True)
+            except Exception as e:
+                print(f"Error refreshing cached {endpoint}: {str(e)}")
+            finally:
+                _finish_revalidation(key)
+        task = asyncio.get_running_loop().create_task(refresh())
+        _revalidation_tasks.add(task)
+        task.add_done_callback(_revalidation_tasks.discard)
+
+    async def _fetch_shared(self, endpoint, method, data, params, priority, deadline):
+        """_fetch, with a GET joining an identical one already in flight on this loop for this user"""
+        if method != 'GET':
+            return await self._fetch(endpoint, method, data, params, priority, deadline)
+        key = (self._cache_namespace(), self._get_cache_key(endpoint, params))
+        try:
+            return await self._single_flight.do_async(
+                key, lambda: self._fetch(endpoint, method, data, params, priority, deadline), timeout=remaining(deadline))
+        except asyncio.TimeoutError:
+            print("Error: Request deadline passed waiting for an identical Spotify request, dropping it.")
+            return None
+
+    async def _fetch(self, endpoint, method, data, params, priority, deadline):
+        """Send an API request, refreshing the token on a 401, and return the JSON body or None on failure"""
+        if self._token_expiring(self.tokens):
+            await self.refresh_token()
+
+        url = f"{self.base_url}/{endpoint}"
+        headers = {'Authorization': f"Bearer {self.tokens['access_token']}"}
+
+        try:
+            if method not in ('GET', 'POST', 'PUT'):
+                print(f"Error: Unsupported HTTP method {method}.")
+                return None
+            if method != 'GET':
+                headers['Content-Type'] = 'application/json'
+            response = await self._send(method, url, headers, params, data, priority, deadline, endpoint_family(endpoint))
+            if response is None:
+                return None
+
+            if response.status_code == 401:
+                print("Token expired, attempting refresh.")
+                if not await self.refresh_token():
+                    print("Error: Token refresh failed, cannot retry API request. Check refresh token or client credentials.")
+                    return None
+                headers['Authorization'] = f"Bearer {self.tokens['access_token']}"
+                response = await self._send(method, url, headers, params, data, priority, deadline, endpoint_family(endpoint))
+                if response is None:
+                    return None
+
+            if response.status_code not in (200, 201):
+                print(f"Error: API request failed with status {response.status_code}. Response: {response.text}")
+                return None
+
+            return response.json()
+        except CircuitOpenError:
+            raise
+        except httpx.HTTPError as e:
+            print(f"Network error during API request: {str(e)}")
+            return None
+        except Exception as e:
+            print(f"Unexpected error during API request: {str(e)}")
+            return None
+
+    async def get_user_profile(self, access_token=None):
+        """Get the current user's profile, use extended cache as profile data changes infrequently"""
+        if access_token:
+            response = await self._client.get(f"{self.base_url}/me", headers={'Authorization': f"Bearer {access_token}"})
+            if response.status_code != 200:
+                return None
+            return response.json()
+
+        return await self.make_api_request('me', cache_expiry=self._extended_cache_expiry, stale_ok=True)
+
+    async def get_liked_songs_page(self, offset=0, limit=50, deadline=None):
+        """Get one page of liked songs (newest first) along with the library total"""
+        response = await self.make_api_request('me/tracks', params={'limit': limit, 'offset': offset}, deadline=deadline)
+        if not response or 'items' not in response:
+            return None
+        return {
+            'tracks': [self._parse_saved_track(item) for item in response['items']],
+            'total': response.get('total', 0)
+        }
+
+    async def get_liked_songs(self, limit=50):
+        """Get the user's liked songs"""
+        songs, _, _ = await self._fetch_pages('me/tracks', self._parse_saved_track, limit=limit)
+        return songs
+
+    async def get_all_liked_songs(self, deadline=None, offset=0):
+        """Crawl the Liked Songs library from offset, returning what SpotifyService.get_all_liked_songs does"""
+        songs, total, complete = await self._fetch_pages('me/tracks', self._parse_saved_track, limit=None,
+                                                         use_cache=False, priority=BACKGROUND, deadline=deadline,
+                                                         start=offset)
+        if not complete and not songs:
+            return None
+        return {'tracks': songs, 'total': total, 'complete': complete}
+
+    async def _fetch_pages(self, endpoint, parse_item, limit=None, page_size=50, cache_expiry=None, use_cache=True,
+                           priority=INTERACTIVE, stale_ok=False, deadline=None, start=0):
+        """Fetch a paged endpoint, reading total from the first page and gathering the remaining offsets.
+
+        Returns (items, total, complete) exactly like SpotifyService._fetch_pages."""
+        async def fetch(offset):
+            for attempt in range(self._page_retries + 1):
+                params = {'limit': page_size, 'offset': offset}
+                response = await self.make_api_request(endpoint, params=params, cache_expiry=cache_expiry,
+                                                       use_cache=use_cache, priority=priority, stale_ok=stale_ok,
+                                                       deadline=deadline)
+                if response and 'items' in response:
+                    return [parse_item(item) for item in response['items']], response.get('total', 0)
+                if expired(deadline):
+                    break
+                if attempt < self._page_retries:
+                    await asyncio.sleep(0.5 * (attempt + 1))
+            return None
+
+        first = await fetch(start)
+        if first is None:
+            return [], 0, False
+        items, total = first
+        wanted = total if limit is None else min(total, limit)
+        offsets = list(range(start + page_size, wanted, page_size))
+        if offsets and len(items) == page_size:
+            semaphore = asyncio.Semaphore(max(1, self._pagination_concurrency))
+            async def bounded(offset):
+                async with semaphore:
+                    return await fetch(offset)
+            # gather returns pages in offset order regardless of completion order
+            for page in await asyncio.gather(*(bounded(offset) for offset in offsets)):
+                if page is None:
+                    return items[:wanted], total, False
+                items.extend(page[0])
+        return items[:wanted], total, True
+
+    async def create_playlist(self, name, track_uris):
+        """Create a playlist with the given tracks, invalidate user playlists cache after creation"""
+        user_profile = await self.get_user_profile()
+        if not user_profile:
+            return {"success": False, "message": "Failed to retrieve user profile. Please authenticate again."}
+
+        user_id = user_profile['id']
+        data = {
+            'name': name,
+            'description': 'Generated by AI based on your music taste',
+            'public': True
+        }
+
+        playlist = await self.make_api_request(f'users/{user_id}/playlists', method='POST', data=data)
+        if not playlist:
+            return {"success": False, "message": "Failed to create playlist. Please try again."}
+
+        added = await self._add_track_batches(playlist['id'], track_uris)
+        if added < len(track_uris):
+            return {"success": False, "message": f"Failed to add tracks to playlist. Only {added} tracks were added."}
+
+        await self._cache_call(self._invalidate_cache, f'users/{user_id}/playlists')
+
+        return {
+            "success": True,
+            "message": f"Playlist '{playlist['name']}' created successfully with {added} tracks.",
+            "id": playlist['id'],
+            "name": playlist['name'],
+            "external_url": playlist['external_urls']['spotify'],
+            "track_count": added
+        }
+
+    async def get_user_playlists(self, limit=50):
+        """Get a list of the user's playlists"""
+        user_profile = await self.get_user_profile()
+        if not user_profile:
+            return {"success": False, "message": "Failed to retrieve user profile. Please authenticate again."}
+
+        playlists, _, _ = await self._fetch_pages(
+            f"users/{user_profile['id']}/playlists",
+            self._parse_playlist,
+            limit=limit,
+            cache_expiry=self._default_cache_expiry,
+            stale_ok=True
+        )
+
+        return {"success": True, "playlists": playlists}
+
+    async def add_tracks_to_playlist(self, playlist_id, track_uris):
+        """Add tracks to an existing playlist, invalidate playlist cache after update"""
+        added = await self._add_track_batches(playlist_id, track_uris)
+        if added < len(track_uris):
+            return {"success": False, "message": f"Failed to add tracks to playlist. Only {added} tracks were added."}
+
+        await self._cache_call(self._invalidate_cache, f'playlists/{playlist_id}/tracks')
+
+        return {
+            "success": True,
+            "message": f"Successfully added {added} tracks to the playlist.",
+            "track_count": added
+        }
+
+    async def _add_track_batches(self, playlist_id, track_uris):
+        """Add tracks in batches of 100, in order, stopping at the first failed batch; returns the count added"""
+        added_tracks = 0
+        for i in range(0, len(track_uris), 100):
+            batch = track_uris[i:i+100]
+            result = await self.make_api_request(f'playlists/{playlist_id}/tracks', method='POST', data={'uris': batch})
+            if not result:
+                break
+            added_tracks += len(batch)
+        return added_tracks
+
+    async def search_tracks(self, query, limit=10, deadline=None, priority=INTERACTIVE):
+        """Search for tracks on Spotify with extended cache expiry"""
+        params = {
+            'q': query,
+            'type': 'track',
+            'limit': limit
+        }
+
+        response = await self.make_api_request('search', params=params, cache_expiry=self._extended_cache_expiry,
+                                               priority=priority, deadline=deadline)
+
+        # None signals a failed search, as opposed to an empty list for a search with no matches
+        if not response or 'tracks' not in response:
+            return None
+
+        return [self._parse_search_track(item) for item in response['tracks']['items']]
+
+    async def get_available_genres(self):
+        """Get a list of available genre seeds for recommendations from Spotify API"""
+        response = await self.make_api_request('recommendations/available-genre-seeds', cache_expiry=self._extended_cache_expiry,
+                                               stale_ok=True)
+
+        if not response or 'genres' not in response:
+            return []
+
+        return response['genres']
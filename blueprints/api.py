@@ -1,10 +1,129 @@
-from flask import Blueprint, request, session, jsonify
+import json
+from flask import Blueprint, Response, request, session, jsonify, stream_with_context
 from spotify_service import SpotifyService
 from recommendation_service import RecommendationService
 from user_service import UserService
+from library_service import LibraryService
+from verification_cache import VerificationCache
+from recommendation_cache import RecommendationCache
+from candidate_pool import shared_candidate_pool
+from job_queue import shared_job_queue, JobCancelled, QUEUED
+from deadline import Deadline, DEFAULT_REQUEST_DEADLINE, DEFAULT_JOB_DEADLINE
+from circuit_breaker import CircuitOpenError
 
 api_bp = Blueprint('api', __name__)
 user_service = UserService()
+library_service = LibraryService()
+verification_cache = VerificationCache()
+recommendation_cache = RecommendationCache()
+
+# Keep proxies (nginx buffers by default) from holding back streamed events
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+# Set on a recommendations response cut short by the request deadline
+PARTIAL_HEADER = 'X-Partial-Result'
+
+# Operations that can run as background jobs, and those that need a Google AI API key
+JOB_KINDS = ('recommendations', 'filter_suggestions', 'create_playlist')
+GEMINI_JOB_KINDS = ('recommendations', 'filter_suggestions')
+
+# Input validation shared by these routes and the async routes in blueprints/api_async.py
+
+def parse_recommendation_params(data):
+    """Validate a recommendations request body, returning (params, None) or (None, error message)"""
+    if not isinstance(data, dict):
+        return None, "Invalid input format for parameters"
+    try:
+        count = int(data.get('count', 20))
+        if not 1 <= count <= 50:
+            return None, "Count must be between 1 and 50"
+            
+        discovery_level = int(data.get('discovery_level', 50))
+        if not 0 <= discovery_level <= 100:
+            return None, "Discovery level must be between 0 and 100"
+            
+        min_year = int(data.get('min_year', 1900))
+        if not 1900 <= min_year <= 2025:
+            return None, "Minimum year must be between 1900 and 2025"
+            
+        max_popularity = int(data.get('max_popularity', 100))
+        if not 0 <= max_popularity <= 100:
+            return None, "Maximum popularity must be between 0 and 100"
+            
+        genres = data.get('genres', [])
+        if not isinstance(genres, list):
+            return None, "Genres must be a list"
+            
+        moods = data.get('moods', [])
+        if not isinstance(moods, list):
+            return None, "Moods must be a list"
+            
+        different = data.get('different', False)
+        if not isinstance(different, bool):
+            return None, "Different must be true or false"
+    except (ValueError, TypeError):
+        return None, "Invalid input format for parameters"
+    
+    return {
+        'count': count,
+        'discovery_level': discovery_level,
+        'min_year': min_year,
+        'max_popularity': max_popularity,
+        'genres': genres,
+        'moods': moods,
+        'different': different
+    }, None
+
+def validate_playlist_name(playlist_name):
+    """Return an error message for an unusable playlist name, or None"""
+    if not isinstance(playlist_name, str):
+        return "Playlist name must be a string"
+    if len(playlist_name) > 100:
+        return "Playlist name must not exceed 100 characters"
+    return None
+
+def validate_track_uris(track_uris):
+    """Return an error message for an unusable list of track URIs, or None"""
+    if not isinstance(track_uris, list):
+        return "Track URIs must be a list"
+    if not track_uris:
+        return "No tracks provided"
+    if len(track_uris) > 100:
+        return "Too many tracks, maximum allowed is 100"
+    for uri in track_uris:
+        if not isinstance(uri, str) or not uri.startswith('spotify:track:'):
+            return "Invalid track URI format"
+    return None
+
+def parse_job_params(kind, data):
+    """Validate the parameters of a job, returning (params, None) or (None, error message)"""
+    if kind == 'recommendations':
+        return parse_recommendation_params(data)
+    if kind == 'filter_suggestions':
+        return {}, None
+    if kind == 'create_playlist':
+        if not isinstance(data, dict):
+            return None, "Invalid request format"
+        playlist_name = data.get('name', 'AI Generated Playlist')
+        track_uris = data.get('track_uris', [])
+        error = validate_playlist_name(playlist_name) or validate_track_uris(track_uris)
+        if error:
+            return None, error
+        return {'name': playlist_name, 'track_uris': track_uris}, None
+    return None, "Unknown job kind"
+
+def prefers_async(headers):
+    """Whether the client sent "Prefer: respond-async" and wants a job id instead of waiting for the result"""
+    return 'respond-async' in headers.get('Prefer', '').lower()
+
+def submit_job(user_id, kind, data):
+    """Validate and queue a job for a user whose credentials were already checked.
+    
+    Returns (body, status, headers): a 202 pointing at the job, or a 400 for invalid parameters"""
+    params, error = parse_job_params(kind, data)
+    if error:
+        return {"error": error}, 400, {}
+    job_id = shared_job_queue.submit(user_id, kind, params)
+    return {"job_id": job_id, "status": QUEUED}, 202, {'Location': f'/api/jobs/{job_id}'}
 
 @api_bp.route('/api/save-spotify-creds', methods=['POST'])
 def save_spotify_creds():
@@ -72,7 +191,7 @@ def validate_spotify_creds():
     if not user_id:
         return jsonify({"valid": False})
         
-    creds = user_service.get_spotify_credentials(user_id)
+    creds = user_service.get_request_context(user_id).spotify_credentials
     if not creds:
         return jsonify({"valid": False})
         
@@ -84,92 +203,137 @@ def validate_spotify_creds():
     except:
         return jsonify({"valid": False})
 
-@api_bp.route('/api/recommendations', methods=['POST'])
-def get_recommendations():
+def sse_event(event, data):
+    """Format one server-sent event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def error_status(e):
+    """Status code and extra headers for a failed call: 503 with Retry-After while an upstream circuit is open"""
+    if isinstance(e, CircuitOpenError):
+        return 503, {'Retry-After': str(e.retry_after)}
+    return 500, {}
+
+def error_event(e, sent):
+    """Payload of the 'error' event ending a recommendations stream"""
+    event = {"error": str(e), "count": sent}
+    if isinstance(e, CircuitOpenError):
+        event["retry_after"] = e.retry_after
+    return event
+
+@api_bp.errorhandler(CircuitOpenError)
+def upstream_unavailable(e):
+    """Spotify or Gemini calls are failing fast; tell the client when to try again instead of a bare 500"""
+    return jsonify({"error": str(e)}), 503, {'Retry-After': str(e.retry_after)}
+
+def cut_short(deadline, returned, requested):
+    """Whether the deadline stopped a recommendations run before it reached the requested count"""
+    return returned < requested and deadline.expired()
+
+def _recommendation_request(deadline):
+    """Validate a recommendations request and build its services; the library sync stops at deadline.
+    
+    Returns (recommendation_service, spotify, liked_songs, params, None) or an error response as the last item"""
     if 'user_id' not in session:
-        return jsonify({"error": "Not authenticated"}), 401
+        return None, None, None, None, (jsonify({"error": "Not authenticated"}), 401)
     
     user_id = session['user_id']
     
     # Get API key
-    gemini_api_key = user_service.get_gemini_api_key(user_id)
+    gemini_api_key = user_service.get_request_context(user_id).gemini_api_key
     if not gemini_api_key:
-        return jsonify({"error": "Google AI API key not set"}), 400
+        return None, None, None, None, (jsonify({"error": "Google AI API key not set"}), 400)
     
     # Get Spotify credentials and tokens
-    spotify_creds = user_service.get_spotify_credentials(user_id)
+    spotify_creds = user_service.get_request_context(user_id).spotify_credentials
     if not spotify_creds:
-        return jsonify({"error": "Spotify credentials not set"}), 400
+        return None, None, None, None, (jsonify({"error": "Spotify credentials not set"}), 400)
         
-    spotify_tokens = user_service.get_spotify_tokens(user_id)
+    spotify_tokens = user_service.get_request_context(user_id).spotify_tokens
     if not spotify_tokens:
-        return jsonify({"error": "Spotify authentication failed"}), 400
+        return None, None, None, None, (jsonify({"error": "Spotify authentication failed"}), 400)
     
     # Get request data with input validation
-    data = request.json
-    try:
-        count = int(data.get('count', 20))
-        if not 1 <= count <= 50:
-            return jsonify({"error": "Count must be between 1 and 50"}), 400
-            
-        discovery_level = int(data.get('discovery_level', 50))
-        if not 0 <= discovery_level <= 100:
-            return jsonify({"error": "Discovery level must be between 0 and 100"}), 400
-            
-        min_year = int(data.get('min_year', 1900))
-        if not 1900 <= min_year <= 2025:
-            return jsonify({"error": "Minimum year must be between 1900 and 2025"}), 400
-            
-        max_popularity = int(data.get('max_popularity', 100))
-        if not 0 <= max_popularity <= 100:
-            return jsonify({"error": "Maximum popularity must be between 0 and 100"}), 400
-            
-        genres = data.get('genres', [])
-        if not isinstance(genres, list):
-            return jsonify({"error": "Genres must be a list"}), 400
-            
-        moods = data.get('moods', [])
-        if not isinstance(moods, list):
-            return jsonify({"error": "Moods must be a list"}), 400
-    except (ValueError, TypeError):
-        return jsonify({"error": "Invalid input format for parameters"}), 400
+    params, error = parse_recommendation_params(request.json)
+    if error:
+        return None, None, None, None, (jsonify({"error": error}), 400)
     
     # Initialize services
     spotify = SpotifyService(
         spotify_creds['client_id'], 
         spotify_creds['client_secret'], 
-        spotify_tokens
+        spotify_tokens,
+        user_id=user_id,
+        on_token_refresh=lambda tokens: user_service.save_spotify_tokens(user_id, tokens)
     )
-    recommendation_service = RecommendationService(gemini_api_key)
+    recommendation_service = RecommendationService(gemini_api_key, verification_cache=verification_cache,
+                                                   result_cache=recommendation_cache, candidate_pool=shared_candidate_pool)
+    
+    # Read liked songs from the local library, syncing only what changed since the last visit
+    liked_songs = library_service.get_liked_songs(spotify, user_id, deadline=deadline)
+    if not liked_songs:
+        return None, None, None, None, (jsonify({"error": "Could not retrieve liked songs from Spotify. Please ensure your Spotify account is connected."}), 500)
+    
+    return recommendation_service, spotify, liked_songs, params, None
+
+@api_bp.route('/api/recommendations', methods=['POST'])
+def get_recommendations():
+    if prefers_async(request.headers):
+        return _queue_job('recommendations', request.json)
+    
+    # One time limit for the whole request, library sync included
+    deadline = Deadline(DEFAULT_REQUEST_DEADLINE)
+    recommendation_service, spotify, liked_songs, params, error_response = _recommendation_request(deadline)
+    if error_response:
+        return error_response
     
     # Get recommendations
     try:
-        recommendations = recommendation_service.get_recommendations(
-            spotify,
-            count=count,
-            discovery_level=discovery_level,
-            min_year=min_year,
-            max_popularity=max_popularity,
-            genres=genres,
-            moods=moods
-        )
-        return jsonify(recommendations)
+        recommendations = recommendation_service.get_recommendations(spotify, liked_songs=liked_songs, deadline=deadline, **params)
+        response = jsonify(recommendations)
+        if cut_short(deadline, len(recommendations), params['count']):
+            response.headers[PARTIAL_HEADER] = 'true'
+        return response
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return (jsonify({"error": str(e)}),) + error_status(e)
+
+@api_bp.route('/api/recommendations/stream', methods=['POST'])
+def stream_recommendations():
+    """Server-sent events: a 'track' event per verified track as soon as it is ready, then 'done' or 'error'"""
+    deadline = Deadline(DEFAULT_REQUEST_DEADLINE)
+    recommendation_service, spotify, liked_songs, params, error_response = _recommendation_request(deadline)
+    if error_response:
+        return error_response
+    
+    def events():
+        sent = 0
+        try:
+            for track in recommendation_service.iter_recommendations(spotify, liked_songs=liked_songs, deadline=deadline, **params):
+                sent += 1
+                yield sse_event('track', track)
+        except Exception as e:
+            yield sse_event('error', error_event(e, sent))
+            return
+        yield sse_event('done', {"count": sent, "requested": params['count'],
+                                 "partial": cut_short(deadline, sent, params['count'])})
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers=SSE_HEADERS)
 
 @api_bp.route('/api/create-playlist', methods=['POST'])
 def create_playlist():
     if 'user_id' not in session:
         return jsonify({"error": "Not authenticated"}), 401
     
+    if prefers_async(request.headers):
+        return _queue_job('create_playlist', request.json)
+    
     user_id = session['user_id']
     
     # Get Spotify credentials and tokens
-    spotify_creds = user_service.get_spotify_credentials(user_id)
+    spotify_creds = user_service.get_request_context(user_id).spotify_credentials
     if not spotify_creds:
         return jsonify({"error": "Spotify credentials not set"}), 400
         
-    spotify_tokens = user_service.get_spotify_tokens(user_id)
+    spotify_tokens = user_service.get_request_context(user_id).spotify_tokens
     if not spotify_tokens:
         return jsonify({"error": "Spotify authentication failed"}), 400
     
@@ -179,31 +343,18 @@ def create_playlist():
         return jsonify({"error": "Invalid request format"}), 400
         
     playlist_name = data.get('name', 'AI Generated Playlist')
-    if not isinstance(playlist_name, str):
-        return jsonify({"error": "Playlist name must be a string"}), 400
-        
-    if len(playlist_name) > 100:
-        return jsonify({"error": "Playlist name must not exceed 100 characters"}), 400
-        
     track_uris = data.get('track_uris', [])
-    if not isinstance(track_uris, list):
-        return jsonify({"error": "Track URIs must be a list"}), 400
-        
-    if not track_uris:
-        return jsonify({"error": "No tracks provided"}), 400
-        
-    if len(track_uris) > 100:
-        return jsonify({"error": "Too many tracks, maximum allowed is 100"}), 400
-        
-    for uri in track_uris:
-        if not isinstance(uri, str) or not uri.startswith('spotify:track:'):
-            return jsonify({"error": "Invalid track URI format"}), 400
+    error = validate_playlist_name(playlist_name) or validate_track_uris(track_uris)
+    if error:
+        return jsonify({"error": error}), 400
     
     # Create playlist
     spotify = SpotifyService(
         spotify_creds['client_id'], 
         spotify_creds['client_secret'], 
-        spotify_tokens
+        spotify_tokens,
+        user_id=user_id,
+        on_token_refresh=lambda tokens: user_service.save_spotify_tokens(user_id, tokens)
     )
     playlist = spotify.create_playlist(playlist_name, track_uris)
     
@@ -220,11 +371,11 @@ def get_genres():
     user_id = session['user_id']
     
     # Get Spotify credentials and tokens
-    spotify_creds = user_service.get_spotify_credentials(user_id)
+    spotify_creds = user_service.get_request_context(user_id).spotify_credentials
     if not spotify_creds:
         return jsonify({"error": "Spotify credentials not set"}), 400
         
-    spotify_tokens = user_service.get_spotify_tokens(user_id)
+    spotify_tokens = user_service.get_request_context(user_id).spotify_tokens
     if not spotify_tokens:
         return jsonify({"error": "Spotify authentication failed"}), 400
     
@@ -232,7 +383,9 @@ def get_genres():
     spotify = SpotifyService(
         spotify_creds['client_id'], 
         spotify_creds['client_secret'], 
-        spotify_tokens
+        spotify_tokens,
+        user_id=user_id,
+        on_token_refresh=lambda tokens: user_service.save_spotify_tokens(user_id, tokens)
     )
     
     # Fetch available genres
@@ -250,11 +403,11 @@ def get_user_playlists():
     user_id = session['user_id']
     
     # Get Spotify credentials and tokens
-    spotify_creds = user_service.get_spotify_credentials(user_id)
+    spotify_creds = user_service.get_request_context(user_id).spotify_credentials
     if not spotify_creds:
         return jsonify({"error": "Spotify credentials not set"}), 400
         
-    spotify_tokens = user_service.get_spotify_tokens(user_id)
+    spotify_tokens = user_service.get_request_context(user_id).spotify_tokens
     if not spotify_tokens:
         return jsonify({"error": "Spotify authentication failed"}), 400
     
@@ -262,7 +415,9 @@ def get_user_playlists():
     spotify = SpotifyService(
         spotify_creds['client_id'], 
         spotify_creds['client_secret'], 
-        spotify_tokens
+        spotify_tokens,
+        user_id=user_id,
+        on_token_refresh=lambda tokens: user_service.save_spotify_tokens(user_id, tokens)
     )
     
     # Fetch user's playlists
@@ -280,11 +435,11 @@ def add_to_playlist():
     user_id = session['user_id']
     
     # Get Spotify credentials and tokens
-    spotify_creds = user_service.get_spotify_credentials(user_id)
+    spotify_creds = user_service.get_request_context(user_id).spotify_credentials
     if not spotify_creds:
         return jsonify({"error": "Spotify credentials not set"}), 400
         
-    spotify_tokens = user_service.get_spotify_tokens(user_id)
+    spotify_tokens = user_service.get_request_context(user_id).spotify_tokens
     if not spotify_tokens:
         return jsonify({"error": "Spotify authentication failed"}), 400
     
@@ -298,24 +453,17 @@ def add_to_playlist():
         return jsonify({"error": "Playlist ID must be a string"}), 400
         
     track_uris = data.get('track_uris', [])
-    if not isinstance(track_uris, list):
-        return jsonify({"error": "Track URIs must be a list"}), 400
-        
-    if not track_uris:
-        return jsonify({"error": "No tracks provided"}), 400
-        
-    if len(track_uris) > 100:
-        return jsonify({"error": "Too many tracks, maximum allowed is 100"}), 400
-        
-    for uri in track_uris:
-        if not isinstance(uri, str) or not uri.startswith('spotify:track:'):
-            return jsonify({"error": "Invalid track URI format"}), 400
+    error = validate_track_uris(track_uris)
+    if error:
+        return jsonify({"error": error}), 400
     
     # Add tracks to playlist
     spotify = SpotifyService(
         spotify_creds['client_id'], 
         spotify_creds['client_secret'], 
-        spotify_tokens
+        spotify_tokens,
+        user_id=user_id,
+        on_token_refresh=lambda tokens: user_service.save_spotify_tokens(user_id, tokens)
     )
     result = spotify.add_tracks_to_playlist(playlist_id, track_uris)
     
@@ -329,19 +477,22 @@ def get_filter_suggestions():
     if 'user_id' not in session:
         return jsonify({"error": "Not authenticated"}), 401
     
+    if prefers_async(request.headers):
+        return _queue_job('filter_suggestions', {})
+    
     user_id = session['user_id']
     
     # Get API key
-    gemini_api_key = user_service.get_gemini_api_key(user_id)
+    gemini_api_key = user_service.get_request_context(user_id).gemini_api_key
     if not gemini_api_key:
         return jsonify({"error": "Google AI API key not set"}), 400
     
     # Get Spotify credentials and tokens
-    spotify_creds = user_service.get_spotify_credentials(user_id)
+    spotify_creds = user_service.get_request_context(user_id).spotify_credentials
     if not spotify_creds:
         return jsonify({"error": "Spotify credentials not set"}), 400
         
-    spotify_tokens = user_service.get_spotify_tokens(user_id)
+    spotify_tokens = user_service.get_request_context(user_id).spotify_tokens
     if not spotify_tokens:
         return jsonify({"error": "Spotify authentication failed"}), 400
     
@@ -349,18 +500,145 @@ def get_filter_suggestions():
     spotify = SpotifyService(
         spotify_creds['client_id'], 
         spotify_creds['client_secret'], 
-        spotify_tokens
+        spotify_tokens,
+        user_id=user_id,
+        on_token_refresh=lambda tokens: user_service.save_spotify_tokens(user_id, tokens)
     )
-    recommendation_service = RecommendationService(gemini_api_key)
+    recommendation_service = RecommendationService(gemini_api_key, verification_cache=verification_cache)
     
-    # Get user's Liked Songs
-    liked_songs = spotify.get_liked_songs(limit=50)
-    if not liked_songs or not liked_songs.get('success'):
-        return jsonify({"error": liked_songs.get('message', "Failed to fetch Liked Songs")}), 500
+    # Get user's Liked Songs from the local library
+    liked_songs = library_service.get_liked_songs(spotify, user_id, limit=50)
+    if not liked_songs:
+        return jsonify({"error": "Failed to fetch Liked Songs"}), 500
     
     # Use Gemini AI to suggest songs for extreme ends of filters
     try:
-        suggestions = recommendation_service.get_filter_extreme_suggestions(spotify, liked_songs['tracks'])
-        return jsonify(suggestions)
+        suggestions = recommendation_service.get_filter_extreme_suggestions(spotify, liked_songs)
+        return jsonify({
+            "suggestions": suggestions,
+            "partial": any(category['partial'] for category in suggestions)
+        })
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return (jsonify({"error": str(e)}),) + error_status(e)
+
+def _queue_job(kind, data):
+    """Check the signed-in user's credentials and answer with 202 and a queued job"""
+    if 'user_id' not in session:
+        return jsonify({"error": "Not authenticated"}), 401
+    
+    user_id = session['user_id']
+    context = user_service.get_request_context(user_id)
+    if kind in GEMINI_JOB_KINDS and not context.gemini_api_key:
+        return jsonify({"error": "Google AI API key not set"}), 400
+    if not context.spotify_credentials:
+        return jsonify({"error": "Spotify credentials not set"}), 400
+    if not context.spotify_tokens:
+        return jsonify({"error": "Spotify authentication failed"}), 400
+    
+    body, status, headers = submit_job(user_id, kind, data)
+    return jsonify(body), status, headers
+
+@api_bp.route('/api/jobs', methods=['POST'])
+def create_job():
+    if 'user_id' not in session:
+        return jsonify({"error": "Not authenticated"}), 401
+    
+    data = request.json
+    if not isinstance(data, dict):
+        return jsonify({"error": "Invalid request format"}), 400
+    
+    kind = data.get('kind')
+    if kind not in JOB_KINDS:
+        return jsonify({"error": "Unknown job kind"}), 400
+    
+    return _queue_job(kind, data.get('params', {}))
+
+@api_bp.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    if 'user_id' not in session:
+        return jsonify({"error": "Not authenticated"}), 401
+    
+    job = shared_job_queue.get(job_id, session['user_id'])
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    
+    return jsonify(job)
+
+@api_bp.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    if 'user_id' not in session:
+        return jsonify({"error": "Not authenticated"}), 401
+    
+    job = shared_job_queue.cancel(job_id, session['user_id'])
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    
+    return jsonify(job)
+
+# Job handlers, run on the queue's worker threads outside any request
+
+def _job_context(user_id, require_gemini=False):
+    """Return the user's stored context and a SpotifyService for a job, raising if credentials are missing"""
+    context = user_service.get_user_context(user_id)
+    if require_gemini and not context.gemini_api_key:
+        raise Exception("Google AI API key not set")
+    if not context.spotify_credentials:
+        raise Exception("Spotify credentials not set")
+    if not context.spotify_tokens:
+        raise Exception("Spotify authentication failed")
+    
+    spotify = SpotifyService(
+        context.spotify_credentials['client_id'],
+        context.spotify_credentials['client_secret'],
+        context.spotify_tokens,
+        user_id=user_id,
+        on_token_refresh=lambda tokens: user_service.save_spotify_tokens(user_id, tokens)
+    )
+    return context, spotify
+
+def run_recommendations_job(user_id, params, cancelled):
+    deadline = Deadline(DEFAULT_JOB_DEADLINE)
+    context, spotify = _job_context(user_id, require_gemini=True)
+    recommendation_service = RecommendationService(context.gemini_api_key, verification_cache=verification_cache,
+                                                   result_cache=recommendation_cache, candidate_pool=shared_candidate_pool)
+    
+    liked_songs = library_service.get_liked_songs(spotify, user_id, deadline=deadline)
+    if not liked_songs:
+        raise Exception("Could not retrieve liked songs from Spotify. Please ensure your Spotify account is connected.")
+    
+    # Iterate instead of get_recommendations so a cancelled job stops between tracks
+    recommendations = []
+    for track in recommendation_service.iter_recommendations(spotify, liked_songs=liked_songs, deadline=deadline, **params):
+        if cancelled():
+            raise JobCancelled()
+        recommendations.append(track)
+    # A job result has no headers, so flag a list cut short by the deadline in the body
+    return {
+        "tracks": recommendations,
+        "partial": cut_short(deadline, len(recommendations), params['count'])
+    }
+
+def run_filter_suggestions_job(user_id, params, cancelled):
+    context, spotify = _job_context(user_id, require_gemini=True)
+    recommendation_service = RecommendationService(context.gemini_api_key, verification_cache=verification_cache)
+    
+    liked_songs = library_service.get_liked_songs(spotify, user_id, limit=50)
+    if not liked_songs:
+        raise Exception("Failed to fetch Liked Songs")
+    
+    suggestions = recommendation_service.get_filter_extreme_suggestions(spotify, liked_songs)
+    return {
+        "suggestions": suggestions,
+        "partial": any(category['partial'] for category in suggestions)
+    }
+
+def run_create_playlist_job(user_id, params, cancelled):
+    context, spotify = _job_context(user_id)
+    playlist = spotify.create_playlist(params['name'], params['track_uris'])
+    if not playlist or not playlist.get('success'):
+        raise Exception((playlist or {}).get('message', "Failed to create playlist"))
+    return playlist
+
+shared_job_queue.register('recommendations', run_recommendations_job)
+shared_job_queue.register('filter_suggestions', run_filter_suggestions_job)
+shared_job_queue.register('create_playlist', run_create_playlist_job)
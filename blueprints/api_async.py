@@ -0,0 +1,217 @@
+from itsdangerous import BadSignature
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+from spotify_service import SpotifyService
+from async_spotify_service import AsyncSpotifyService
+from candidate_pool import shared_candidate_pool
+from recommendation_service import RecommendationService
+from blueprints.api import (user_service, library_service, verification_cache, recommendation_cache, SSE_HEADERS, sse_event,
+                            parse_recommendation_params, validate_playlist_name, validate_track_uris,
+                            prefers_async, submit_job, GEMINI_JOB_KINDS, cut_short, PARTIAL_HEADER,
+                            error_status, error_event)
+from deadline import Deadline, DEFAULT_REQUEST_DEADLINE
+from circuit_breaker import CircuitOpenError
+
+# Async versions of the slow /api routes, served by asgi.py. They await Gemini and Spotify on the event loop
+# instead of holding a worker thread, and answer exactly like their Flask counterparts in blueprints/api.py.
+
+def _flask_session(request):
+    """Read the signed Flask session cookie so both serving modes share one login"""
+    flask_app = request.app.state.flask_app
+    cookie = request.cookies.get(flask_app.config['SESSION_COOKIE_NAME'])
+    if not cookie:
+        return {}
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    try:
+        return serializer.loads(cookie, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return {}
+
+async def _json_body(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+async def _user_context(request, require_gemini=False):
+    """Return (user_id, context, None) for the signed-in user, or (None, None, error response)"""
+    user_id = _flask_session(request).get('user_id')
+    if not user_id:
+        return None, None, JSONResponse({"error": "Not authenticated"}, status_code=401)
+
+    context = await run_in_threadpool(user_service.get_user_context, user_id)
+    if require_gemini and not context.gemini_api_key:
+        return None, None, JSONResponse({"error": "Google AI API key not set"}, status_code=400)
+    if not context.spotify_credentials:
+        return None, None, JSONResponse({"error": "Spotify credentials not set"}, status_code=400)
+    if not context.spotify_tokens:
+        return None, None, JSONResponse({"error": "Spotify authentication failed"}, status_code=400)
+    return user_id, context, None
+
+def _spotify_clients(user_id, context):
+    """Async client for the request plus a sync one for LibraryService, sharing one tokens dict"""
+    creds = context.spotify_credentials
+    tokens = context.spotify_tokens
+    persist = lambda refreshed: user_service.save_spotify_tokens(user_id, refreshed)
+    return (
+        AsyncSpotifyService(creds['client_id'], creds['client_secret'], tokens, user_id=user_id, on_token_refresh=persist),
+        SpotifyService(creds['client_id'], creds['client_secret'], tokens, user_id=user_id, on_token_refresh=persist)
+    )
+
+async def _queue_job(request, kind):
+    """Answer a "Prefer: respond-async" request with 202 and a queued job"""
+    user_id, context, error_response = await _user_context(request, require_gemini=kind in GEMINI_JOB_KINDS)
+    if error_response:
+        return error_response
+
+    data = {} if request.method == 'GET' else await _json_body(request)
+    body, status, headers = await run_in_threadpool(submit_job, user_id, kind, data)
+    return JSONResponse(body, status_code=status, headers=headers)
+
+async def _recommendation_request(request, deadline):
+    """Return (recommendation_service, spotify, liked_songs, params, None), or an error response as the last item"""
+    user_id, context, error_response = await _user_context(request, require_gemini=True)
+    if error_response:
+        return None, None, None, None, error_response
+
+    params, error = parse_recommendation_params(await _json_body(request))
+    if error:
+        return None, None, None, None, JSONResponse({"error": error}, status_code=400)
+
+    spotify, sync_spotify = _spotify_clients(user_id, context)
+    recommendation_service = RecommendationService(context.gemini_api_key, verification_cache=verification_cache,
+                                                   result_cache=recommendation_cache, candidate_pool=shared_candidate_pool)
+
+    # Library syncs are usually a local read; run them off the loop in case a crawl is due
+    liked_songs = await run_in_threadpool(library_service.get_liked_songs, sync_spotify, user_id, deadline=deadline)
+    if not liked_songs:
+        return None, None, None, None, JSONResponse({"error": "Could not retrieve liked songs from Spotify. Please ensure your Spotify account is connected."}, status_code=500)
+
+    return recommendation_service, spotify, liked_songs, params, None
+
+async def get_recommendations(request):
+    if prefers_async(request.headers):
+        return await _queue_job(request, 'recommendations')
+
+    deadline = Deadline(DEFAULT_REQUEST_DEADLINE)
+    recommendation_service, spotify, liked_songs, params, error_response = await _recommendation_request(request, deadline)
+    if error_response:
+        return error_response
+
+    try:
+        recommendations = await recommendation_service.get_recommendations_async(spotify, liked_songs=liked_songs, deadline=deadline, **params)
+        headers = {PARTIAL_HEADER: 'true'} if cut_short(deadline, len(recommendations), params['count']) else None
+        return JSONResponse(recommendations, headers=headers)
+    except Exception as e:
+        status, headers = error_status(e)
+        return JSONResponse({"error": str(e)}, status_code=status, headers=headers)
+
+async def stream_recommendations(request):
+    deadline = Deadline(DEFAULT_REQUEST_DEADLINE)
+    recommendation_service, spotify, liked_songs, params, error_response = await _recommendation_request(request, deadline)
+    if error_response:
+        return error_response
+
+    async def events():
+        sent = 0
+        try:
+            async for track in recommendation_service.aiter_recommendations(spotify, liked_songs=liked_songs, deadline=deadline, **params):
+                sent += 1
+                yield sse_event('track', track)
+        except Exception as e:
+            yield sse_event('error', error_event(e, sent))
+            return
+        yield sse_event('done', {"count": sent, "requested": params['count'],
+                                 "partial": cut_short(deadline, sent, params['count'])})
+
+    return StreamingResponse(events(), media_type='text/event-stream', headers=SSE_HEADERS)
+
+async def get_filter_suggestions(request):
+    if prefers_async(request.headers):
+        return await _queue_job(request, 'filter_suggestions')
+
+    user_id, context, error_response = await _user_context(request, require_gemini=True)
+    if error_response:
+        return error_response
+
+    spotify, sync_spotify = _spotify_clients(user_id, context)
+    recommendation_service = RecommendationService(context.gemini_api_key, verification_cache=verification_cache)
+
+    liked_songs = await run_in_threadpool(library_service.get_liked_songs, sync_spotify, user_id, 50)
+    if not liked_songs:
+        return JSONResponse({"error": "Failed to fetch Liked Songs"}, status_code=500)
+
+    try:
+        suggestions = await recommendation_service.get_filter_extreme_suggestions_async(spotify, liked_songs)
+        return JSONResponse({
+            "suggestions": suggestions,
+            "partial": any(category['partial'] for category in suggestions)
+        })
+    except Exception as e:
+        status, headers = error_status(e)
+        return JSONResponse({"error": str(e)}, status_code=status, headers=headers)
+
+async def create_playlist(request):
+    if prefers_async(request.headers):
+        return await _queue_job(request, 'create_playlist')
+
+    user_id, context, error_response = await _user_context(request)
+    if error_response:
+        return error_response
+
+    data = await _json_body(request)
+    if not isinstance(data, dict):
+        return JSONResponse({"error": "Invalid request format"}, status_code=400)
+
+    playlist_name = data.get('name', 'AI Generated Playlist')
+    track_uris = data.get('track_uris', [])
+    error = validate_playlist_name(playlist_name) or validate_track_uris(track_uris)
+    if error:
+        return JSONResponse({"error": error}, status_code=400)
+
+    spotify, _ = _spotify_clients(user_id, context)
+    playlist = await spotify.create_playlist(playlist_name, track_uris)
+    if not playlist or not playlist.get('success'):
+        return JSONResponse({"error": playlist.get('message', "Failed to create playlist")}, status_code=500)
+
+    return JSONResponse(playlist)
+
+async def add_to_playlist(request):
+    user_id, context, error_response = await _user_context(request)
+    if error_response:
+        return error_response
+
+    data = await _json_body(request)
+    if not isinstance(data, dict):
+        return JSONResponse({"error": "Invalid request format"}, status_code=400)
+
+    playlist_id = data.get('playlist_id')
+    if not isinstance(playlist_id, str):
+        return JSONResponse({"error": "Playlist ID must be a string"}, status_code=400)
+
+    track_uris = data.get('track_uris', [])
+    error = validate_track_uris(track_uris)
+    if error:
+        return JSONResponse({"error": error}, status_code=400)
+
+    spotify, _ = _spotify_clients(user_id, context)
+    result = await spotify.add_tracks_to_playlist(playlist_id, track_uris)
+    if not result or not result.get('success'):
+        return JSONResponse({"error": result.get('message', "Failed to add tracks to playlist")}, status_code=500)
+
+    return JSONResponse(result)
+
+routes = [
+    Route('/api/recommendations', get_recommendations, methods=['POST']),
+    Route('/api/recommendations/stream', stream_recommendations, methods=['POST']),
+    Route('/api/filter-suggestions', get_filter_suggestions, methods=['GET']),
+    Route('/api/create-playlist', create_playlist, methods=['POST']),
+    Route('/api/add-to-playlist', add_to_playlist, methods=['POST'])
+]
+
+async def upstream_unavailable(request, exc):
+    """Same 503 as the Flask error handler for calls rejected by an open circuit outside the routes' try blocks"""
+    return JSONResponse({"error": str(exc)}, status_code=503, headers={'Retry-After': str(exc.retry_after)})
+
+exception_handlers = {CircuitOpenError: upstream_unavailable}
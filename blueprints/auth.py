@@ -1,6 +1,6 @@
 from flask import Blueprint, render_template, request, redirect, session, url_for, jsonify, flash
 import uuid
-from spotify_service import SpotifyService
+from spotify_service import SpotifyService, purge_user_tokens
 from user_service import UserService
 import os
 
@@ -36,7 +36,7 @@ def authorize_spotify():
         flash("Session expired or invalid. Please start over.", "error")
         return redirect(url_for('auth.login'))
     
-    creds = user_service.get_spotify_credentials(user_id)
+    creds = user_service.get_request_context(user_id).spotify_credentials
     if not creds:
         flash("Spotify credentials not found. Please set up your credentials first.", "error")
         return redirect(url_for('auth.login'))
@@ -63,14 +63,14 @@ def callback():
         return redirect(url_for('auth.index'))
     
     # Get Spotify credentials
-    creds = user_service.get_spotify_credentials(user_id)
+    creds = user_service.get_request_context(user_id).spotify_credentials
     if not creds:
         flash("Spotify credentials not found. Please set up your credentials.", "error")
         return redirect(url_for('auth.login'))
     
     # Exchange code for tokens
     sp = SpotifyService(creds['client_id'], creds['client_secret'])
-    code_verifier = user_service.get_code_verifier(user_id)
+    code_verifier = user_service.get_request_context(user_id).code_verifier
     if not code_verifier:
         print(f"Error: Code verifier not found in database for user {user_id}")
         flash("Authorization failed: Session data missing. Please try again.", "error")
@@ -105,7 +105,7 @@ def callback():
     
     flash("Successfully connected to Spotify!", "success")
     # Check if user has Google AI API key
-    if user_service.has_gemini_api_key(user_id):
+    if user_service.get_request_context(user_id).has_gemini_api_key:
         return redirect(url_for('auth.dashboard'))
     else:
         return redirect(url_for('auth.setup_api'))
@@ -117,7 +117,7 @@ def dashboard():
         return redirect(url_for('auth.index'))
     
     user_id = session['user_id']
-    has_api_key = user_service.has_gemini_api_key(user_id)
+    has_api_key = user_service.get_request_context(user_id).has_gemini_api_key
     
     return render_template('dashboard.html', 
                           display_name=session.get('display_name', 'User'),
@@ -142,6 +142,10 @@ def setup_spotify():
 
 @auth_bp.route('/logout')
 def logout():
+    user_id = session.get('user_id')
+    if user_id:
+        user_service.purge_user_cipher(user_id)
+        purge_user_tokens(user_id)
     session.clear()
     flash("You have been logged out.", "success")
     return redirect(url_for('auth.index'))
@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from verification_cache import normalize_track_key
+
+logger = logging.getLogger(__name__)
+
+
+class _Pool:
+    def __init__(self):
+        # normalize_track_key -> verified track, in the order Gemini ranked them
+        self.tracks = OrderedDict()
+        # Every key ever added, so a refill never hands out a track this pool already served
+        self.seen = set()
+        self.refilling = False
+        self.updated_at = time.monotonic()
+
+
+class CandidatePool:
+    """Per-user pools of already verified tracks, topped up in the background.
+
+    Requests take tracks from the pool instantly; when a pool drops below low_watermark a refill asks
+    Gemini for a batch_size batch in the background, so one Gemini call serves several requests."""
+
+    def __init__(self, low_watermark=20, batch_size=50, ttl=1800, max_pools=1000, workers=2):
+        self.low_watermark = low_watermark
+        self.batch_size = batch_size
+        self.ttl = ttl
+        self.max_pools = max_pools
+        self._pools = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='candidate-refill')
+        # Keeps async refill tasks referenced until they finish
+        self._tasks = set()
+        self._stats = {'taken': 0, 'refills': 0, 'refill_failures': 0}
+
+    def _pool(self, key, now):
+        pool = self._pools.get(key)
+        if pool is not None and not pool.refilling and now - pool.updated_at > self.ttl:
+            # Stale pools were generated from an older library snapshot; start over
+            pool = None
+        if pool is None:
+            pool = self._pools[key] = _Pool()
+            while len(self._pools) > self.max_pools:
+                self._pools.popitem(last=False)
+        self._pools.move_to_end(key)
+        return pool
+
+    def take(self, key, count, accept=None):
+        """Remove and return up to count tracks, in ranking order, for which accept(track) is true"""
+        with self._lock:
+            pool = self._pool(key, time.monotonic())
+            taken = []
+            for track_key, track in list(pool.tracks.items()):
+                if len(taken) >= count:
+                    break
+                if accept is None or accept(track):
+                    taken.append(pool.tracks.pop(track_key))
+            self._stats['taken'] += len(taken)
+            return taken
+
+    def add(self, key, tracks):
+        """Add verified tracks the pool has not held before; returns how many were added"""
+        added = 0
+        with self._lock:
+            pool = self._pool(key, time.monotonic())
+            for track in tracks:
+                track_key = normalize_track_key(track.get('title'), track.get('artist'))
+                if track_key in pool.seen:
+                    continue
+                pool.seen.add(track_key)
+                pool.tracks[track_key] = track
+                added += 1
+            pool.updated_at = time.monotonic()
+        return added
+
+    def mark_seen(self, key, tracks):
+        """Record tracks served outside the pool so refills don't offer them again"""
+        with self._lock:
+            pool = self._pool(key, time.monotonic())
+            pool.seen.update(normalize_track_key(track.get('title'), track.get('artist')) for track in tracks)
+
+    def size(self, key):
+        with self._lock:
+            pool = self._pools.get(key)
+            return len(pool.tracks) if pool is not None else 0
+
+    def refill(self, key, fill):
+        """Run fill() on a background thread if the pool is low and not already refilling; fill returns tracks"""
+        if not self._claim_refill(key):
+            return False
+
+        def run():
+            tracks = []
+            try:
+                tracks = fill()
+            except Exception as e:
+                logger.error(f"Candidate pool refill failed: {e}")
+            finally:
+                self._finish_refill(key, tracks)
+
+        self._executor.submit(run)
+        return True
+
+    def refill_async(self, key, fill):
+        """Like refill, but fill is a coroutine function run as a task on the current event loop"""
+        if not self._claim_refill(key):
+            return False
+
+        async def run():
+            tracks = []
+            try:
+                tracks = await fill()
+            except Exception as e:
+                logger.error(f"Candidate pool refill failed: {e}")
+            finally:
+                self._finish_refill(key, tracks)
+
+        task = asyncio.ensure_future(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    def _claim_refill(self, key):
+        with self._lock:
+            pool = self._pool(key, time.monotonic())
+            if pool.refilling or len(pool.tracks) >= self.low_watermark:
+                return False
+            pool.refilling = True
+            return True
+
+    def _finish_refill(self, key, tracks):
+        added = self.add(key, tracks or [])
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is not None:
+                pool.refilling = False
+            self._stats['refills'] += 1
+            if not added:
+                self._stats['refill_failures'] += 1
+
+    def stats(self):
+        """Counters for monitoring: tracks taken, refills run and refills that added nothing"""
+        with self._lock:
+            return dict(self._stats, pools=len(self._pools))
+
+
+def _build_shared_pool():
+    # Refills spend the user's Gemini quota ahead of demand, so operators can switch them off
+    if os.environ.get('CANDIDATE_POOL', '1').lower() not in ('1', 'true', 'yes'):
+        return None
+    return CandidatePool(
+        low_watermark=int(os.environ.get('CANDIDATE_POOL_LOW_WATERMARK', 20)),
+        batch_size=int(os.environ.get('CANDIDATE_POOL_BATCH_SIZE', 50)),
+        ttl=float(os.environ.get('CANDIDATE_POOL_TTL', 1800)),
+        workers=int(os.environ.get('CANDIDATE_POOL_WORKERS', 2))
+    )
+
+
+# Process-wide pool, or None when disabled; each worker process keeps its own pools
+shared_candidate_pool = _build_shared_pool()
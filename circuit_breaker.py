@@ -0,0 +1,196 @@
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open; retry_after is in whole seconds"""
+
+    def __init__(self, name, retry_after):
+        self.name = name
+        self.retry_after = retry_after
+        upstream = name.split(':')[0].capitalize()
+        super().__init__(f"{upstream} is not responding right now. Please try again in {retry_after} seconds.")
+
+
+class _Call:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.latency = None
+        # Set by the caller when the upstream answered with an error, e.g. a 5xx status
+        self.failed = False
+
+    def responded(self):
+        """Mark the first response, so a streamed call is timed to its first chunk rather than its end"""
+        if self.latency is None:
+            self.latency = time.monotonic() - self.started
+
+    def duration(self):
+        return self.latency if self.latency is not None else time.monotonic() - self.started
+
+
+class CircuitBreaker:
+    """Fails calls to one upstream fast while it is erroring or slow, instead of letting each wait out its timeout.
+
+    Over the last window calls, once min_calls have been seen, the circuit opens when failure_rate of them
+    failed or slow_rate of them took slow_call_duration seconds or more. After reset_timeout seconds it lets
+    half_open_probes calls through; a healthy probe closes it again and a failed or slow one reopens it."""
+
+    def __init__(self, name, window=20, min_calls=10, failure_rate=0.5, slow_rate=0.8, slow_call_duration=5.0,
+                 reset_timeout=30.0, half_open_probes=1):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_rate = slow_rate
+        self.slow_call_duration = slow_call_duration
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        # (failed, slow) for the most recent calls
+        self._outcomes = deque(maxlen=window)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'failures': 0, 'slow_calls': 0, 'rejected': 0, 'opened': 0}
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def _current_state(self, now):
+        if self._state == OPEN and now - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    def _reject(self, state, now):
+        self._stats['rejected'] += 1
+        wait = self.reset_timeout - (now - self._opened_at) if state == OPEN else 1
+        raise CircuitOpenError(self.name, max(1, math.ceil(wait)))
+
+    def check(self):
+        """Raise CircuitOpenError if a call would be rejected now, e.g. before queueing for a rate limit"""
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            if state == OPEN or (state == HALF_OPEN and self._probes >= self.half_open_probes):
+                self._reject(state, now)
+
+    def before_call(self):
+        """Admit a call or raise CircuitOpenError; an admitted call must be reported with record()"""
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            if state == CLOSED:
+                return
+            if state == HALF_OPEN and self._probes < self.half_open_probes:
+                self._probes += 1
+                return
+            self._reject(state, now)
+
+    def record(self, failed, duration):
+        with self._lock:
+            now = time.monotonic()
+            slow = duration >= self.slow_call_duration
+            self._stats['calls'] += 1
+            self._stats['failures'] += int(failed)
+            self._stats['slow_calls'] += int(slow)
+            state = self._current_state(now)
+            if state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+                if failed or slow:
+                    self._open(now)
+                else:
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                return
+            if state == OPEN:
+                # Started before the circuit opened; the window was already judged
+                return
+            self._outcomes.append((failed, slow))
+            if len(self._outcomes) < self.min_calls:
+                return
+            calls = len(self._outcomes)
+            failures = sum(1 for failed, _ in self._outcomes if failed)
+            slow_calls = sum(1 for _, slow in self._outcomes if slow)
+            if failures / calls >= self.failure_rate or slow_calls / calls >= self.slow_rate:
+                self._open(now)
+
+    def _open(self, now):
+        self._state = OPEN
+        self._opened_at = now
+        self._outcomes.clear()
+        self._stats['opened'] += 1
+        logger.warning(f"Circuit {self.name} opened, failing calls fast for {self.reset_timeout}s")
+
+    @contextmanager
+    def attempt(self, is_failure=None):
+        """Run one call inside the breaker.
+
+        Exceptions for which is_failure(exc) is true (every exception by default) count as failures; the
+        caller sets call.failed for error responses and may call call.responded() on a streamed call's
+        first chunk. Raises CircuitOpenError without running the block while the circuit is open."""
+        self.before_call()
+        call = _Call()
+        try:
+            yield call
+        except Exception as e:
+            self.record(is_failure is None or is_failure(e), call.duration())
+            raise
+        except BaseException:
+            # A generator closed early by its consumer; the upstream did nothing wrong
+            self.record(call.failed, call.duration())
+            raise
+        else:
+            self.record(call.failed, call.duration())
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, state=self._current_state(time.monotonic()))
+
+
+class CircuitBreakerRegistry:
+    """Named breakers created on first use, one per upstream endpoint family"""
+
+    def __init__(self, **defaults):
+        self.defaults = defaults
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, name, **overrides):
+        """Return the breaker called name; overrides only apply when it is first created"""
+        with self._lock:
+            breaker = self._breakers.get(name)
+            if breaker is None:
+                breaker = self._breakers[name] = CircuitBreaker(name, **dict(self.defaults, **overrides))
+            return breaker
+
+    def stats(self):
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {breaker.name: breaker.stats() for breaker in breakers}
+
+
+def _build_shared_registry():
+    return CircuitBreakerRegistry(
+        window=int(os.environ.get('CIRCUIT_WINDOW', 20)),
+        min_calls=int(os.environ.get('CIRCUIT_MIN_CALLS', 10)),
+        failure_rate=float(os.environ.get('CIRCUIT_FAILURE_RATE', 0.5)),
+        slow_rate=float(os.environ.get('CIRCUIT_SLOW_CALL_RATE', 0.8)),
+        reset_timeout=float(os.environ.get('CIRCUIT_RESET_TIMEOUT', 30))
+    )
+
+
+# Process-wide breakers shared by every SpotifyService and RecommendationService
+shared_circuit_breakers = _build_shared_registry()
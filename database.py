@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, String, Text, Index
+from sqlalchemy import create_engine, Column, String, Text, Index, Float, Integer
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -24,11 +24,94 @@ class User(Base):
     gemini_api_key = Column(Text)
     encryption_key = Column(Text)
     code_verifier = Column(Text)
+    # Epoch seconds when the stored access token expires; not secret, so kept unencrypted
+    spotify_token_expires_at = Column(Float)
     
     __table_args__ = (
         Index('idx_user_id', 'id'),
     )
 
+# Shared second-tier cache for Spotify API responses, visible to every worker process
+class SpotifyCacheEntry(Base):
+    __tablename__ = 'spotify_cache'
+    
+    namespace = Column(String, primary_key=True)
+    cache_key = Column(Text, primary_key=True)
+    payload = Column(Text, nullable=False)
+    stored_at = Column(Float, nullable=False)
+    expires_at = Column(Float, nullable=False)
+    
+    __table_args__ = (
+        Index('idx_spotify_cache_stored_at', 'stored_at'),
+    )
+
+# Log of cache invalidations so other workers can drop stale entries from their in-memory tier
+class SpotifyCacheInvalidation(Base):
+    __tablename__ = 'spotify_cache_invalidations'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    namespace = Column(String, nullable=False)
+    endpoint = Column(Text)
+    created_at = Column(Float, nullable=False)
+
+# Local copy of each user's Liked Songs, kept current by incremental syncs
+class LikedTrack(Base):
+    __tablename__ = 'liked_tracks'
+    
+    user_id = Column(String, primary_key=True)
+    uri = Column(String, primary_key=True)
+    name = Column(Text)
+    artist = Column(Text)
+    album = Column(Text)
+    release_date = Column(String)
+    popularity = Column(Integer)
+    added_at = Column(String, nullable=False)
+    
+    __table_args__ = (
+        Index('idx_liked_tracks_user_added_at', 'user_id', 'added_at'),
+    )
+
+# Per-user sync watermark for the Liked Songs library
+class LibrarySyncState(Base):
+    __tablename__ = 'library_sync_state'
+    
+    user_id = Column(String, primary_key=True)
+    watermark = Column(String)
+    total = Column(Integer)
+    synced_at = Column(Float)
+    # Offset a full crawl cut short by its deadline resumes from; NULL when no crawl is in progress
+    crawl_offset = Column(Integer)
+
+# Spotify search results for normalised (title, artist) pairs, shared by all users
+class TrackLookup(Base):
+    __tablename__ = 'track_lookups'
+    
+    lookup_key = Column(Text, primary_key=True)
+    track = Column(Text)
+    expires_at = Column(Float, nullable=False)
+
+# Background jobs run by job_queue.JobQueue; persisted so results survive the request that started them
+class Job(Base):
+    __tablename__ = 'jobs'
+    
+    id = Column(String, primary_key=True)
+    user_id = Column(String, nullable=False)
+    kind = Column(String, nullable=False)
+    params = Column(Text)
+    status = Column(String, nullable=False)
+    result = Column(Text)
+    error = Column(Text)
+    cancel_requested = Column(Integer, nullable=False, default=0)
+    created_at = Column(Float, nullable=False)
+    started_at = Column(Float)
+    finished_at = Column(Float)
+    heartbeat_at = Column(Float)
+    
+    __table_args__ = (
+        Index('idx_jobs_status_created_at', 'status', 'created_at'),
+        Index('idx_jobs_user_id', 'user_id'),
+    )
+
 def get_engine():
     """Return the SQLAlchemy engine"""
     return engine
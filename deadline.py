@@ -0,0 +1,34 @@
+import os
+import time
+
+# Overall time limit for one recommendations request, from the route to the last Spotify search
+DEFAULT_REQUEST_DEADLINE = float(os.environ.get('RECOMMENDATION_DEADLINE', 30))
+# Background jobs have no HTTP timeout to fit in, so they get a longer limit
+DEFAULT_JOB_DEADLINE = float(os.environ.get('JOB_DEADLINE', 300))
+# Candidate pool refills run with nobody waiting, but must not hold a worker or search slots indefinitely
+DEFAULT_REFILL_DEADLINE = float(os.environ.get('CANDIDATE_POOL_REFILL_DEADLINE', 60))
+
+
+class Deadline:
+    """A point in time a request must finish by, passed down so every sub-call waits only for what is left"""
+
+    def __init__(self, seconds):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return time.monotonic() >= self.expires_at
+
+
+def remaining(deadline, cap=None):
+    """Timeout for a sub-call: what is left of deadline, at most cap; just cap when there is no deadline"""
+    if deadline is None:
+        return cap
+    left = deadline.remaining()
+    return left if cap is None else min(cap, left)
+
+
+def expired(deadline):
+    return deadline is not None and deadline.expired()
@@ -0,0 +1,158 @@
+import asyncio
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+import google.ai.generativelanguage as glm
+import google.generativeai as genai
+from google.api_core import gapic_v1
+from google.generativeai.client import USER_AGENT
+from google.generativeai.types import generation_types
+from google.generativeai.version import __version__ as GENAI_VERSION
+
+
+class _KeyClients:
+    """The gRPC clients for one API key: a sync client shared by all threads and an async client per event loop"""
+
+    def __init__(self, api_key):
+        self.api_key = api_key
+        self.last_used = time.monotonic()
+        self.models = {}
+        self._client = None
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _client_kwargs(self):
+        return {
+            'client_options': {'api_key': self.api_key},
+            'client_info': gapic_v1.client_info.ClientInfo(user_agent=f"{USER_AGENT}/{GENAI_VERSION}")
+        }
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = glm.GenerativeServiceClient(**self._client_kwargs())
+            return self._client
+
+    @property
+    def async_client(self):
+        # grpc.aio channels are bound to the loop they were created on
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._async_clients.get(loop)
+            if client is None:
+                client = self._async_clients[loop] = glm.GenerativeServiceAsyncClient(**self._client_kwargs())
+            return client
+
+
+class PooledGenerativeModel(genai.GenerativeModel):
+    """GenerativeModel that always talks through its own key's clients instead of the global genai.configure ones"""
+
+    def __init__(self, model_name, clients):
+        self._clients = clients
+        super().__init__(model_name)
+
+    @property
+    def _client(self):
+        return self._clients.client
+
+    @_client.setter
+    def _client(self, value):
+        # GenerativeModel.__init__ resets the clients to None; ours come from the pool
+        pass
+
+    @property
+    def _async_client(self):
+        return self._clients.async_client
+
+    @_async_client.setter
+    def _async_client(self, value):
+        pass
+
+    # request_options={'timeout': seconds} bounds the whole call, streamed or not, like later
+    # google-generativeai releases allow; other arguments behave as in GenerativeModel
+
+    def generate_content(self, contents, *, generation_config=None, safety_settings=None, stream=False,
+                         request_options=None, **kwargs):
+        if not request_options:
+            return super().generate_content(contents, generation_config=generation_config,
+                                            safety_settings=safety_settings, stream=stream, **kwargs)
+        request = self._prepare_request(contents=contents, generation_config=generation_config,
+                                        safety_settings=safety_settings, **kwargs)
+        if stream:
+            with generation_types.rewrite_stream_error():
+                iterator = self._client.stream_generate_content(request, **request_options)
+            return generation_types.GenerateContentResponse.from_iterator(iterator)
+        response = self._client.generate_content(request, **request_options)
+        return generation_types.GenerateContentResponse.from_response(response)
+
+    async def generate_content_async(self, contents, *, generation_config=None, safety_settings=None, stream=False,
+                                     request_options=None, **kwargs):
+        if not request_options:
+            return await super().generate_content_async(contents, generation_config=generation_config,
+                                                        safety_settings=safety_settings, stream=stream, **kwargs)
+        request = self._prepare_request(contents=contents, generation_config=generation_config,
+                                        safety_settings=safety_settings, **kwargs)
+        if stream:
+            with generation_types.rewrite_stream_error():
+                iterator = await self._async_client.stream_generate_content(request, **request_options)
+            return await generation_types.AsyncGenerateContentResponse.from_aiterator(iterator)
+        response = await self._async_client.generate_content(request, **request_options)
+        return generation_types.AsyncGenerateContentResponse.from_response(response)
+
+
+class GeminiModelPool:
+    """Per-API-key Gemini models reused across requests, evicting keys left idle for idle_ttl seconds.
+
+    genai.configure sets one key for the whole process, so concurrent users with different keys could
+    end up calling Gemini with each other's key. Each pooled model is bound to its key's own clients."""
+
+    def __init__(self, max_keys=500, idle_ttl=900):
+        self.max_keys = max_keys
+        self.idle_ttl = idle_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def model(self, api_key, model_name):
+        """Return the shared model for api_key, creating its clients on first use"""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._entries.get(api_key)
+            if entry is None:
+                entry = self._entries[api_key] = _KeyClients(api_key)
+                while len(self._entries) > self.max_keys:
+                    self._entries.popitem(last=False)
+            self._entries.move_to_end(api_key)
+            entry.last_used = now
+            model = entry.models.get(model_name)
+            if model is None:
+                model = entry.models[model_name] = PooledGenerativeModel(model_name, entry)
+            return model
+
+    def discard(self, api_key):
+        """Forget a key, e.g. one that failed validation, so it does not hold clients until it idles out"""
+        with self._lock:
+            self._entries.pop(api_key, None)
+
+    def _evict_idle(self, now):
+        # Least recently used first, so stop at the first key still in use; in-flight requests keep their
+        # own reference and the channels close once the last one finishes
+        while self._entries:
+            api_key, entry = next(iter(self._entries.items()))
+            if now - entry.last_used < self.idle_ttl:
+                break
+            del self._entries[api_key]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+# Process-wide pool shared by every RecommendationService
+shared_gemini_pool = GeminiModelPool(
+    max_keys=int(os.environ.get('GEMINI_CLIENT_POOL_SIZE', 500)),
+    idle_ttl=float(os.environ.get('GEMINI_CLIENT_IDLE_TTL', 900))
+)
@@ -0,0 +1,123 @@
+import asyncio
+import os
+import threading
+import weakref
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+from urllib3.util.timeout import Timeout
+
+SPOTIFY_API_ORIGIN = 'https://api.spotify.com'
+SPOTIFY_ACCOUNTS_ORIGIN = 'https://accounts.spotify.com'
+
+# Retried on idempotent methods only; POSTs such as playlist creation must not be replayed
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+RETRY_METHODS = frozenset(['GET', 'PUT', 'DELETE', 'HEAD', 'OPTIONS'])
+
+# Longest a call without a timeout of its own waits for a free pooled connection
+DEFAULT_POOL_TIMEOUT = float(os.environ.get('SPOTIFY_HTTP_POOL_TIMEOUT', 10))
+
+_sessions = {}
+_session_lock = threading.Lock()
+# httpx clients are bound to the event loop they were created on, so there are a pair per running loop
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _pool_wait(timeout):
+    """Seconds to wait for a pooled connection: the call's connect timeout, or DEFAULT_POOL_TIMEOUT without one"""
+    connect = timeout.connect_timeout if isinstance(timeout, Timeout) else timeout
+    return connect if isinstance(connect, (int, float)) else DEFAULT_POOL_TIMEOUT
+
+
+class _BoundedWaitMixin:
+    # requests never passes pool_timeout, so a blocking pool would otherwise wait for a connection forever
+    def urlopen(self, method, url, *args, pool_timeout=None, **kwargs):
+        if pool_timeout is None:
+            pool_timeout = _pool_wait(kwargs.get('timeout'))
+        return super().urlopen(method, url, *args, pool_timeout=pool_timeout, **kwargs)
+
+
+class _BoundedWaitHTTPConnectionPool(_BoundedWaitMixin, HTTPConnectionPool):
+    pass
+
+
+class _BoundedWaitHTTPSConnectionPool(_BoundedWaitMixin, HTTPSConnectionPool):
+    pass
+
+
+class _BoundedWaitAdapter(HTTPAdapter):
+    """HTTPAdapter whose pools wait for a free connection no longer than the call's own timeout"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _BoundedWaitHTTPConnectionPool,
+            'https': _BoundedWaitHTTPSConnectionPool
+        }
+
+
+def _build_retry(retries=True):
+    if not retries:
+        # Calls bounded by a deadline retry in SpotifyService, where each attempt gets only what is left
+        return Retry(total=0, connect=0, read=0, status=0, redirect=0, raise_on_status=False)
+    retries = int(os.environ.get('SPOTIFY_HTTP_MAX_RETRIES', 3))
+    return Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=float(os.environ.get('SPOTIFY_HTTP_BACKOFF', 0.3)),
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=RETRY_METHODS,
+        # Hand the final response back so callers can inspect the status code as before
+        raise_on_status=False
+    )
+
+
+def _build_adapter(pool_size, retries=True):
+    # pool_block caps concurrent connections to the host instead of opening throwaway extras
+    return _BoundedWaitAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=_build_retry(retries), pool_block=True)
+
+
+def build_http_session(retries=True):
+    """Create a keep-alive session with per-host connection pools and, unless retries is False, retry-with-backoff.
+
+    Transport retries each get the call's full timeout, so calls bounded by a deadline use a session without them."""
+    session = requests.Session()
+    session.mount(SPOTIFY_API_ORIGIN, _build_adapter(int(os.environ.get('SPOTIFY_HTTP_POOL_SIZE', 10)), retries))
+    session.mount(SPOTIFY_ACCOUNTS_ORIGIN, _build_adapter(int(os.environ.get('SPOTIFY_HTTP_ACCOUNTS_POOL_SIZE', 4)), retries))
+    return session
+
+
+def get_http_session(retries=True):
+    """Return the process-wide session used for Spotify traffic, with or without transport retries"""
+    session = _sessions.get(retries)
+    if session is None:
+        with _session_lock:
+            session = _sessions.get(retries)
+            if session is None:
+                session = _sessions[retries] = build_http_session(retries)
+    return session
+
+
+def build_async_http_client(retries=True):
+    """Create an httpx client whose pool is sized for many concurrent calls on one event loop; retries=False
+    drops the transport's connection retries for calls bounded by a deadline"""
+    limits = httpx.Limits(
+        max_connections=int(os.environ.get('SPOTIFY_ASYNC_POOL_SIZE', 100)),
+        max_keepalive_connections=int(os.environ.get('SPOTIFY_ASYNC_KEEPALIVE', 20))
+    )
+    # httpx transport retries cover connection failures; 5xx responses are retried by AsyncSpotifyService
+    transport = httpx.AsyncHTTPTransport(limits=limits, retries=int(os.environ.get('SPOTIFY_HTTP_MAX_RETRIES', 3)) if retries else 0)
+    return httpx.AsyncClient(transport=transport, timeout=10)
+
+
+def get_async_http_client(retries=True):
+    """Return the shared async client for the running event loop, with or without transport retries"""
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get(retries)
+    if client is None:
+        client = clients[retries] = build_async_http_client(retries)
+    return client
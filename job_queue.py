@@ -0,0 +1,294 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from sqlalchemy.sql import text
+from database import get_session
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+
+class JobCancelled(Exception):
+    """Raised by a job handler that noticed its job was cancelled"""
+
+
+class JobQueue:
+    """Runs long operations on in-process worker threads, persisting every job in the SQLite jobs table.
+
+    Workers claim the oldest queued job from the user with the fewest running jobs, never running more
+    than max_per_user at once for one user, so a batch of submissions can't hold every worker. Finished
+    jobs and their results are kept for retention seconds so clients can poll for them."""
+
+    def __init__(self, workers=4, max_per_user=1, retention=86400, poll_interval=1.0,
+                 heartbeat_interval=10.0, stale_after=60.0):
+        self.workers = workers
+        self.max_per_user = max_per_user
+        self.retention = retention
+        # Idle workers re-check the table this often, picking up jobs submitted by other processes
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        # A running job whose heartbeat is older than this belonged to a process that died
+        self.stale_after = stale_after
+        self.handlers = {}
+        self._cond = threading.Condition()
+        self._claim_lock = threading.Lock()
+        self._running = set()
+        self._started = False
+        self._workers = []
+        # Set by stop(); each start() gets a fresh one so its threads can be told to exit
+        self._stopping = threading.Event()
+        self._last_prune = 0.0
+
+    def register(self, kind, handler):
+        """Register handler(user_id, params, cancelled) for a job kind.
+
+        The handler returns a JSON-serialisable result; cancelled() turns true once the job is cancelled
+        and long handlers should check it between steps, raising JobCancelled or returning early."""
+        self.handlers[kind] = handler
+
+    def submit(self, user_id, kind, params=None):
+        """Queue a job and return its id"""
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = uuid.uuid4().hex
+        session = get_session()
+        try:
+            session.execute(text('''
+                INSERT INTO jobs (id, user_id, kind, params, status, cancel_requested, created_at)
+                VALUES (:id, :user_id, :kind, :params, :status, 0, :now)
+            '''), {'id': job_id, 'user_id': user_id, 'kind': kind, 'params': json.dumps(params or {}),
+                   'status': QUEUED, 'now': time.time()})
+            session.commit()
+        finally:
+            session.close()
+        self.start()
+        with self._cond:
+            self._cond.notify()
+        return job_id
+
+    def get(self, job_id, user_id=None):
+        """Return the job as a dict, or None if it doesn't exist or belongs to another user"""
+        session = get_session()
+        try:
+            row = session.execute(text('SELECT * FROM jobs WHERE id = :id'), {'id': job_id}).fetchone()
+        finally:
+            session.close()
+        if row is None or (user_id is not None and row.user_id != user_id):
+            return None
+        return {
+            'id': row.id,
+            'kind': row.kind,
+            'status': row.status,
+            'result': json.loads(row.result) if row.result else None,
+            'error': row.error,
+            'cancel_requested': bool(row.cancel_requested),
+            'created_at': row.created_at,
+            'started_at': row.started_at,
+            'finished_at': row.finished_at
+        }
+
+    def cancel(self, job_id, user_id=None):
+        """Cancel a queued job at once or ask a running one to stop; returns the job, or None if not found"""
+        job = self.get(job_id, user_id)
+        if job is None:
+            return None
+        session = get_session()
+        try:
+            session.execute(text('''
+                UPDATE jobs SET status = :cancelled, finished_at = :now, cancel_requested = 1
+                WHERE id = :id AND status = :queued
+            '''), {'id': job_id, 'cancelled': CANCELLED, 'queued': QUEUED, 'now': time.time()})
+            session.execute(text('UPDATE jobs SET cancel_requested = 1 WHERE id = :id AND status = :running'),
+                            {'id': job_id, 'running': RUNNING})
+            session.commit()
+        finally:
+            session.close()
+        return self.get(job_id, user_id)
+
+    def stats(self):
+        """Job counts by status"""
+        session = get_session()
+        try:
+            rows = session.execute(text('SELECT status, COUNT(*) AS jobs FROM jobs GROUP BY status')).fetchall()
+            return {row.status: row.jobs for row in rows}
+        finally:
+            session.close()
+
+    def start(self):
+        """Start the worker and heartbeat threads if they are not running yet.
+
+        The app calls this at startup so jobs left queued by a previous process are claimed, and jobs left
+        running by a dead one are failed, without waiting for a new submission. Importing the module
+        (tests, migrations) never spawns threads; with workers=0 this process only submits, leaving the
+        jobs to other processes sharing the database."""
+        with self._cond:
+            if self._started or not self.workers:
+                return
+            self._started = True
+            stopping = self._stopping = threading.Event()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, args=(stopping,), name=f'job-worker-{i}', daemon=True)
+            self._workers.append(thread)
+            thread.start()
+        threading.Thread(target=self._heartbeat, args=(stopping,), name='job-heartbeat', daemon=True).start()
+
+    def stop(self, timeout=0):
+        """Tell the worker threads to exit once their current job finishes, waiting up to timeout seconds each"""
+        with self._cond:
+            self._started = False
+            self._stopping.set()
+            self._cond.notify_all()
+            workers, self._workers = self._workers, []
+        for thread in workers:
+            thread.join(timeout)
+
+    def _work(self, stopping):
+        while not stopping.is_set():
+            try:
+                job = self._claim_next()
+                if job is not None:
+                    self._run(job)
+                    continue
+                self._prune()
+            except Exception as e:
+                logger.error(f"Job worker error: {e}")
+            with self._cond:
+                self._cond.wait(self.poll_interval)
+
+    def _claim_next(self):
+        """Mark the fairest queued job as running and return its row, or None if there is nothing to run"""
+        now = time.time()
+        with self._claim_lock:
+            session = get_session()
+            try:
+                # Jobs whose worker stopped sending heartbeats will never finish
+                session.execute(text('''
+                    UPDATE jobs SET status = :failed, error = 'Job was interrupted before it finished', finished_at = :now
+                    WHERE status = :running AND COALESCE(heartbeat_at, started_at) < :stale
+                '''), {'failed': FAILED, 'running': RUNNING, 'now': now, 'stale': now - self.stale_after})
+                session.commit()
+                running = {row.user_id: row.jobs for row in session.execute(text(
+                    'SELECT user_id, COUNT(*) AS jobs FROM jobs WHERE status = :running GROUP BY user_id'
+                ), {'running': RUNNING}).fetchall()}
+                queued = session.execute(text('''
+                    SELECT id, user_id FROM jobs WHERE status = :queued ORDER BY created_at LIMIT 200
+                '''), {'queued': QUEUED}).fetchall()
+                candidates = [row for row in queued if running.get(row.user_id, 0) < self.max_per_user]
+                # sorted is stable, so users with equally few running jobs are served oldest job first
+                for row in sorted(candidates, key=lambda row: running.get(row.user_id, 0)):
+                    claimed = session.execute(text('''
+                        UPDATE jobs SET status = :running, started_at = :now, heartbeat_at = :now
+                        WHERE id = :id AND status = :queued
+                    '''), {'id': row.id, 'running': RUNNING, 'queued': QUEUED, 'now': now}).rowcount
+                    session.commit()
+                    if claimed:
+                        self._running.add(row.id)
+                        return session.execute(text('SELECT * FROM jobs WHERE id = :id'), {'id': row.id}).fetchone()
+                return None
+            finally:
+                session.close()
+
+    def _run(self, job):
+        checker = self._cancel_checker(job.id)
+        try:
+            handler = self.handlers.get(job.kind)
+            if handler is None:
+                raise ValueError(f"No handler registered for job kind {job.kind}")
+            result = handler(job.user_id, json.loads(job.params or '{}'), checker)
+            if self._cancel_requested(job.id):
+                status, result, error = CANCELLED, None, None
+            else:
+                status, error = SUCCEEDED, None
+        except JobCancelled:
+            status, result, error = CANCELLED, None, None
+        except Exception as e:
+            logger.error(f"Job {job.id} ({job.kind}) failed: {e}")
+            status, result, error = FAILED, None, str(e)
+        finally:
+            self._running.discard(job.id)
+
+        session = get_session()
+        try:
+            session.execute(text('''
+                UPDATE jobs SET status = :status, result = :result, error = :error, finished_at = :now
+                WHERE id = :id
+            '''), {'id': job.id, 'status': status, 'error': error, 'now': time.time(),
+                   'result': json.dumps(result) if result is not None else None})
+            session.commit()
+        finally:
+            session.close()
+
+    def _cancel_checker(self, job_id):
+        """cancelled() for a handler; reads the table at most once per poll interval"""
+        state = {'checked_at': 0.0, 'cancelled': False}
+
+        def cancelled():
+            now = time.monotonic()
+            if not state['cancelled'] and now - state['checked_at'] >= self.poll_interval:
+                state['checked_at'] = now
+                state['cancelled'] = self._cancel_requested(job_id)
+            return state['cancelled']
+        return cancelled
+
+    def _cancel_requested(self, job_id):
+        session = get_session()
+        try:
+            return bool(session.execute(text('SELECT cancel_requested FROM jobs WHERE id = :id'),
+                                        {'id': job_id}).scalar())
+        finally:
+            session.close()
+
+    def _heartbeat(self, stopping):
+        while True:
+            time.sleep(self.heartbeat_interval)
+            # Keep beating after stop() until the jobs still running have finished
+            if stopping.is_set() and not self._running:
+                return
+            job_ids = list(self._running)
+            if not job_ids:
+                continue
+            session = get_session()
+            try:
+                for job_id in job_ids:
+                    session.execute(text('UPDATE jobs SET heartbeat_at = :now WHERE id = :id'),
+                                    {'id': job_id, 'now': time.time()})
+                session.commit()
+            except Exception as e:
+                logger.error(f"Job heartbeat failed: {e}")
+            finally:
+                session.close()
+
+    def _prune(self):
+        """Delete finished jobs older than the retention period, at most once a minute"""
+        now = time.time()
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        session = get_session()
+        try:
+            session.execute(text('''
+                DELETE FROM jobs WHERE status IN (:succeeded, :failed, :cancelled) AND finished_at < :cutoff
+            '''), {'succeeded': SUCCEEDED, 'failed': FAILED, 'cancelled': CANCELLED, 'cutoff': now - self.retention})
+            session.commit()
+        finally:
+            session.close()
+
+
+def _build_shared_queue():
+    return JobQueue(
+        workers=int(os.environ.get('JOB_WORKERS', 4)),
+        max_per_user=int(os.environ.get('JOB_MAX_PER_USER', 1)),
+        retention=int(os.environ.get('JOB_RESULT_RETENTION', 86400))
+    )
+
+
+# Process-wide queue; handlers are registered by blueprints/api.py
+shared_job_queue = _build_shared_queue()
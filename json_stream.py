@@ -0,0 +1,71 @@
+import json
+
+
+class JSONArrayStreamParser:
+    """Incrementally parse a streamed JSON array of objects, emitting each object as soon as it closes.
+
+    Text before the opening '[' (such as a ```json fence) is skipped, and objects that fail to decode
+    are dropped rather than aborting the stream."""
+
+    def __init__(self):
+        self._buffer = ''
+        self._pos = 0
+        self._in_array = False
+        self._finished = False
+        self._depth = 0
+        self._object_start = None
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, text):
+        """Consume the next chunk of text and return the objects completed by it"""
+        self._buffer += text
+        objects = []
+        buffer = self._buffer
+        while self._pos < len(buffer) and not self._finished:
+            char = buffer[self._pos]
+            if not self._in_array:
+                if char == '[':
+                    self._in_array = True
+            elif self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                if self._depth == 0 and char == '{':
+                    self._object_start = self._pos
+                self._depth += 1
+            elif char in '}]':
+                if self._depth == 0:
+                    # The closing ']' of the top-level array
+                    self._finished = True
+                else:
+                    self._depth -= 1
+                    if self._depth == 0 and self._object_start is not None:
+                        try:
+                            objects.append(json.loads(buffer[self._object_start:self._pos + 1]))
+                        except json.JSONDecodeError:
+                            pass
+                        self._object_start = None
+            self._pos += 1
+        self._compact()
+        return objects
+
+    @property
+    def finished(self):
+        """Whether the closing bracket of the array has been seen"""
+        return self._finished
+
+    def _compact(self):
+        # Drop text that can no longer be part of an object so long streams don't grow the buffer
+        keep_from = self._object_start if self._object_start is not None else self._pos
+        if keep_from:
+            self._buffer = self._buffer[keep_from:]
+            self._pos -= keep_from
+            if self._object_start is not None:
+                self._object_start = 0
@@ -0,0 +1,186 @@
+from database import get_session
+from sqlalchemy.sql import text
+import os
+import time
+import logging
+from circuit_breaker import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+# Minimum seconds between syncs for the same user; requests in between read the local copy only
+DEFAULT_MIN_SYNC_INTERVAL = int(os.environ.get('LIBRARY_MIN_SYNC_INTERVAL', 60))
+
+class LibraryService:
+    """Keeps a local copy of each user's Liked Songs so recommendations don't re-crawl me/tracks"""
+
+    def __init__(self, min_sync_interval=None, page_size=50):
+        self.min_sync_interval = min_sync_interval if min_sync_interval is not None else DEFAULT_MIN_SYNC_INTERVAL
+        self.page_size = page_size
+
+    def get_liked_songs(self, spotify_service, user_id=None, limit=None, deadline=None):
+        """Sync the user's library if due, then return their liked songs from the local store, newest first.
+        
+        With a deadline the sync gives up once it passes, leaving the local copy as it was."""
+        user_id = user_id or spotify_service.user_id
+        try:
+            if not self.sync(spotify_service, user_id, deadline):
+                logger.error(f"Liked Songs sync failed for user {user_id}, serving the local copy")
+        except CircuitOpenError as e:
+            # Spotify is failing fast; a local copy, if there is one, beats an error
+            tracks = self.get_tracks(user_id, limit)
+            if not tracks:
+                raise
+            logger.error(f"Liked Songs sync skipped for user {user_id} ({e}), serving the local copy")
+            return tracks
+        return self.get_tracks(user_id, limit)
+
+    def sync(self, spotify_service, user_id=None, deadline=None):
+        """Fetch only the pages added since the last sync watermark, falling back to a full crawl when needed"""
+        user_id = user_id or spotify_service.user_id
+        state = self._get_sync_state(user_id)
+        crawling = state is not None and state.crawl_offset is not None
+        if state and state.synced_at and not crawling and time.time() - state.synced_at < self.min_sync_interval:
+            return True
+        if not state or not state.watermark or crawling:
+            return self._full_sync(spotify_service, user_id, deadline, state.crawl_offset if crawling else 0)
+
+        # me/tracks is ordered by added_at descending, so stop at the first track not newer than the watermark;
+        # a same-second addition missed here shows up as a count mismatch below
+        new_tracks = []
+        offset = 0
+        total = 0
+        while True:
+            page = spotify_service.get_liked_songs_page(offset, self.page_size, deadline=deadline)
+            if page is None:
+                return False
+            total = page['total']
+            reached_watermark = False
+            for track in page['tracks']:
+                if track['added_at'] and track['added_at'] <= state.watermark:
+                    reached_watermark = True
+                    break
+                new_tracks.append(track)
+            offset += len(page['tracks'])
+            if reached_watermark or len(page['tracks']) < self.page_size or offset >= total:
+                break
+
+        try:
+            session = get_session()
+            self._insert_tracks(session, user_id, new_tracks)
+            stored = session.execute(
+                text('SELECT COUNT(*) FROM liked_tracks WHERE user_id = :user_id'),
+                {'user_id': user_id}
+            ).scalar()
+            # Removed likes can't be seen incrementally; a count mismatch means the copy has drifted
+            if stored != total:
+                session.rollback()
+                session.close()
+                return self._full_sync(spotify_service, user_id, deadline)
+            watermark = max([track['added_at'] for track in new_tracks if track['added_at']] + [state.watermark])
+            self._save_sync_state(session, user_id, watermark, total)
+            session.commit()
+            session.close()
+            return True
+        except Exception as e:
+            logger.error(f"Error storing Liked Songs for user {user_id}: {e}")
+            return False
+
+    def _full_sync(self, spotify_service, user_id, deadline=None, offset=0):
+        """Re-crawl the library from offset, storing the pages fetched so far.
+
+        A crawl from offset 0 replaces the local copy. One cut short by the deadline keeps its pages and records
+        where to resume, so a library too large for one request is crawled over several instead of restarting
+        each time; the watermark is only written once the crawl is complete, which returns True."""
+        library = spotify_service.get_all_liked_songs(deadline=deadline, offset=offset)
+        if library is None:
+            return False
+        tracks = library['tracks']
+        total = library['total']
+
+        try:
+            session = get_session()
+            if offset == 0:
+                session.execute(text('DELETE FROM liked_tracks WHERE user_id = :user_id'), {'user_id': user_id})
+            self._insert_tracks(session, user_id, tracks)
+            if library['complete']:
+                watermark = session.execute(
+                    text('SELECT MAX(added_at) FROM liked_tracks WHERE user_id = :user_id AND added_at != \'\''),
+                    {'user_id': user_id}
+                ).scalar()
+                self._save_sync_state(session, user_id, watermark, total)
+            else:
+                resume_at = offset + len(tracks)
+                logger.info(f"Liked Songs crawl for user {user_id} stopped at {resume_at} of {total}, resuming on the next sync")
+                self._save_sync_state(session, user_id, None, total, crawl_offset=resume_at)
+            session.commit()
+            session.close()
+            return library['complete']
+        except Exception as e:
+            logger.error(f"Error replacing Liked Songs for user {user_id}: {e}")
+            return False
+
+    def get_tracks(self, user_id, limit=None):
+        """Return locally stored liked songs for a user, newest first"""
+        try:
+            session = get_session()
+            query = '''
+                SELECT name, artist, uri, popularity, album, release_date, added_at
+                FROM liked_tracks WHERE user_id = :user_id
+                ORDER BY added_at DESC
+            '''
+            params = {'user_id': user_id}
+            if limit:
+                query += ' LIMIT :limit'
+                params['limit'] = limit
+            rows = session.execute(text(query), params).fetchall()
+            session.close()
+
+            return [{
+                'name': row.name,
+                'artist': row.artist,
+                'uri': row.uri,
+                'popularity': row.popularity,
+                'album': row.album,
+                'release_date': row.release_date,
+                'added_at': row.added_at
+            } for row in rows]
+        except Exception as e:
+            logger.error(f"Error reading Liked Songs for user {user_id}: {e}")
+            return []
+
+    def _get_sync_state(self, user_id):
+        try:
+            session = get_session()
+            state = session.execute(
+                text('SELECT watermark, total, synced_at, crawl_offset FROM library_sync_state WHERE user_id = :user_id'),
+                {'user_id': user_id}
+            ).fetchone()
+            session.close()
+            return state
+        except Exception as e:
+            logger.error(f"Error reading library sync state for user {user_id}: {e}")
+            return None
+
+    def _insert_tracks(self, session, user_id, tracks):
+        if not tracks:
+            return
+        session.execute(text('''
+            INSERT OR REPLACE INTO liked_tracks (user_id, uri, name, artist, album, release_date, popularity, added_at)
+            VALUES (:user_id, :uri, :name, :artist, :album, :release_date, :popularity, :added_at)
+        '''), [{
+            'user_id': user_id,
+            'uri': track['uri'],
+            'name': track['name'],
+            'artist': track['artist'],
+            'album': track['album'],
+            'release_date': track['release_date'],
+            'popularity': track['popularity'],
+            'added_at': track['added_at'] or ''
+        } for track in tracks])
+
+    def _save_sync_state(self, session, user_id, watermark, total, crawl_offset=None):
+        session.execute(text('''
+            INSERT OR REPLACE INTO library_sync_state (user_id, watermark, total, synced_at, crawl_offset)
+            VALUES (:user_id, :watermark, :total, :synced_at, :crawl_offset)
+        '''), {'user_id': user_id, 'watermark': watermark, 'total': total, 'synced_at': time.time(),
+                'crawl_offset': crawl_offset})
@@ -5,6 +5,7 @@ import secrets
 from database import init_db
 from blueprints.auth import auth_bp
 from blueprints.api import api_bp
+from job_queue import shared_job_queue
 
 # Load environment variables
 load_dotenv()
@@ -28,5 +29,8 @@ init_db()
 app.register_blueprint(auth_bp)
 app.register_blueprint(api_bp)
 
+# Start the job workers now rather than on the first submission, so jobs queued before a restart still run
+shared_job_queue.start()
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8888)
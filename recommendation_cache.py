@@ -0,0 +1,72 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from response_cache import ResponseCache
+from verification_cache import normalize_track_key
+
+# Repeated clicks with unchanged settings within this many seconds get the previous result back
+DEFAULT_RESULT_TTL = int(os.environ.get('RECOMMENDATION_CACHE_TTL', 600))
+# Served tracks remembered per user for "something different" requests
+DEFAULT_SERVED_LIMIT = int(os.environ.get('RECOMMENDATION_SERVED_HISTORY', 500))
+
+
+class RecommendationCache:
+    """Recent recommendation results per user, keyed on the liked-songs sample and the filter settings.
+
+    It also remembers the tracks each user has been served, so a "something different" request can
+    skip the cache and steer away from them."""
+
+    def __init__(self, ttl=None, max_entries=1000, served_limit=None, max_users=1000):
+        self.ttl = ttl if ttl is not None else DEFAULT_RESULT_TTL
+        self.served_limit = served_limit if served_limit is not None else DEFAULT_SERVED_LIMIT
+        self.max_users = max_users
+        self._results = ResponseCache(max_entries=max_entries)
+        # user_id -> OrderedDict of normalize_track_key -> "title by artist", oldest first
+        self._served = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(liked_songs, params):
+        """Digest of the liked songs the prompt is built from and every setting that changes the result"""
+        sample = [[song.get('name'), song.get('artist')] for song in liked_songs]
+        payload = json.dumps({'liked': sample, 'params': params}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, user_id, fingerprint):
+        """Return a copy of the cached tracks, or None"""
+        tracks = self._results.get(str(user_id), fingerprint, self.ttl)
+        return list(tracks) if tracks is not None else None
+
+    def put(self, user_id, fingerprint, tracks):
+        """Cache a finished result and record its tracks as served"""
+        self._results.set(str(user_id), fingerprint, list(tracks))
+        self.mark_served(user_id, tracks)
+
+    def mark_served(self, user_id, tracks):
+        with self._lock:
+            served = self._served.pop(str(user_id), None) or OrderedDict()
+            self._served[str(user_id)] = served
+            for track in tracks:
+                key = normalize_track_key(track.get('title'), track.get('artist'))
+                served.pop(key, None)
+                served[key] = f"{track.get('title')} by {track.get('artist')}"
+            while len(served) > self.served_limit:
+                served.popitem(last=False)
+            while len(self._served) > self.max_users:
+                self._served.popitem(last=False)
+
+    def served(self, user_id):
+        """Return {normalize_track_key: "title by artist"} for the tracks this user was served, oldest first"""
+        with self._lock:
+            return OrderedDict(self._served.get(str(user_id), ()))
+
+    def invalidate(self, user_id):
+        """Forget a user's cached results and history"""
+        self._results.invalidate(str(user_id))
+        with self._lock:
+            self._served.pop(str(user_id), None)
+
+    def stats(self):
+        return self._results.stats()
@@ -1,12 +1,74 @@
-import google.generativeai as genai
+import asyncio
 import json
+import os
+import queue
 import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+# Only an alias of the builtin TimeoutError from Python 3.11
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from google.api_core import exceptions as google_exceptions
+from json_stream import JSONArrayStreamParser
+from gemini_pool import shared_gemini_pool
+from verification_cache import normalize_track_key
+from recommendation_cache import RecommendationCache
+from track_index import TrackIndex
+from deadline import Deadline, DEFAULT_REFILL_DEADLINE, remaining, expired
+from request_scheduler import INTERACTIVE, BACKGROUND
+from circuit_breaker import shared_circuit_breakers, CircuitOpenError
+
+GEMINI_MODEL_NAME = "gemini-2.5-flash-preview-05-20"
+# Liked songs quoted in the prompt, newest first; the result cache is keyed on the same sample
+PROMPT_LIKED_SONGS = 50
+# Most recently served tracks listed in the prompt of a "something different" request
+PROMPT_AVOID_TRACKS = 100
+
+# Parallel Spotify searches per recommendation run; keep low enough to stay within Spotify rate limits
+DEFAULT_VERIFY_CONCURRENCY = int(os.environ.get('RECOMMENDATION_VERIFY_CONCURRENCY', 5))
+# Concurrent searches when verifying through AsyncSpotifyService; coroutines are cheap and the scheduler caps the rate
+DEFAULT_ASYNC_VERIFY_CONCURRENCY = int(os.environ.get('RECOMMENDATION_ASYNC_VERIFY_CONCURRENCY', 50))
+# Seconds allowed for verifying filter extreme suggestions before partial results are returned
+DEFAULT_FILTER_VERIFY_BUDGET = float(os.environ.get('FILTER_SUGGESTIONS_TIME_BUDGET', 20))
+# Stream Gemini's output and start verifying each suggestion as soon as it has been generated
+DEFAULT_STREAMING = os.environ.get('RECOMMENDATION_STREAMING', '1').lower() in ('1', 'true', 'yes')
+# Seconds to a first response (first chunk when streaming) that count as slow towards opening the Gemini breaker
+DEFAULT_GEMINI_SLOW_CALL_SECONDS = float(os.environ.get('GEMINI_SLOW_CALL_SECONDS', 20))
+
+def _gemini_failure(e):
+    """Whether a Gemini error means the service is unhealthy, rather than a bad key or request; calls cut
+    off by our own deadline are judged by their latency instead"""
+    return isinstance(e, google_exceptions.ServerError) and not isinstance(e, google_exceptions.DeadlineExceeded)
+
+def _close_stream(response):
+    """Cancel a streamed Gemini response that is no longer being read, so it stops pulling chunks"""
+    # The SDK's response wraps the transport stream (a gRPC call with cancel()) without exposing a close of its own
+    stream = getattr(response, '_iterator', response)
+    for name in ('cancel', 'close'):
+        close = getattr(stream, name, None)
+        if callable(close):
+            try:
+                close()
+            except Exception as e:
+                print(f"Error closing Gemini stream: {str(e)}")
+            return
 
 class RecommendationService:
-    def __init__(self, api_key):
+    def __init__(self, api_key, verify_concurrency=None, verification_cache=None, streaming=None, result_cache=None, candidate_pool=None):
         self.api_key = api_key
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel("gemini-2.5-flash-preview-05-20")
+        self.streaming = DEFAULT_STREAMING if streaming is None else streaming
+        self.verify_concurrency = max(1, verify_concurrency or DEFAULT_VERIFY_CONCURRENCY)
+        self.async_verify_concurrency = max(1, DEFAULT_ASYNC_VERIFY_CONCURRENCY)
+        # Optional cross-user (title, artist) -> track cache consulted before searching Spotify
+        self.verification_cache = verification_cache
+        # Optional RecommendationCache answering repeat requests with unchanged settings
+        self.result_cache = result_cache
+        # Optional CandidatePool of pre-verified tracks, refilled in the background
+        self.candidate_pool = candidate_pool
+        # Reused across requests and bound to this key's own clients rather than the process-global genai.configure
+        self.model = shared_gemini_pool.model(api_key, GEMINI_MODEL_NAME)
+        # Shared by every key: an outage fails fast for all users instead of each request waiting it out
+        self.gemini_breaker = shared_circuit_breakers.get('gemini:generate', slow_call_duration=DEFAULT_GEMINI_SLOW_CALL_SECONDS)
     
     def validate_api_key(self):
         """Validate that the API key works"""
@@ -14,84 +76,616 @@ class RecommendationService:
             response = self.model.generate_content("Hello")
             return True
         except Exception:
+            shared_gemini_pool.discard(self.api_key)
             return False
     
-    def get_recommendations(self, spotify_service, count=20, discovery_level=50, min_year=1900, max_popularity=100, genres=None, moods=None, tempo=None, energy=None):
-        """Get song recommendations based on user's liked songs and preferences"""
-        # Get user's liked songs
-        liked_songs = spotify_service.get_liked_songs(limit=100)
+    def get_recommendations(self, spotify_service, count=20, discovery_level=50, min_year=1900, max_popularity=100, genres=None, moods=None, tempo=None, energy=None, liked_songs=None, different=False, deadline=None):
+        """Get song recommendations based on user's liked songs and preferences.
+        
+        Identical repeat requests are answered from the result cache; different=True skips it and steers
+        away from tracks this user has already been served. With a candidate pool, pre-verified tracks are
+        served first and only a shortfall is generated while the user waits. With a deadline, Gemini and every
+        Spotify search only wait for the time left, and once it passes the tracks verified so far are returned."""
+        # Get user's liked songs, unless the caller already read them from the local library
+        if liked_songs is None:
+            liked_songs = spotify_service.get_liked_songs(limit=100)
         
         if not liked_songs:
             raise Exception("Could not retrieve liked songs from Spotify. Please ensure your Spotify account is connected.")
         
-        # Prepare prompt for Gemini
-        prompt = self._create_recommendation_prompt(
-            liked_songs, 
-            count, 
-            discovery_level, 
-            min_year, 
-            max_popularity,
-            genres,
-            moods,
-            tempo,
-            energy
-        )
+        cache_key, cached, avoid = self._result_cache_lookup(spotify_service, liked_songs, different, count=count, discovery_level=discovery_level, min_year=min_year, max_popularity=max_popularity, genres=genres, moods=moods, tempo=tempo, energy=energy)
+        if cached is not None:
+            return cached
+        
+        # Library, avoided and served tracks, so no search is spent on a track that can't be returned
+        exclude = TrackIndex(liked_songs, keys=avoid)
+        pool_key, verified_recommendations = self._take_pooled(spotify_service, liked_songs, exclude, count, discovery_level, min_year, max_popularity, genres, moods, tempo, energy)
         
         # Generate recommendations
         try:
-            response = self.model.generate_content(prompt)
-            print("Gemini API Response:", response.text)
-            recommendations = self._parse_recommendations(response.text)
-            print("Parsed Recommendations:", recommendations)
-            
-            if not recommendations:
-                raise Exception("No valid recommendations could be parsed from the AI response.")
-            
-            # Verify songs on Spotify in batches to reduce API call overhead
-            verified_recommendations = []
-            batch_size = 5  # Process multiple searches in a batch
-            max_attempts = min(len(recommendations), count * 3)  # Attempt to verify more than needed to account for failures
-            
-            for i in range(0, max_attempts, batch_size):
-                batch = recommendations[i:i + batch_size]
-                for rec in batch:
-                    query = f"track:{rec['title']} artist:{rec['artist']}"
-                    search_results = spotify_service.search_tracks(query, limit=1)
-                    
-                    if search_results:
-                        track = search_results[0]
-                        verified_recommendations.append({
-                            'title': track['name'],
-                            'artist': track['artist'],
-                            'uri': track['uri'],
-                            'album': track['album'],
-                            'release_date': track['release_date'],
-                            'popularity': track['popularity'],
-                            'preview_url': track.get('preview_url')
-                        })
-                    
-                    if len(verified_recommendations) >= count:
-                        print("Verified Recommendations (limited to requested count):", verified_recommendations)
-                        return verified_recommendations
-            
-            print("Verified Recommendations (all processed):", verified_recommendations)
-            if not verified_recommendations:
-                raise Exception("No recommendations could be verified on Spotify. The AI might have suggested tracks that don't exist or aren't available on Spotify. Please try adjusting your preferences or generating a new set of recommendations.")
-            return verified_recommendations
+            shortfall = count - len(verified_recommendations)
+            if shortfall > 0 and not expired(deadline):
+                avoid = self._avoiding(avoid, verified_recommendations)
+                exclude.update(verified_recommendations)
+                # Prepare prompt for Gemini
+                prompt = self._create_recommendation_prompt(
+                    liked_songs, 
+                    shortfall, 
+                    discovery_level, 
+                    min_year, 
+                    max_popularity,
+                    genres,
+                    moods,
+                    tempo,
+                    energy,
+                    avoid=list(avoid.values())
+                )
+                verified_recommendations += self._generate_verified(spotify_service, prompt, shortfall, exclude, deadline)
+            recommendations = self._checked_recommendations(verified_recommendations, count, deadline)
+        except Exception as e:
+            raise self._recommendation_error(e)
+        # A list cut short by the deadline would be served from the cache, unmarked, to the next identical request
+        if not self._cut_short(recommendations, count, deadline):
+            self._refill_pool(spotify_service, pool_key, recommendations, liked_songs, discovery_level, genres, moods, tempo, energy)
+            self._result_cache_store(cache_key, recommendations)
+        return recommendations
+    
+    def iter_recommendations(self, spotify_service, count=20, discovery_level=50, min_year=1900, max_popularity=100, genres=None, moods=None, tempo=None, energy=None, liked_songs=None, different=False, deadline=None):
+        """Yield verified recommendations in ranking order as each one is ready, while Gemini is still generating"""
+        if not liked_songs:
+            raise Exception("Could not retrieve liked songs from Spotify. Please ensure your Spotify account is connected.")
+        
+        cache_key, cached, avoid = self._result_cache_lookup(spotify_service, liked_songs, different, count=count, discovery_level=discovery_level, min_year=min_year, max_popularity=max_popularity, genres=genres, moods=moods, tempo=tempo, energy=energy)
+        if cached is not None:
+            yield from cached
+            return
+        
+        exclude = TrackIndex(liked_songs, keys=avoid)
+        pool_key, pooled = self._take_pooled(spotify_service, liked_songs, exclude, count, discovery_level, min_year, max_popularity, genres, moods, tempo, energy)
+        try:
+            verified = []
+            for track in pooled:
+                verified.append(track)
+                yield track
+            shortfall = count - len(pooled)
+            if shortfall > 0 and not expired(deadline):
+                avoid = self._avoiding(avoid, pooled)
+                exclude.update(pooled)
+                prompt = self._create_recommendation_prompt(liked_songs, shortfall, discovery_level, min_year, max_popularity, genres, moods, tempo, energy, avoid=list(avoid.values()))
+                for track in self._iter_verified(spotify_service, self._stream_candidates(prompt, shortfall, exclude, deadline), shortfall, deadline, exclude):
+                    verified.append(track)
+                    yield track
+            if not verified:
+                self._checked_recommendations([], count, deadline)
+        except Exception as e:
+            raise self._recommendation_error(e)
+        # A list cut short by the deadline would be served from the cache, unmarked, to the next identical request
+        if not self._cut_short(verified, count, deadline):
+            self._refill_pool(spotify_service, pool_key, verified, liked_songs, discovery_level, genres, moods, tempo, energy)
+            self._result_cache_store(cache_key, verified)
+    
+    async def get_recommendations_async(self, spotify_service, count=20, discovery_level=50, min_year=1900, max_popularity=100, genres=None, moods=None, tempo=None, energy=None, liked_songs=None, different=False, deadline=None):
+        """Coroutine form of get_recommendations for an AsyncSpotifyService; awaits Gemini instead of blocking a thread"""
+        if not liked_songs:
+            raise Exception("Could not retrieve liked songs from Spotify. Please ensure your Spotify account is connected.")
+        
+        cache_key, cached, avoid = self._result_cache_lookup(spotify_service, liked_songs, different, count=count, discovery_level=discovery_level, min_year=min_year, max_popularity=max_popularity, genres=genres, moods=moods, tempo=tempo, energy=energy)
+        if cached is not None:
+            return cached
+        
+        exclude = TrackIndex(liked_songs, keys=avoid)
+        pool_key, verified_recommendations = self._take_pooled(spotify_service, liked_songs, exclude, count, discovery_level, min_year, max_popularity, genres, moods, tempo, energy)
+        try:
+            shortfall = count - len(verified_recommendations)
+            if shortfall > 0 and not expired(deadline):
+                avoid = self._avoiding(avoid, verified_recommendations)
+                exclude.update(verified_recommendations)
+                prompt = self._create_recommendation_prompt(liked_songs, shortfall, discovery_level, min_year, max_popularity, genres, moods, tempo, energy, avoid=list(avoid.values()))
+                verified_recommendations += await self._generate_verified_async(spotify_service, prompt, shortfall, exclude, deadline)
+            recommendations = self._checked_recommendations(verified_recommendations, count, deadline)
         except Exception as e:
-            print("Error in recommendation process:", str(e))
-            error_msg = str(e)
-            if "API key" in error_msg or "authentication" in error_msg.lower():
-                raise Exception("There seems to be an issue with the Google Gemini AI API key. Please verify your API key in the setup page.")
-            elif "Spotify" in error_msg:
-                raise Exception("Error connecting to Spotify. Please ensure your Spotify account is connected properly via the authentication process.")
-            else:
-                raise Exception(f"Error generating recommendations: {error_msg}. Please try again or adjust your preferences.")
-    
-    def _create_recommendation_prompt(self, liked_songs, count, discovery_level, min_year, max_popularity, genres=None, moods=None, tempo=None, energy=None):
+            raise self._recommendation_error(e)
+        # A list cut short by the deadline would be served from the cache, unmarked, to the next identical request
+        if not self._cut_short(recommendations, count, deadline):
+            self._refill_pool_async(spotify_service, pool_key, recommendations, liked_songs, discovery_level, genres, moods, tempo, energy)
+            self._result_cache_store(cache_key, recommendations)
+        return recommendations
+    
+    async def aiter_recommendations(self, spotify_service, count=20, discovery_level=50, min_year=1900, max_popularity=100, genres=None, moods=None, tempo=None, energy=None, liked_songs=None, different=False, deadline=None):
+        """Async generator form of iter_recommendations for an AsyncSpotifyService"""
+        if not liked_songs:
+            raise Exception("Could not retrieve liked songs from Spotify. Please ensure your Spotify account is connected.")
+        
+        cache_key, cached, avoid = self._result_cache_lookup(spotify_service, liked_songs, different, count=count, discovery_level=discovery_level, min_year=min_year, max_popularity=max_popularity, genres=genres, moods=moods, tempo=tempo, energy=energy)
+        if cached is not None:
+            for track in cached:
+                yield track
+            return
+        
+        exclude = TrackIndex(liked_songs, keys=avoid)
+        pool_key, pooled = self._take_pooled(spotify_service, liked_songs, exclude, count, discovery_level, min_year, max_popularity, genres, moods, tempo, energy)
+        try:
+            verified = []
+            for track in pooled:
+                verified.append(track)
+                yield track
+            shortfall = count - len(pooled)
+            if shortfall > 0 and not expired(deadline):
+                avoid = self._avoiding(avoid, pooled)
+                exclude.update(pooled)
+                prompt = self._create_recommendation_prompt(liked_songs, shortfall, discovery_level, min_year, max_popularity, genres, moods, tempo, energy, avoid=list(avoid.values()))
+                async for track in self._aiter_verified(spotify_service, self._stream_candidates_async(prompt, shortfall, exclude, deadline), shortfall, deadline, exclude):
+                    verified.append(track)
+                    yield track
+            if not verified:
+                self._checked_recommendations([], count, deadline)
+        except Exception as e:
+            raise self._recommendation_error(e)
+        # A list cut short by the deadline would be served from the cache, unmarked, to the next identical request
+        if not self._cut_short(verified, count, deadline):
+            self._refill_pool_async(spotify_service, pool_key, verified, liked_songs, discovery_level, genres, moods, tempo, energy)
+            self._result_cache_store(cache_key, verified)
+    
+    def _generate_verified(self, spotify_service, prompt, count, exclude=None, deadline=None, priority=INTERACTIVE):
+        """Ask Gemini for suggestions and return up to count of them that Spotify has, in ranking order.
+        
+        exclude is a TrackIndex of tracks not to return; suggestions and verified tracks are added to it.
+        priority is the rate-limit lane the Spotify searches queue in."""
+        if self.streaming:
+            candidates = self._stream_candidates(prompt, count, exclude, deadline)
+            return list(self._iter_verified(spotify_service, candidates, count, deadline, exclude, priority))
+        try:
+            with self.gemini_breaker.attempt(_gemini_failure):
+                response = self.model.generate_content(prompt, **self._gemini_options(deadline))
+        except google_exceptions.DeadlineExceeded:
+            if deadline is None:
+                raise
+            print("Gemini did not answer before the request deadline.")
+            return []
+        candidates = self._recommendation_candidates(response.text, count, exclude)
+        return self._verify_recommendations(spotify_service, candidates, count, deadline, exclude, priority)
+    
+    async def _generate_verified_async(self, spotify_service, prompt, count, exclude=None, deadline=None, priority=INTERACTIVE):
+        """Coroutine form of _generate_verified"""
+        if self.streaming:
+            candidates = self._stream_candidates_async(prompt, count, exclude, deadline)
+            return [track async for track in self._aiter_verified(spotify_service, candidates, count, deadline, exclude, priority)]
+        try:
+            with self.gemini_breaker.attempt(_gemini_failure):
+                response = await self.model.generate_content_async(prompt, **self._gemini_options(deadline))
+        except google_exceptions.DeadlineExceeded:
+            if deadline is None:
+                raise
+            print("Gemini did not answer before the request deadline.")
+            return []
+        candidates = self._recommendation_candidates(response.text, count, exclude)
+        return await self._verify_recommendations_async(spotify_service, candidates, count, deadline, exclude, priority)
+    
+    def _gemini_options(self, deadline):
+        """Keyword arguments bounding a Gemini call, streamed or not, by what is left of the deadline"""
+        if deadline is None:
+            return {}
+        return {'request_options': {'timeout': deadline.remaining()}}
+    
+    def _take_pooled(self, spotify_service, liked_songs, exclude, count, discovery_level, min_year, max_popularity, genres, moods, tempo, energy):
+        """Return (pool key, pre-verified tracks passing the filters), or (None, []) without a candidate pool"""
+        user_id = getattr(spotify_service, 'user_id', None)
+        if self.candidate_pool is None or not user_id:
+            return None, []
+        # Year and popularity are checked per track, so one pool serves every setting of those two sliders
+        pool_key = (user_id, RecommendationCache.fingerprint(liked_songs[:PROMPT_LIKED_SONGS], {
+            'discovery_level': discovery_level, 'genres': genres, 'moods': moods, 'tempo': tempo, 'energy': energy
+        }))
+        def accept(track):
+            year = self._release_year(track)
+            # Pooled before the user liked it, or served since
+            return (year is None or year >= min_year) and (track.get('popularity') or 0) <= max_popularity \
+                and track not in exclude
+        pooled = self.candidate_pool.take(pool_key, count, accept)
+        if pooled:
+            print(f"Serving {len(pooled)} recommendations from the candidate pool.")
+        return pool_key, pooled
+    
+    def _pool_batch_prompt(self, pool_key, liked_songs, discovery_level, genres, moods, tempo, energy):
+        """Prompt for a refill batch: the widest year and popularity range, avoiding what the user was served"""
+        avoid = self.result_cache.served(pool_key[0]) if self.result_cache is not None else {}
+        batch_size = self.candidate_pool.batch_size
+        prompt = self._create_recommendation_prompt(liked_songs, batch_size, discovery_level, 1900, 100, genres, moods, tempo, energy, avoid=list(avoid.values()))
+        return prompt, batch_size, avoid
+    
+    def _refill_pool(self, spotify_service, pool_key, served, liked_songs, discovery_level, genres, moods, tempo, energy):
+        """Top the pool up on a background thread once it has dropped below its low watermark.
+
+        A refill has no request waiting on it, so its searches queue behind interactive ones and the whole
+        refill, Gemini call included, is bounded by a deadline of its own."""
+        if pool_key is None:
+            return
+        self.candidate_pool.mark_seen(pool_key, served)
+        def fill():
+            prompt, batch_size, avoid = self._pool_batch_prompt(pool_key, liked_songs, discovery_level, genres, moods, tempo, energy)
+            return self._generate_verified(spotify_service, prompt, batch_size, TrackIndex(liked_songs, keys=avoid),
+                                           Deadline(DEFAULT_REFILL_DEADLINE), BACKGROUND)
+        self.candidate_pool.refill(pool_key, fill)
+    
+    def _refill_pool_async(self, spotify_service, pool_key, served, liked_songs, discovery_level, genres, moods, tempo, energy):
+        """Like _refill_pool, but refills as a task on the running event loop"""
+        if pool_key is None:
+            return
+        self.candidate_pool.mark_seen(pool_key, served)
+        async def fill():
+            prompt, batch_size, avoid = self._pool_batch_prompt(pool_key, liked_songs, discovery_level, genres, moods, tempo, energy)
+            return await self._generate_verified_async(spotify_service, prompt, batch_size, TrackIndex(liked_songs, keys=avoid),
+                                                       Deadline(DEFAULT_REFILL_DEADLINE), BACKGROUND)
+        self.candidate_pool.refill_async(pool_key, fill)
+    
+    def _release_year(self, track):
+        try:
+            return int(str(track.get('release_date') or '')[:4])
+        except ValueError:
+            return None
+    
+    def _avoiding(self, avoid, tracks):
+        """avoid plus the given tracks, so a top-up never repeats what was just served from the pool"""
+        if not tracks:
+            return avoid
+        extended = dict(avoid)
+        for track in tracks:
+            extended[normalize_track_key(track.get('title'), track.get('artist'))] = f"{track.get('title')} by {track.get('artist')}"
+        return extended
+    
+    def _result_cache_lookup(self, spotify_service, liked_songs, different, **params):
+        """Return (cache key, cached tracks or None, {track key: "title by artist"} of served tracks to avoid)"""
+        user_id = getattr(spotify_service, 'user_id', None)
+        if self.result_cache is None or not user_id:
+            return None, None, {}
+        cache_key = (user_id, self.result_cache.fingerprint(liked_songs[:PROMPT_LIKED_SONGS], params))
+        if different:
+            return cache_key, None, self.result_cache.served(user_id)
+        cached = self.result_cache.get(*cache_key)
+        if cached is not None:
+            print("Serving cached recommendations for unchanged settings.")
+        return cache_key, cached, {}
+    
+    def _cut_short(self, recommendations, count, deadline):
+        return len(recommendations) < count and expired(deadline)
+    
+    def _result_cache_store(self, cache_key, recommendations):
+        if cache_key is not None:
+            self.result_cache.put(*cache_key, recommendations)
+    
+    def _claimed(self, rec, exclude):
+        """Whether a suggestion is worth a search: not liked, avoided or already suggested in this run"""
+        return exclude is None or not isinstance(rec, dict) or exclude.claim(rec)
+    
+    def _new_track(self, track, exclude):
+        """Whether a verified track may be returned: two suggestions can resolve to one URI, or to a liked one"""
+        return bool(track) and (exclude is None or exclude.claim_uri(track))
+    
+    def _stream_candidates(self, prompt, count, exclude=None, deadline=None):
+        """Yield suggestions from a streamed Gemini response as each JSON object closes, up to count * 3"""
+        parser = JSONArrayStreamParser()
+        chunks = []
+        parsed = emitted = 0
+        response = None
+        try:
+            with self.gemini_breaker.attempt(_gemini_failure) as call:
+                response = self.model.generate_content(prompt, stream=True, **self._gemini_options(deadline))
+                for chunk in response:
+                    call.responded()
+                    chunks.append(chunk.text)
+                    for rec in parser.feed(chunk.text):
+                        parsed += 1
+                        if self._is_suggestion(rec) and self._claimed(rec, exclude):
+                            emitted += 1
+                            yield rec
+                            if emitted >= count * 3:
+                                return
+        except google_exceptions.DeadlineExceeded:
+            if deadline is None:
+                raise
+            # Suggestions that arrived before the deadline are still being verified
+            print("Gemini stream cut off by the request deadline.")
+            return
+        finally:
+            # Also runs when the consumer closes this generator early
+            if response is not None:
+                _close_stream(response)
+        if not parsed:
+            # The model ignored the JSON format; fall back to the tolerant full-text parser
+            yield from self._recommendation_candidates(''.join(chunks), count, exclude)
+    
+    async def _stream_candidates_async(self, prompt, count, exclude=None, deadline=None):
+        """Async generator form of _stream_candidates"""
+        parser = JSONArrayStreamParser()
+        chunks = []
+        parsed = emitted = 0
+        try:
+            with self.gemini_breaker.attempt(_gemini_failure) as call:
+                response = await self.model.generate_content_async(prompt, stream=True, **self._gemini_options(deadline))
+                async for chunk in response:
+                    call.responded()
+                    chunks.append(chunk.text)
+                    for rec in parser.feed(chunk.text):
+                        parsed += 1
+                        if self._is_suggestion(rec) and self._claimed(rec, exclude):
+                            emitted += 1
+                            yield rec
+                            if emitted >= count * 3:
+                                return
+        except google_exceptions.DeadlineExceeded:
+            if deadline is None:
+                raise
+            print("Gemini stream cut off by the request deadline.")
+            return
+        if not parsed:
+            for rec in self._recommendation_candidates(''.join(chunks), count, exclude):
+                yield rec
+    
+    def _is_suggestion(self, rec):
+        return isinstance(rec, dict) and isinstance(rec.get('title'), str) and isinstance(rec.get('artist'), str) \
+            and bool(rec['title']) and bool(rec['artist'])
+    
+    def _iter_verified(self, spotify_service, candidates, count, deadline=None, exclude=None, priority=INTERACTIVE):
+        """Verify candidates while they are still being generated, yielding hits in ranking order until count
+        or until the deadline passes"""
+        executor = ThreadPoolExecutor(max_workers=self.verify_concurrency)
+        futures = queue.Queue()
+        stop = threading.Event()
+        
+        def produce():
+            # Reads the Gemini stream on its own thread so searches start while generation continues
+            try:
+                for rec in candidates:
+                    if stop.is_set():
+                        break
+                    try:
+                        futures.put(executor.submit(self._verify_track, spotify_service, rec, deadline, priority))
+                    except RuntimeError:
+                        # The consumer shut the executor down between the check and the submit
+                        if stop.is_set():
+                            break
+                        raise
+            except Exception as e:
+                futures.put(e)
+            finally:
+                futures.put(None)
+                # Only this thread may close the generator, which stops it reading the Gemini stream
+                close = getattr(candidates, 'close', None)
+                if close is not None:
+                    close()
+        
+        threading.Thread(target=produce, daemon=True).start()
+        verified = 0
+        try:
+            while verified < count:
+                try:
+                    item = futures.get(timeout=remaining(deadline))
+                except queue.Empty:
+                    print("Request deadline passed, keeping the recommendations verified so far.")
+                    break
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                try:
+                    track = item.result(timeout=remaining(deadline))
+                except FutureTimeoutError:
+                    if not expired(deadline):
+                        raise
+                    print("Request deadline passed, keeping the recommendations verified so far.")
+                    break
+                if self._new_track(track, exclude):
+                    verified += 1
+                    yield track
+        finally:
+            stop.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    async def _aiter_verified(self, spotify_service, candidates, count, deadline=None, exclude=None, priority=INTERACTIVE):
+        """Async generator form of _iter_verified"""
+        semaphore = asyncio.Semaphore(self.async_verify_concurrency)
+        tasks = asyncio.Queue()
+        started = []
+        
+        async def verify(rec):
+            async with semaphore:
+                return await self._verify_track_async(spotify_service, rec, deadline, priority)
+        
+        async def produce():
+            try:
+                async for rec in candidates:
+                    task = asyncio.ensure_future(verify(rec))
+                    started.append(task)
+                    tasks.put_nowait(task)
+            except Exception as e:
+                tasks.put_nowait(e)
+            finally:
+                tasks.put_nowait(None)
+        
+        producer = asyncio.ensure_future(produce())
+        verified = 0
+        try:
+            while verified < count:
+                try:
+                    item = await asyncio.wait_for(tasks.get(), remaining(deadline))
+                except asyncio.TimeoutError:
+                    print("Request deadline passed, keeping the recommendations verified so far.")
+                    break
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                try:
+                    track = await asyncio.wait_for(item, remaining(deadline))
+                except asyncio.TimeoutError:
+                    if not expired(deadline):
+                        raise
+                    print("Request deadline passed, keeping the recommendations verified so far.")
+                    break
+                if self._new_track(track, exclude):
+                    verified += 1
+                    yield track
+        finally:
+            producer.cancel()
+            for task in started:
+                task.cancel()
+            await asyncio.gather(producer, *started, return_exceptions=True)
+    
+    def _recommendation_candidates(self, response_text, count, exclude=None):
+        """Parse Gemini's suggestions, keeping more than needed to allow for tracks Spotify can't find"""
+        print("Gemini API Response:", response_text)
+        recommendations = self._parse_recommendations(response_text)
+        print("Parsed Recommendations:", recommendations)
+        
+        if not recommendations:
+            raise Exception("No valid recommendations could be parsed from the AI response.")
+        
+        recommendations = [rec for rec in recommendations if self._claimed(rec, exclude)]
+        max_attempts = min(len(recommendations), count * 3)
+        return recommendations[:max_attempts]
+    
+    def _checked_recommendations(self, verified_recommendations, count, deadline=None):
+        if len(verified_recommendations) >= count:
+            print("Verified Recommendations (limited to requested count):", verified_recommendations)
+            return verified_recommendations
+        
+        print("Verified Recommendations (all processed):", verified_recommendations)
+        if not verified_recommendations and expired(deadline):
+            raise Exception("timed out before any recommendation was verified")
+        if not verified_recommendations:
+            raise Exception("No recommendations could be verified on Spotify. The AI might have suggested tracks that don't exist or aren't available on Spotify. Please try adjusting your preferences or generating a new set of recommendations.")
+        return verified_recommendations
+    
+    def _recommendation_error(self, e):
+        """Turn a failure anywhere in the recommendation flow into the message shown to the user"""
+        print("Error in recommendation process:", str(e))
+        if isinstance(e, CircuitOpenError):
+            # Routes answer these with 503 and Retry-After
+            return e
+        error_msg = str(e)
+        if "API key" in error_msg or "authentication" in error_msg.lower():
+            return Exception("There seems to be an issue with the Google Gemini AI API key. Please verify your API key in the setup page.")
+        elif "Spotify" in error_msg:
+            return Exception("Error connecting to Spotify. Please ensure your Spotify account is connected properly via the authentication process.")
+        else:
+            return Exception(f"Error generating recommendations: {error_msg}. Please try again or adjust your preferences.")
+    
+    def _verify_recommendations(self, spotify_service, recommendations, count, deadline=None, exclude=None, priority=INTERACTIVE):
+        """Search Spotify for candidates with bounded concurrency, keeping the model's ranking order"""
+        verified_recommendations = []
+        candidates = iter(recommendations)
+        pending = deque()
+        # Keep only a small window of searches queued ahead so little work is wasted once count is reached
+        window = self.verify_concurrency * 2
+        executor = ThreadPoolExecutor(max_workers=self.verify_concurrency)
+        try:
+            while True:
+                while len(pending) < window:
+                    rec = next(candidates, None)
+                    if rec is None:
+                        break
+                    pending.append(executor.submit(self._verify_track, spotify_service, rec, deadline, priority))
+                if not pending:
+                    break
+                # Collect in submission order so the output keeps Gemini's ranking
+                future = pending.popleft()
+                try:
+                    track = future.result(timeout=remaining(deadline))
+                except FutureTimeoutError:
+                    if not expired(deadline):
+                        raise
+                    print("Request deadline passed, keeping the recommendations verified so far.")
+                    break
+                if self._new_track(track, exclude):
+                    verified_recommendations.append(track)
+                if len(verified_recommendations) >= count:
+                    break
+        finally:
+            # Drop searches that have not started yet once enough tracks are verified
+            executor.shutdown(wait=False, cancel_futures=True)
+        return verified_recommendations
+    
+    async def _verify_recommendations_async(self, spotify_service, recommendations, count, deadline=None, exclude=None, priority=INTERACTIVE):
+        """Coroutine form of _verify_recommendations for an AsyncSpotifyService, running the searches on one thread"""
+        semaphore = asyncio.Semaphore(self.async_verify_concurrency)
+        async def verify(rec):
+            async with semaphore:
+                return await self._verify_track_async(spotify_service, rec, deadline, priority)
+        tasks = [asyncio.ensure_future(verify(rec)) for rec in recommendations]
+        verified_recommendations = []
+        try:
+            # Await in submission order so the output keeps Gemini's ranking
+            for task in tasks:
+                try:
+                    track = await asyncio.wait_for(task, remaining(deadline))
+                except asyncio.TimeoutError:
+                    if not expired(deadline):
+                        raise
+                    print("Request deadline passed, keeping the recommendations verified so far.")
+                    break
+                if self._new_track(track, exclude):
+                    verified_recommendations.append(track)
+                if len(verified_recommendations) >= count:
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return verified_recommendations
+    
+    async def _verify_track_async(self, spotify_service, rec, deadline=None, priority=INTERACTIVE):
+        """Coroutine form of _verify_track, sharing the verification cache"""
+        return self._format_verified_track(await self._search_track_async(spotify_service, rec, deadline, priority))
+    
+    async def _search_track_async(self, spotify_service, rec, deadline=None, priority=INTERACTIVE):
+        """Coroutine form of _search_track, reading and writing the SQLite-backed cache in a worker thread"""
+        if self.verification_cache:
+            hit, track = await asyncio.to_thread(self.verification_cache.get, rec['title'], rec['artist'])
+            if hit:
+                return track
+        query = f"track:{rec['title']} artist:{rec['artist']}"
+        search_results = await spotify_service.search_tracks(query, limit=1, deadline=deadline, priority=priority)
+        track = search_results[0] if search_results else None
+        if self.verification_cache and search_results is not None:
+            await asyncio.to_thread(self.verification_cache.put, rec['title'], rec['artist'], track)
+        return track
+    
+    def _search_track(self, spotify_service, rec, deadline=None, priority=INTERACTIVE):
+        """Return the best Spotify search match for a suggested track, or None if there is none"""
+        if self.verification_cache:
+            hit, track = self.verification_cache.get(rec['title'], rec['artist'])
+            if hit:
+                return track
+        query = f"track:{rec['title']} artist:{rec['artist']}"
+        search_results = spotify_service.search_tracks(query, limit=1, deadline=deadline, priority=priority)
+        track = search_results[0] if search_results else None
+        # Only remember answers from searches that actually completed, never transient failures
+        if self.verification_cache and search_results is not None:
+            self.verification_cache.put(rec['title'], rec['artist'], track)
+        return track
+    
+    def _verify_track(self, spotify_service, rec, deadline=None, priority=INTERACTIVE):
+        """Look up a single suggested track on Spotify, returning None if it can't be found"""
+        return self._format_verified_track(self._search_track(spotify_service, rec, deadline, priority))
+    
+    def _format_verified_track(self, track):
+        """Shape a Spotify search match as a recommendation, or None when there was no match"""
+        if not track:
+            return None
+        return {
+            'title': track['name'],
+            'artist': track['artist'],
+            'uri': track['uri'],
+            'album': track['album'],
+            'release_date': track['release_date'],
+            'popularity': track['popularity'],
+            'preview_url': track.get('preview_url')
+        }
+    
+    def _create_recommendation_prompt(self, liked_songs, count, discovery_level, min_year, max_popularity, genres=None, moods=None, tempo=None, energy=None, avoid=None):
         """Create a prompt for the Gemini model"""
         # Format liked songs for the prompt
-        songs_text = "\n".join([f"- {song['name']} by {song['artist']}" for song in liked_songs[:50]])
+        songs_text = "\n".join([f"- {song['name']} by {song['artist']}" for song in liked_songs[:PROMPT_LIKED_SONGS]])
         
         # Format genres and moods if provided
         genres_text = ""
@@ -138,6 +732,12 @@ class RecommendationService:
             elif energy == "high":
                 energy_text = "The recommendations should have high energy, suitable for workouts or dancing.\n"
         
+        # Tracks already served, when the user asked for something different
+        avoid_text = ""
+        if avoid:
+            avoid_list = "\n".join(f"- {track}" for track in avoid[-PROMPT_AVOID_TRACKS:])
+            avoid_text = f"Do not recommend any of these songs, I have already been given them:\n{avoid_list}\n"
+        
         prompt = f"""Based on the following list of songs that I like, recommend {count} new songs that I might enjoy.
 
 My liked songs:
@@ -150,6 +750,7 @@ My liked songs:
 {popularity_text}
 {tempo_text}
 {energy_text}
+{avoid_text}
 
 Format your response as a JSON array of objects with 'title' and 'artist' fields only. Do not include any explanations or other text outside the JSON array.
 """
@@ -198,63 +799,146 @@ Format your response as a JSON array of objects with 'title' and 'artist' fields
         
         return recommendations
 
-    def get_filter_extreme_suggestions(self, spotify_service, liked_songs):
+    def get_filter_extreme_suggestions(self, spotify_service, liked_songs, time_budget=None, priority=INTERACTIVE):
         """Get song suggestions at extreme ends of filters based on user's liked songs"""
         # Prepare prompt for Gemini to suggest songs for extreme ends of filters
         prompt = self._create_filter_extreme_prompt(liked_songs)
         
         # Generate suggestions
         try:
-            response = self.model.generate_content(prompt)
-            print("Gemini API Response for Filter Extremes:", response.text)
-            suggestions = self._parse_filter_extreme_suggestions(response.text)
-            print("Parsed Filter Extreme Suggestions:", suggestions)
+            with self.gemini_breaker.attempt(_gemini_failure):
+                response = self.model.generate_content(prompt)
+            suggestions = self._filter_extreme_candidates(response.text)
             
-            if not suggestions:
-                raise Exception("No valid filter extreme suggestions could be parsed from the AI response.")
-            
-            # Verify songs on Spotify
-            verified_suggestions = []
-            for category in suggestions:
-                verified_category = {
-                    'filter': category['filter'],
-                    'extreme': category['extreme'],
-                    'tracks': []
-                }
-                for rec in category['tracks']:
-                    query = f"track:{rec['title']} artist:{rec['artist']}"
-                    search_results = spotify_service.search_tracks(query, limit=1)
-                    
-                    if search_results:
-                        track = search_results[0]
-                        verified_category['tracks'].append({
-                            'title': track['name'],
-                            'artist': track['artist'],
-                            'uri': track['uri'],
-                            'album': track['album'],
-                            'album_cover': track.get('album_cover', ''),
-                            'release_date': track['release_date'],
-                            'popularity': track['popularity'],
-                            'preview_url': track.get('preview_url'),
-                            'tempo': rec.get('tempo', 'N/A'),
-                            'energy': rec.get('energy', 'N/A'),
-                            'genre': rec.get('genre', 'N/A'),
-                            'mood': rec.get('mood', 'N/A')
-                        })
-                
-                verified_suggestions.append(verified_category)
+            # Verify songs on Spotify, all categories sharing one concurrency limit and time budget
+            verified_suggestions = self._verify_filter_extremes(
+                spotify_service,
+                suggestions,
+                time_budget if time_budget is not None else DEFAULT_FILTER_VERIFY_BUDGET,
+                priority
+            )
             
             print("Verified Filter Extreme Suggestions:", verified_suggestions)
             return verified_suggestions
         except Exception as e:
-            print("Error in filter extreme suggestion process:", str(e))
-            error_msg = str(e)
-            if "API key" in error_msg or "authentication" in error_msg.lower():
-                raise Exception("There seems to be an issue with the Google Gemini AI API key. Please verify your API key in the setup page.")
-            elif "Spotify" in error_msg:
-                raise Exception("Error connecting to Spotify. Please ensure your Spotify account is connected properly via the authentication process.")
-            else:
-                raise Exception(f"Error generating filter extreme suggestions: {error_msg}. Please try again.")
+            raise self._filter_extreme_error(e)
+    
+    async def get_filter_extreme_suggestions_async(self, spotify_service, liked_songs, time_budget=None, priority=INTERACTIVE):
+        """Coroutine form of get_filter_extreme_suggestions for an AsyncSpotifyService"""
+        prompt = self._create_filter_extreme_prompt(liked_songs)
+        try:
+            with self.gemini_breaker.attempt(_gemini_failure):
+                response = await self.model.generate_content_async(prompt)
+            suggestions = self._filter_extreme_candidates(response.text)
+            verified_suggestions = await self._verify_filter_extremes_async(
+                spotify_service,
+                suggestions,
+                time_budget if time_budget is not None else DEFAULT_FILTER_VERIFY_BUDGET,
+                priority
+            )
+            print("Verified Filter Extreme Suggestions:", verified_suggestions)
+            return verified_suggestions
+        except Exception as e:
+            raise self._filter_extreme_error(e)
+    
+    def _filter_extreme_candidates(self, response_text):
+        print("Gemini API Response for Filter Extremes:", response_text)
+        suggestions = self._parse_filter_extreme_suggestions(response_text)
+        print("Parsed Filter Extreme Suggestions:", suggestions)
+        
+        if not suggestions:
+            raise Exception("No valid filter extreme suggestions could be parsed from the AI response.")
+        return suggestions
+    
+    def _filter_extreme_error(self, e):
+        print("Error in filter extreme suggestion process:", str(e))
+        if isinstance(e, CircuitOpenError):
+            return e
+        error_msg = str(e)
+        if "API key" in error_msg or "authentication" in error_msg.lower():
+            return Exception("There seems to be an issue with the Google Gemini AI API key. Please verify your API key in the setup page.")
+        elif "Spotify" in error_msg:
+            return Exception("Error connecting to Spotify. Please ensure your Spotify account is connected properly via the authentication process.")
+        else:
+            return Exception(f"Error generating filter extreme suggestions: {error_msg}. Please try again.")
+    
+    def _verify_filter_extremes(self, spotify_service, suggestions, time_budget, priority=INTERACTIVE):
+        """Verify every category's tracks concurrently, marking categories cut short by the time budget as partial"""
+        # The searches share the budget as their deadline, so those in flight when it ends give up too
+        deadline = Deadline(time_budget)
+        executor = ThreadPoolExecutor(max_workers=self.verify_concurrency)
+        try:
+            lookups = [
+                [(rec, executor.submit(self._search_track, spotify_service, rec, deadline, priority))
+                 for rec in category.get('tracks', [])]
+                for category in suggestions
+            ]
+            wait([future for category_lookups in lookups for _, future in category_lookups], timeout=deadline.remaining())
+        finally:
+            # Abandon searches still queued when the budget runs out
+            executor.shutdown(wait=False, cancel_futures=True)
+        return self._assemble_filter_extremes(suggestions, lookups)
+    
+    async def _verify_filter_extremes_async(self, spotify_service, suggestions, time_budget, priority=INTERACTIVE):
+        """Coroutine form of _verify_filter_extremes; searches still running at the budget are cancelled"""
+        deadline = Deadline(time_budget)
+        semaphore = asyncio.Semaphore(self.async_verify_concurrency)
+        async def search(rec):
+            async with semaphore:
+                return await self._search_track_async(spotify_service, rec, deadline, priority)
+        lookups = [
+            [(rec, asyncio.ensure_future(search(rec))) for rec in category.get('tracks', [])]
+            for category in suggestions
+        ]
+        tasks = [task for category_lookups in lookups for _, task in category_lookups]
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=deadline.remaining())
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        return self._assemble_filter_extremes(suggestions, lookups)
+    
+    def _assemble_filter_extremes(self, suggestions, lookups):
+        """Build each category from its finished lookups (futures or tasks), flagging unfinished or failed ones as partial.
+
+        One failed search only costs its own track; an open Spotify circuit fails the whole request."""
+        verified_suggestions = []
+        for category, category_lookups in zip(suggestions, lookups):
+            verified_category = {
+                'filter': category['filter'],
+                'extreme': category['extreme'],
+                'tracks': [],
+                'partial': False
+            }
+            for rec, lookup in category_lookups:
+                if not lookup.done() or lookup.cancelled():
+                    verified_category['partial'] = True
+                    continue
+                error = lookup.exception()
+                if error is not None:
+                    if isinstance(error, CircuitOpenError):
+                        raise error
+                    print(f"Error verifying {rec.get('title')} by {rec.get('artist')}: {str(error)}")
+                    verified_category['partial'] = True
+                    continue
+                track = lookup.result()
+                if track:
+                    verified_category['tracks'].append({
+                        'title': track['name'],
+                        'artist': track['artist'],
+                        'uri': track['uri'],
+                        'album': track['album'],
+                        'album_cover': track.get('album_cover', ''),
+                        'release_date': track['release_date'],
+                        'popularity': track['popularity'],
+                        'preview_url': track.get('preview_url'),
+                        'tempo': rec.get('tempo', 'N/A'),
+                        'energy': rec.get('energy', 'N/A'),
+                        'genre': rec.get('genre', 'N/A'),
+                        'mood': rec.get('mood', 'N/A')
+                    })
+            verified_suggestions.append(verified_category)
+        return verified_suggestions
     
     def _create_filter_extreme_prompt(self, liked_songs):
         """Create a prompt for the Gemini model to suggest songs at extreme ends of filters"""
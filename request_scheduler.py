@@ -0,0 +1,179 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+
+
+class _ClientState:
+    """Token bucket, Retry-After block and waiting queues for one Spotify app (client_id)"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.refilled_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.lanes = {INTERACTIVE: deque(), BACKGROUND: deque()}
+        # Coroutines waiting via acquire_async; they poll rather than queue, but still count for lane priority
+        self.async_waiting = {INTERACTIVE: 0, BACKGROUND: 0}
+        # Interactive grants made while background requests were waiting, used to stop them starving
+        self.interactive_streak = 0
+
+    def waiting(self, lane):
+        return bool(self.lanes[lane]) or self.async_waiting[lane] > 0
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rate)
+        self.refilled_at = now
+
+    def wait_time(self, now):
+        """Seconds until a request may be sent: the Retry-After block or the bucket deficit"""
+        self.refill(now)
+        blocked = self.blocked_until - now
+        deficit = (1 - self.tokens) / self.rate if self.tokens < 1 else 0
+        return max(blocked, deficit, 0)
+
+
+class RequestScheduler:
+    """Queues Spotify API calls per client_id behind a token bucket that honours Retry-After.
+
+    Spotify rate-limits per app and every user brings their own app, so each client_id gets its own
+    bucket. Waiters are served FIFO within a lane; interactive calls go first, but one background call
+    is let through after every background_share interactive grants so crawls still make progress."""
+
+    def __init__(self, rate=10.0, burst=20, background_share=4, async_poll_interval=0.05):
+        self.rate = rate
+        self.burst = burst
+        self.background_share = background_share
+        # Shortest sleep for a coroutine whose turn has not come yet
+        self.async_poll_interval = async_poll_interval
+        self._clients = {}
+        self._cond = threading.Condition()
+        self._stats = {'granted': 0, 'timeouts': 0, 'rate_limited': 0}
+
+    def _state(self, client_id):
+        state = self._clients.get(client_id)
+        if state is None:
+            state = self._clients[client_id] = _ClientState(self.rate, self.burst)
+        return state
+
+    def _next_lane(self, state):
+        interactive, background = state.waiting(INTERACTIVE), state.waiting(BACKGROUND)
+        if background and (not interactive or state.interactive_streak >= self.background_share):
+            return BACKGROUND
+        return INTERACTIVE if interactive else None
+
+    def _grant(self, state, lane_name):
+        state.tokens -= 1
+        if lane_name == INTERACTIVE and state.waiting(BACKGROUND):
+            state.interactive_streak += 1
+        else:
+            state.interactive_streak = 0
+        self._stats['granted'] += 1
+
+    def acquire(self, client_id, priority=INTERACTIVE, timeout=None):
+        """Block until client_id may send one request; returns False if timeout passes first"""
+        lane_name = BACKGROUND if priority == BACKGROUND else INTERACTIVE
+        ticket = object()
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            state = self._state(client_id)
+            lane = state.lanes[lane_name]
+            lane.append(ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait_for = None
+                    next_lane = self._next_lane(state)
+                    if next_lane == lane_name and lane[0] is ticket:
+                        wait_for = state.wait_time(now)
+                        if wait_for <= 0:
+                            lane.popleft()
+                            ticket = None
+                            self._grant(state, lane_name)
+                            return True
+                    if deadline is not None:
+                        remaining = deadline - now
+                        if remaining <= 0:
+                            self._stats['timeouts'] += 1
+                            return False
+                        wait_for = remaining if wait_for is None else min(wait_for, remaining)
+                    self._cond.wait(wait_for)
+            finally:
+                if ticket is not None:
+                    lane.remove(ticket)
+                # Whoever is now at the head of a queue may be able to go
+                self._cond.notify_all()
+
+    async def acquire_async(self, client_id, priority=INTERACTIVE, timeout=None):
+        """Coroutine form of acquire that sleeps on the event loop instead of blocking a thread.
+        
+        Threads already queued in the same lane go first; lane priority applies as for acquire."""
+        lane_name = BACKGROUND if priority == BACKGROUND else INTERACTIVE
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            state = self._state(client_id)
+            state.async_waiting[lane_name] += 1
+        try:
+            while True:
+                with self._cond:
+                    now = time.monotonic()
+                    wait_for = state.wait_time(now)
+                    my_turn = self._next_lane(state) == lane_name and not state.lanes[lane_name]
+                    if my_turn and wait_for <= 0:
+                        self._grant(state, lane_name)
+                        self._cond.notify_all()
+                        return True
+                wait_for = max(wait_for, self.async_poll_interval)
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        with self._cond:
+                            self._stats['timeouts'] += 1
+                        return False
+                    wait_for = min(wait_for, remaining)
+                await asyncio.sleep(wait_for)
+        finally:
+            with self._cond:
+                state.async_waiting[lane_name] -= 1
+                self._cond.notify_all()
+
+    def penalize(self, client_id, retry_after):
+        """Hold every request for client_id until Retry-After has passed and empty its bucket"""
+        with self._cond:
+            state = self._state(client_id)
+            now = time.monotonic()
+            state.refill(now)
+            state.tokens = min(state.tokens, 0)
+            state.blocked_until = max(state.blocked_until, now + retry_after)
+            self._stats['rate_limited'] += 1
+            self._cond.notify_all()
+
+    def stats(self):
+        """Counters for monitoring: grants, timed-out waits and 429 responses seen"""
+        with self._cond:
+            return dict(self._stats, clients=len(self._clients))
+
+
+def parse_retry_after(value, default=1.0):
+    """Seconds to wait from a Retry-After header; Spotify sends delta-seconds"""
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return default
+
+
+def _build_shared_scheduler():
+    return RequestScheduler(
+        rate=float(os.environ.get('SPOTIFY_RATE_LIMIT_PER_SECOND', 10)),
+        burst=int(os.environ.get('SPOTIFY_RATE_LIMIT_BURST', 20)),
+        background_share=int(os.environ.get('SPOTIFY_BACKGROUND_SHARE', 4))
+    )
+
+
+# Process-wide scheduler shared across requests, so all calls made with one client_id draw from one bucket
+shared_request_scheduler = _build_shared_scheduler()
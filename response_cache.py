@@ -0,0 +1,297 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy.sql import text
+from database import get_session
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteCacheTier:
+    """Second cache tier stored in the application SQLite database, shared by all worker processes"""
+
+    def __init__(self, max_entries=10000, prune_every=100, invalidation_retention=86400):
+        self.max_entries = max_entries
+        # Size bounds are enforced every prune_every writes to keep the write path cheap
+        self.prune_every = prune_every
+        self.invalidation_retention = invalidation_retention
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def get(self, namespace, key, expiry):
+        """Return (stored_at, data) for an entry younger than expiry seconds, otherwise None"""
+        now = time.time()
+        session = get_session()
+        try:
+            row = session.execute(text('''
+                SELECT payload, stored_at FROM spotify_cache
+                WHERE namespace = :namespace AND cache_key = :key AND expires_at > :now AND stored_at > :oldest
+            '''), {'namespace': namespace, 'key': key, 'now': now, 'oldest': now - expiry}).fetchone()
+            if row is None:
+                return None
+            return row.stored_at, json.loads(row.payload)
+        finally:
+            session.close()
+
+    def set(self, namespace, key, data, expiry, stored_at=None):
+        """Store data with its TTL, replacing any previous value for the key"""
+        stored_at = stored_at if stored_at is not None else time.time()
+        session = get_session()
+        try:
+            session.execute(text('''
+                INSERT OR REPLACE INTO spotify_cache (namespace, cache_key, payload, stored_at, expires_at)
+                VALUES (:namespace, :key, :payload, :stored_at, :expires_at)
+            '''), {'namespace': namespace, 'key': key, 'payload': json.dumps(data),
+                   'stored_at': stored_at, 'expires_at': stored_at + expiry})
+            session.commit()
+        finally:
+            session.close()
+        with self._lock:
+            self._writes += 1
+            should_prune = self._writes % self.prune_every == 0
+        if should_prune:
+            self.prune()
+
+    def invalidate(self, namespace, endpoint=None):
+        """Delete entries for an endpoint (any params) or a whole namespace and log it for other workers"""
+        now = time.time()
+        session = get_session()
+        try:
+            if endpoint is None:
+                session.execute(text('DELETE FROM spotify_cache WHERE namespace = :namespace'), {'namespace': namespace})
+            else:
+                escaped = endpoint.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                session.execute(text('''
+                    DELETE FROM spotify_cache
+                    WHERE namespace = :namespace AND (cache_key = :endpoint OR cache_key LIKE :prefix ESCAPE '\\')
+                '''), {'namespace': namespace, 'endpoint': endpoint, 'prefix': escaped + ':%'})
+            session.execute(text('''
+                INSERT INTO spotify_cache_invalidations (namespace, endpoint, created_at)
+                VALUES (:namespace, :endpoint, :now)
+            '''), {'namespace': namespace, 'endpoint': endpoint, 'now': now})
+            session.commit()
+        finally:
+            session.close()
+
+    def invalidations_since(self, last_id):
+        """Return (id, namespace, endpoint) rows logged after last_id, oldest first"""
+        session = get_session()
+        try:
+            rows = session.execute(text('''
+                SELECT id, namespace, endpoint FROM spotify_cache_invalidations
+                WHERE id > :last_id ORDER BY id
+            '''), {'last_id': last_id}).fetchall()
+            return [(row.id, row.namespace, row.endpoint) for row in rows]
+        finally:
+            session.close()
+
+    def latest_invalidation_id(self):
+        session = get_session()
+        try:
+            return session.execute(text('SELECT COALESCE(MAX(id), 0) FROM spotify_cache_invalidations')).scalar()
+        finally:
+            session.close()
+
+    def prune(self):
+        """Drop expired entries, then the oldest entries beyond max_entries"""
+        now = time.time()
+        session = get_session()
+        try:
+            session.execute(text('DELETE FROM spotify_cache WHERE expires_at <= :now'), {'now': now})
+            session.execute(text('''
+                DELETE FROM spotify_cache WHERE rowid IN (
+                    SELECT rowid FROM spotify_cache ORDER BY stored_at DESC LIMIT -1 OFFSET :max_entries
+                )
+            '''), {'max_entries': self.max_entries})
+            session.execute(text('DELETE FROM spotify_cache_invalidations WHERE created_at <= :cutoff'),
+                            {'cutoff': now - self.invalidation_retention})
+            session.commit()
+        finally:
+            session.close()
+
+
+class ResponseCache:
+    """Thread-safe TTL + LRU cache for Spotify API responses, shared by every SpotifyService in the process"""
+
+    def __init__(self, max_entries=1000, l2=None, invalidation_poll_interval=1.0):
+        self.max_entries = max_entries
+        # Optional shared tier consulted on local misses and kept in sync on writes and invalidations
+        self.l2 = l2
+        self.invalidation_poll_interval = invalidation_poll_interval
+        # (namespace, key) -> (stored_at, data); ordered from least to most recently used
+        self._entries = OrderedDict()
+        # namespace -> set of keys, so a single user's entries can be dropped without a full scan
+        self._namespaces = {}
+        self._lock = threading.Lock()
+        self._last_invalidation_id = None
+        self._last_invalidation_poll = 0.0
+        self.hits = 0
+        self.l2_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, namespace, key, expiry):
+        """Return cached data if present and younger than expiry seconds, otherwise None"""
+        entry = self.lookup(namespace, key, expiry)
+        return None if entry is None else entry[1]
+
+    def lookup(self, namespace, key, expiry, max_age=None):
+        """Return (age, data) for an entry younger than max_age seconds (expiry by default), otherwise None.
+
+        An entry older than expiry is stale; callers that accept one decide whether to serve it at once
+        while they refresh it or only if the refresh fails."""
+        max_age = expiry if max_age is None else max(expiry, max_age)
+        self._poll_invalidations()
+        now = time.time()
+        found = None
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is not None:
+                stored_at, data = entry
+                if now - stored_at < expiry:
+                    self._entries.move_to_end((namespace, key))
+                    self.hits += 1
+                    return now - stored_at, data
+                if now - stored_at < max_age:
+                    found = entry
+                else:
+                    # Remove expired cache entry
+                    self._remove(namespace, key)
+        if self.l2 is not None:
+            try:
+                shared = self.l2.get(namespace, key, max_age)
+            except Exception as e:
+                logger.error(f"Shared cache read failed for {key}: {e}")
+                shared = None
+            # Another worker may hold a newer copy of an entry that went stale here
+            if shared is not None and (found is None or shared[0] > found[0]):
+                stored_at, data = shared
+                with self._lock:
+                    self._store(namespace, key, data, stored_at)
+                    if now - stored_at < expiry:
+                        self.l2_hits += 1
+                        return now - stored_at, data
+                found = shared
+        with self._lock:
+            if found is None:
+                self.misses += 1
+                return None
+            self.stale_hits += 1
+        return now - found[0], found[1]
+
+    def set(self, namespace, key, data, expiry=None):
+        """Store data for a key, evicting the least recently used entry when full"""
+        stored_at = time.time()
+        with self._lock:
+            self._store(namespace, key, data, stored_at)
+        if self.l2 is not None and expiry is not None:
+            try:
+                self.l2.set(namespace, key, data, expiry, stored_at)
+            except Exception as e:
+                logger.error(f"Shared cache write failed for {key}: {e}")
+
+    def invalidate(self, namespace, endpoint=None):
+        """Drop cached responses for an endpoint (any params) or, without an endpoint, everything for the namespace"""
+        self._invalidate_local(namespace, endpoint)
+        if self.l2 is not None:
+            try:
+                self.l2.invalidate(namespace, endpoint)
+            except Exception as e:
+                logger.error(f"Shared cache invalidation failed for {namespace}: {e}")
+
+    def clear(self):
+        """Remove every in-memory entry and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self._namespaces.clear()
+            self.hits = 0
+            self.l2_hits = 0
+            self.stale_hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        """Return hit/miss/eviction counters and the current size"""
+        with self._lock:
+            lookups = self.hits + self.l2_hits + self.stale_hits + self.misses
+            return {
+                'hits': self.hits,
+                'l2_hits': self.l2_hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'hit_rate': (self.hits + self.l2_hits) / lookups if lookups else 0.0
+            }
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _store(self, namespace, key, data, stored_at):
+        if (namespace, key) in self._entries:
+            self._entries.move_to_end((namespace, key))
+        self._entries[(namespace, key)] = (stored_at, data)
+        self._namespaces.setdefault(namespace, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            (old_namespace, old_key), _ = self._entries.popitem(last=False)
+            self._discard_from_namespace(old_namespace, old_key)
+            self.evictions += 1
+
+    def _invalidate_local(self, namespace, endpoint=None):
+        with self._lock:
+            keys = list(self._namespaces.get(namespace, ()))
+            for key in keys:
+                if endpoint is None or key == endpoint or key.startswith(endpoint + ':'):
+                    self._remove(namespace, key)
+
+    def _poll_invalidations(self):
+        """Apply invalidations logged by other workers, at most once per poll interval"""
+        if self.l2 is None:
+            return
+        now = time.time()
+        with self._lock:
+            if now - self._last_invalidation_poll < self.invalidation_poll_interval:
+                return
+            self._last_invalidation_poll = now
+            last_id = self._last_invalidation_id
+        try:
+            if last_id is None:
+                # Nothing is cached locally yet, so earlier invalidations are irrelevant
+                self._last_invalidation_id = self.l2.latest_invalidation_id()
+                return
+            rows = self.l2.invalidations_since(last_id)
+        except Exception as e:
+            logger.error(f"Failed to read shared cache invalidations: {e}")
+            return
+        for row_id, namespace, endpoint in rows:
+            self._invalidate_local(namespace, endpoint)
+            self._last_invalidation_id = row_id
+
+    def _remove(self, namespace, key):
+        self._entries.pop((namespace, key), None)
+        self._discard_from_namespace(namespace, key)
+
+    def _discard_from_namespace(self, namespace, key):
+        keys = self._namespaces.get(namespace)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._namespaces[namespace]
+
+
+def _build_shared_cache():
+    l2 = None
+    # The shared tier is opt-in since it adds a SQLite round trip to every local miss
+    if os.environ.get('SPOTIFY_CACHE_L2', '').lower() in ('1', 'true', 'yes'):
+        l2 = SQLiteCacheTier(max_entries=int(os.environ.get('SPOTIFY_CACHE_L2_MAX_ENTRIES', 10000)))
+    return ResponseCache(max_entries=int(os.environ.get('SPOTIFY_CACHE_MAX_ENTRIES', 1000)), l2=l2)
+
+
+# Process-wide cache shared across requests, since routes build a new SpotifyService per request
+shared_response_cache = _build_shared_cache()
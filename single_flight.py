@@ -0,0 +1,87 @@
+import asyncio
+import threading
+import weakref
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent identical calls: while one is in flight for a key, callers with the same key
+    wait for it and get its result (or exception) instead of making their own.
+
+    Threads share flights through do(); coroutines share them per event loop through do_async()."""
+
+    def __init__(self):
+        self._flights = {}
+        # Event loop -> {key: task}; asyncio tasks can only be awaited on the loop that runs them
+        self._async_flights = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'coalesced': 0}
+
+    def do(self, key, fn, timeout=None):
+        """Return fn(), or the result of the identical call already in flight.
+
+        A caller that joins a flight raises TimeoutError if it is still running after timeout seconds."""
+        with self._lock:
+            self._stats['calls'] += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self._stats['coalesced'] += 1
+        if not leader:
+            if not flight.done.wait(timeout):
+                raise TimeoutError(f"Timed out waiting for an identical call in flight for {key}")
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = fn()
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    async def do_async(self, key, factory, timeout=None):
+        """Await factory(), or the identical call already in flight on this loop.
+
+        The call runs as its own task, so a caller that is cancelled or times out (asyncio.TimeoutError)
+        does not cancel it for the others."""
+        loop = asyncio.get_running_loop()
+        flights = self._async_flights.setdefault(loop, {})
+        task = flights.get(key)
+        with self._lock:
+            self._stats['calls'] += 1
+            if task is not None:
+                self._stats['coalesced'] += 1
+        if task is None:
+            task = flights[key] = loop.create_task(factory())
+
+            def finished(task):
+                if flights.get(key) is task:
+                    del flights[key]
+                # Mark the exception retrieved even if every caller gave up waiting
+                if not task.cancelled():
+                    task.exception()
+            task.add_done_callback(finished)
+        return await asyncio.wait_for(asyncio.shield(task), timeout)
+
+    def stats(self):
+        """Call counts, how many joined a call already in flight, and how many are in flight now"""
+        with self._lock:
+            in_flight = len(self._flights) + sum(len(flights) for flights in self._async_flights.values())
+            return dict(self._stats, in_flight=in_flight)
+
+
+# Process-wide flights for Spotify GETs, shared by every SpotifyService and AsyncSpotifyService
+shared_single_flight = SingleFlight()
@@ -5,30 +5,152 @@ import urllib.parse
 import hashlib
 import secrets
 import string
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlencode
+from response_cache import shared_response_cache
+from http_client import get_http_session, RETRY_STATUS_CODES, RETRY_METHODS
+from request_scheduler import shared_request_scheduler, parse_retry_after, INTERACTIVE, BACKGROUND
+from deadline import remaining, expired
+from circuit_breaker import shared_circuit_breakers, CircuitOpenError
+from single_flight import shared_single_flight
+
+# Refresh the access token this many seconds before its recorded expiry instead of waiting for a 401
+DEFAULT_TOKEN_REFRESH_MARGIN = int(os.environ.get('SPOTIFY_TOKEN_REFRESH_MARGIN', 60))
+# Calls taking this long count as slow towards opening a Spotify circuit breaker
+DEFAULT_SLOW_CALL_SECONDS = float(os.environ.get('SPOTIFY_SLOW_CALL_SECONDS', 5))
+# For slowly changing data (profile, playlists, genre seeds), a response this many seconds past its TTL is
+# served at once while it is refreshed in the background
+DEFAULT_STALE_WHILE_REVALIDATE = float(os.environ.get('SPOTIFY_CACHE_STALE_WHILE_REVALIDATE', 3600))
+# ...and one up to this many seconds past its TTL is still served when the refresh fails
+DEFAULT_STALE_IF_ERROR = float(os.environ.get('SPOTIFY_CACHE_STALE_IF_ERROR', 86400))
+
+# Refreshes are single-flight per user across threads and event loops: one lock per cache namespace, plus
+# the newest tokens each refresh produced so callers queued behind it adopt them instead of refreshing again
+_refresh_locks = {}
+_refresh_locks_guard = threading.Lock()
+# cache namespace -> (tokens, expires_at). The tokens are plaintext, so an entry is kept only until its access
+# token expires, for at most this many users, and dropped on logout
+DEFAULT_LATEST_TOKENS_SIZE = int(os.environ.get('SPOTIFY_LATEST_TOKENS_SIZE', 1000))
+_latest_tokens = OrderedDict()
+_latest_tokens_lock = threading.Lock()
+
+def _refresh_lock(key):
+    with _refresh_locks_guard:
+        return _refresh_locks.setdefault(key, threading.Lock())
+
+def _remember_tokens(key, tokens):
+    now = time.time()
+    with _latest_tokens_lock:
+        _latest_tokens[key] = (dict(tokens), tokens.get('expires_at') or now + 3600)
+        _latest_tokens.move_to_end(key)
+        # Entries are added in roughly expiry order, so expired ones collect at the front
+        while _latest_tokens and (len(_latest_tokens) > DEFAULT_LATEST_TOKENS_SIZE or next(iter(_latest_tokens.values()))[1] <= now):
+            _latest_tokens.popitem(last=False)
+
+def _recent_tokens(key):
+    """The newest refreshed tokens for a cache namespace, or None once they have expired"""
+    with _latest_tokens_lock:
+        entry = _latest_tokens.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.time():
+            del _latest_tokens[key]
+            return None
+        return dict(entry[0])
+
+def purge_user_tokens(user_id):
+    """Forget the refreshed tokens kept in memory for a user, e.g. on logout"""
+    with _latest_tokens_lock:
+        _latest_tokens.pop(str(user_id), None)
+
+# Background refreshes of stale cache entries, at most one in flight per (namespace, cache key)
+_revalidation_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('SPOTIFY_CACHE_REVALIDATE_WORKERS', 2)),
+                                            thread_name_prefix='spotify-revalidate')
+_revalidating = set()
+_revalidating_guard = threading.Lock()
+
+def _start_revalidation(key):
+    """Claim the refresh of a cache entry, returning False if one is already running"""
+    with _revalidating_guard:
+        if key in _revalidating:
+            return False
+        _revalidating.add(key)
+        return True
+
+def _finish_revalidation(key):
+    with _revalidating_guard:
+        _revalidating.discard(key)
+
+def endpoint_family(endpoint):
+    """Circuit breaker family of a Web API endpoint: search, playlists, or library for the user's library and other reads"""
+    if endpoint.startswith('search'):
+        return 'search'
+    if 'playlists' in endpoint:
+        return 'playlists'
+    return 'library'
+
+# Longest a single Spotify HTTP call may take; a request deadline can only shorten it
+HTTP_TIMEOUT = 10
+
+def _cut_by_deadline(deadline, timeout):
+    """Whether a call's timeout came from our own deadline rather than the HTTP_TIMEOUT cap"""
+    return deadline is not None and (timeout < HTTP_TIMEOUT or expired(deadline))
+
+def _network_failure(e, deadline=None, timeout=None):
+    # Timeouts and connection errors count against the breaker; bugs in our own code do not, and neither do
+    # timeouts our deadline cut short, which say nothing about Spotify's health and are judged by latency instead
+    if isinstance(e, requests.exceptions.Timeout) and _cut_by_deadline(deadline, timeout):
+        return False
+    return isinstance(e, requests.exceptions.RequestException)
 
 class SpotifyService:
-    def __init__(self, client_id=None, client_secret=None, tokens=None):
+    def __init__(self, client_id=None, client_secret=None, tokens=None, user_id=None, on_token_refresh=None):
         self.client_id = client_id
         self.client_secret = client_secret
+        # Application user the tokens belong to, used to namespace the shared response cache
+        self.user_id = user_id
         base_url = os.environ.get('BASE_URL', 'http://127.0.0.1:8888')
         if base_url == 'http://localhost:8080':
             base_url = 'http://127.0.0.1:8888'
         self.redirect_uri = base_url + '/callback'
         self.tokens = tokens
+        # Called with the updated tokens after a refresh so the caller can persist them
+        self.on_token_refresh = on_token_refresh
+        self._token_refresh_margin = DEFAULT_TOKEN_REFRESH_MARGIN
         self.base_url = 'https://api.spotify.com/v1'
-        # In-memory cache for API responses
-        self._cache = {}
+        # Process-wide keep-alive session so calls reuse pooled connections instead of new TLS handshakes
+        self._http = get_http_session()
+        # Calls with a deadline skip transport retries, which would each wait the full timeout, and retry 5xx in _send
+        self._deadline_http = get_http_session(retries=False)
+        self._server_error_retries = int(os.environ.get('SPOTIFY_HTTP_MAX_RETRIES', 3))
+        self._server_error_backoff = float(os.environ.get('SPOTIFY_HTTP_BACKOFF', 0.3))
+        # Process-wide cache for API responses, shared by all instances
+        self._cache = shared_response_cache
         # Default cache expiration time in seconds (5 minutes)
         self._default_cache_expiry = 300
         # Extended cache expiration for less frequently changing data (1 hour)
         self._extended_cache_expiry = 3600
-        # Track cache timestamps
-        self._cache_timestamps = {}
-        # Maximum cache size to prevent memory issues
-        self._max_cache_size = 1000
+        self._stale_while_revalidate = DEFAULT_STALE_WHILE_REVALIDATE
+        self._stale_if_error = DEFAULT_STALE_IF_ERROR
         # Store code verifier for PKCE
         self._code_verifier = None
+        # Parallel page fetches when crawling large libraries and playlist lists
+        self._pagination_concurrency = int(os.environ.get('SPOTIFY_PAGINATION_CONCURRENCY', 4))
+        # Extra attempts for a page that fails during a concurrent crawl
+        self._page_retries = 2
+        # Per-client_id rate limiting shared by every instance in the process
+        self._scheduler = shared_request_scheduler
+        # Longest a call may queue for the rate limit (including Retry-After) before it is dropped
+        self._max_queue_wait = float(os.environ.get('SPOTIFY_MAX_QUEUE_WAIT', 30))
+        # Times a call is re-sent after a 429 before giving up
+        self._rate_limit_retries = 3
+        # Per endpoint family breakers shared by every instance in the process
+        self._circuit_breakers = shared_circuit_breakers
+        # Concurrent identical GETs for the same user share one upstream call
+        self._single_flight = shared_single_flight
     
     def get_auth_url(self, state=None):
         """Generate the Spotify authorization URL with PKCE"""
@@ -81,7 +203,7 @@ class SpotifyService:
             'code_verifier': verifier
         }
         
-        response = requests.post('https://accounts.spotify.com/api/token', headers=headers, data=data)
+        response = self._post_token(headers, data)
         
         if response.status_code != 200:
             return None
@@ -89,18 +211,58 @@ class SpotifyService:
         # Clear the code verifier after use if it was set in this instance
         if not code_verifier:
             self._code_verifier = None
-        return response.json()
+        tokens = response.json()
+        if 'expires_in' in tokens:
+            tokens['expires_at'] = time.time() + tokens['expires_in']
+        return tokens
     
     def refresh_token(self):
         """Refresh the access token using the refresh token"""
+        if not self._can_refresh():
+            return False
+        headers, data = self._refresh_request()
+        
+        key = self._cache_namespace()
+        with _refresh_lock(key):
+            # Another request may have refreshed while this one waited; reuse its token rather than refreshing twice
+            if self._adopt_latest_tokens(key):
+                return True
+            
+            try:
+                response = self._post_token(headers, data)
+                if response.status_code != 200:
+                    print(f"Error: Token refresh failed with status {response.status_code}. Response: {response.text}")
+                    return False
+                self._store_refreshed_tokens(key, response.json())
+            except Exception as e:
+                print(f"Error during token refresh: {str(e)}")
+                return False
+            
+            # Persist while still holding the lock so the stored tokens never go backwards
+            self._persist_tokens()
+            return True
+    
+    def _breaker(self, family):
+        return self._circuit_breakers.get(f'spotify:{family}', slow_call_duration=DEFAULT_SLOW_CALL_SECONDS)
+    
+    def _post_token(self, headers, data):
+        """POST to the accounts service token endpoint through the token circuit breaker"""
+        with self._breaker('token').attempt(_network_failure) as call:
+            response = self._http.post('https://accounts.spotify.com/api/token', headers=headers, data=data, timeout=10)
+            call.failed = response.status_code >= 500
+            return response
+    
+    def _can_refresh(self):
         if not self.tokens or 'refresh_token' not in self.tokens:
             print("Error: No refresh token available for token refresh.")
             return False
-        
         if not self.client_id or not self.client_secret:
             print("Error: Spotify client credentials not configured for token refresh.")
             return False
-            
+        return True
+    
+    def _refresh_request(self):
+        """Headers and form body for a refresh_token grant"""
         auth_header = base64.b64encode(f"{self.client_id}:{self.client_secret}".encode()).decode()
         headers = {
             'Authorization': f'Basic {auth_header}',
@@ -110,22 +272,35 @@ class SpotifyService:
             'grant_type': 'refresh_token',
             'refresh_token': self.tokens['refresh_token']
         }
-        
-        try:
-            response = requests.post('https://accounts.spotify.com/api/token', headers=headers, data=data)
-            if response.status_code != 200:
-                print(f"Error: Token refresh failed with status {response.status_code}. Response: {response.text}")
-                return False
-            
-            new_tokens = response.json()
-            self.tokens['access_token'] = new_tokens['access_token']
-            if 'refresh_token' in new_tokens:
-                self.tokens['refresh_token'] = new_tokens['refresh_token']
-            print("Token refresh successful.")
+        return headers, data
+    
+    def _adopt_latest_tokens(self, key):
+        latest = _recent_tokens(key)
+        if latest and latest['access_token'] != self.tokens.get('access_token') and not self._token_expiring(latest):
+            self.tokens.update(latest)
             return True
-        except Exception as e:
-            print(f"Error during token refresh: {str(e)}")
-            return False
+        return False
+    
+    def _store_refreshed_tokens(self, key, new_tokens):
+        self.tokens['access_token'] = new_tokens['access_token']
+        if 'refresh_token' in new_tokens:
+            self.tokens['refresh_token'] = new_tokens['refresh_token']
+        if 'expires_in' in new_tokens:
+            self.tokens['expires_at'] = time.time() + new_tokens['expires_in']
+        _remember_tokens(key, self.tokens)
+        print("Token refresh successful.")
+    
+    def _persist_tokens(self):
+        if self.on_token_refresh:
+            try:
+                self.on_token_refresh(dict(self.tokens))
+            except Exception as e:
+                print(f"Error saving refreshed tokens: {str(e)}")
+    
+    def _token_expiring(self, tokens):
+        """Whether tokens are within the refresh margin of their recorded expiry"""
+        expires_at = tokens.get('expires_at')
+        return bool(expires_at) and time.time() >= expires_at - self._token_refresh_margin
     
     def _get_cache_key(self, endpoint, params=None):
         """Generate a unique cache key based on endpoint and parameters"""
@@ -136,73 +311,190 @@ class SpotifyService:
             key += ":" + urllib.parse.urlencode(sorted_params)
         return key
 
-    def _get_from_cache(self, key, expiry=None):
-        """Retrieve data from cache if it exists and is not expired"""
-        import time
-        if key in self._cache:
-            timestamp = self._cache_timestamps.get(key, 0)
-            expiry_time = expiry if expiry is not None else self._default_cache_expiry
-            if time.time() - timestamp < expiry_time:
-                return self._cache[key]
-            else:
-                # Remove expired cache entry
-                del self._cache[key]
-                del self._cache_timestamps[key]
-        return None
+    def _cache_namespace(self):
+        """Identify whose data a cache entry holds, so users never see each other's responses"""
+        if self.user_id:
+            return str(self.user_id)
+        # Fall back to a digest of the refresh token, which is stable for a Spotify user across access tokens
+        token = (self.tokens or {}).get('refresh_token') or (self.tokens or {}).get('access_token') or ''
+        return 'token:' + hashlib.sha256(token.encode()).hexdigest()
+
+    def _set_to_cache(self, key, data, expiry=None, stale_ok=False):
+        """Store data in the shared cache; the cache evicts least recently used entries when full"""
+        expiry_time = expiry if expiry is not None else self._default_cache_expiry
+        # Entries that may be served stale are kept for as long as they may be; the rest only until they expire
+        if stale_ok:
+            expiry_time += self._max_staleness()
+        self._cache.set(self._cache_namespace(), key, data, expiry_time)
+
+    def _max_staleness(self):
+        return max(self._stale_while_revalidate, self._stale_if_error)
+
+    def _lookup_cache(self, key, expiry, stale_ok=False):
+        """Return (data, stale) for a cached GET, or (None, None) on a miss.
+
+        Without stale_ok only fresh entries count. With it, stale is 'revalidate' for an entry within the
+        stale-while-revalidate window, to be served now and refreshed in the background, and 'if-error' for
+        an older one within the stale-if-error limit, to be served only if refetching it fails."""
+        max_age = expiry + self._max_staleness() if stale_ok else expiry
+        entry = self._cache.lookup(self._cache_namespace(), key, expiry, max_age)
+        if entry is None:
+            return None, None
+        age, data = entry
+        if age < expiry:
+            return data, None
+        if age < expiry + self._stale_while_revalidate:
+            return data, 'revalidate'
+        return data, 'if-error' if age < expiry + self._stale_if_error else None
 
-    def _set_to_cache(self, key, data, expiry=None):
-        """Store data in cache with a timestamp, limit cache size"""
-        import time
-        # Limit cache size by removing oldest entries if necessary
-        if len(self._cache) >= self._max_cache_size:
-            oldest_key = min(self._cache_timestamps, key=lambda k: self._cache_timestamps[k])
-            del self._cache[oldest_key]
-            del self._cache_timestamps[oldest_key]
-        self._cache[key] = data
-        self._cache_timestamps[key] = time.time()
+    def _invalidate_cache(self, endpoint):
+        """Drop cached responses for an endpoint regardless of the params they were fetched with"""
+        self._cache.invalidate(self._cache_namespace(), endpoint)
 
-    def make_api_request(self, endpoint, method='GET', data=None, params=None, cache_expiry=None):
-        """Make a request to the Spotify API with automatic token refresh and caching for GET requests"""
+    def _send(self, method, url, headers, params=None, data=None, priority=INTERACTIVE, deadline=None, family='library'):
+        """Send one call through the client_id's rate-limit queue, re-queueing after a 429 for Retry-After.
+        
+        With a deadline, queueing, the HTTP call and any retries together never outlast it. Raises
+        CircuitOpenError without queueing while the family's circuit is open."""
+        client_key = self.client_id or 'default'
+        breaker = self._breaker(family)
+        http = self._http if deadline is None else self._deadline_http
+        response = None
+        server_errors = 0
+        rate_limits = 0
+        while True:
+            if expired(deadline):
+                print("Error: Request deadline passed, dropping Spotify request.")
+                return None
+            breaker.check()
+            if not self._scheduler.acquire(client_key, priority, timeout=remaining(deadline, self._max_queue_wait)):
+                print(f"Error: Waited over {remaining(deadline, self._max_queue_wait):.1f}s for the Spotify rate limit, dropping request.")
+                return None
+            timeout = remaining(deadline, HTTP_TIMEOUT)
+            with breaker.attempt(lambda e: _network_failure(e, deadline, timeout)) as call:
+                if method == 'GET':
+                    response = http.get(url, headers=headers, params=params, timeout=timeout)
+                elif method == 'POST':
+                    response = http.post(url, headers=headers, json=data, timeout=timeout)
+                else:
+                    response = http.put(url, headers=headers, json=data, timeout=timeout)
+                call.failed = response.status_code >= 500
+            if deadline is not None and response.status_code in RETRY_STATUS_CODES and method in RETRY_METHODS \
+                    and server_errors < self._server_error_retries:
+                backoff = self._server_error_backoff * (2 ** server_errors)
+                # Retry only while the backoff leaves time for another attempt
+                if backoff < deadline.remaining():
+                    time.sleep(backoff)
+                    server_errors += 1
+                    continue
+            if response.status_code != 429:
+                return response
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            self._scheduler.penalize(client_key, retry_after)
+            if retry_after > remaining(deadline, self._max_queue_wait) or rate_limits >= self._rate_limit_retries:
+                return response
+            rate_limits += 1
+            print(f"Rate limited by Spotify, retrying in {retry_after}s.")
+    
+    def make_api_request(self, endpoint, method='GET', data=None, params=None, cache_expiry=None, use_cache=True,
+                         priority=INTERACTIVE, deadline=None, stale_ok=False):
+        """Make a request to the Spotify API with automatic token refresh and caching for GET requests.
+        
+        priority is INTERACTIVE for calls a user is waiting on or BACKGROUND for bulk work such as library crawls.
+        deadline is the caller's Deadline, if any; the call gives up with None once it passes. Raises
+        CircuitOpenError while Spotify is failing for this endpoint family. stale_ok opts a GET of slowly
+        changing data into stale-while-revalidate and stale-if-error caching."""
         if not self.tokens:
             print("Error: No tokens available for API request.")
             return None
         
         # For GET requests, check cache first
-        if method == 'GET':
+        stale_response = None
+        if method == 'GET' and use_cache:
             cache_key = self._get_cache_key(endpoint, params)
             # Use provided cache expiry or default to standard expiry
             expiry = cache_expiry if cache_expiry is not None else self._default_cache_expiry
-            cached_response = self._get_from_cache(cache_key, expiry)
-            if cached_response is not None:
+            cached_response, stale = self._lookup_cache(cache_key, expiry, stale_ok)
+            if cached_response is not None and stale is None:
+                return cached_response
+            if stale == 'revalidate':
+                self._revalidate(endpoint, params, cache_key, expiry)
                 return cached_response
+            # Too old to serve without asking Spotify first, but better than nothing if that fails
+            stale_response = cached_response
+        
+        try:
+            response_data = self._fetch_shared(endpoint, method, data, params, priority, deadline)
+        except CircuitOpenError:
+            if stale_response is None:
+                raise
+            response_data = None
+        if response_data is None:
+            if stale_response is not None:
+                print(f"Serving a stale cached response for {endpoint} since Spotify did not answer.")
+            return stale_response
+        
+        # Cache successful GET responses
+        if method == 'GET' and use_cache:
+            self._set_to_cache(cache_key, response_data, expiry, stale_ok)
+        return response_data
+    
+    def _revalidate(self, endpoint, params, cache_key, expiry):
+        """Refresh a stale cache entry on a background thread unless a refresh is already running"""
+        key = (self._cache_namespace(), cache_key)
+        if not _start_revalidation(key):
+            return
+        
+        def refresh():
+            try:
+                response_data = self._fetch_shared(endpoint, 'GET', None, params, BACKGROUND, None)
+                if response_data is not None:
+                    self._set_to_cache(cache_key, response_data, expiry, stale_ok=True)
+            except Exception as e:
+                print(f"Error refreshing cached {endpoint}: {str(e)}")
+            finally:
+                _finish_revalidation(key)
+        _revalidation_executor.submit(refresh)
+    
+    def _fetch_shared(self, endpoint, method, data, params, priority, deadline):
+        """_fetch, with a GET joining an identical one already in flight for this user instead of sending its own"""
+        if method != 'GET':
+            return self._fetch(endpoint, method, data, params, priority, deadline)
+        key = (self._cache_namespace(), self._get_cache_key(endpoint, params))
+        try:
+            return self._single_flight.do(key, lambda: self._fetch(endpoint, method, data, params, priority, deadline),
+                                          timeout=remaining(deadline))
+        except TimeoutError:
+            print("Error: Request deadline passed waiting for an identical Spotify request, dropping it.")
+            return None
+    
+    def _fetch(self, endpoint, method, data, params, priority, deadline):
+        """Send an API request, refreshing the token on a 401, and return the JSON body or None on failure"""
+        # Refresh ahead of expiry so the request doesn't spend a round trip on a 401
+        if self._token_expiring(self.tokens):
+            self.refresh_token()
         
         url = f"{self.base_url}/{endpoint}"
         headers = {'Authorization': f"Bearer {self.tokens['access_token']}"}
         
         try:
-            if method == 'GET':
-                response = requests.get(url, headers=headers, params=params, timeout=10)
-            elif method == 'POST':
-                headers['Content-Type'] = 'application/json'
-                response = requests.post(url, headers=headers, json=data, timeout=10)
-            elif method == 'PUT':
-                headers['Content-Type'] = 'application/json'
-                response = requests.put(url, headers=headers, json=data, timeout=10)
-            else:
+            if method not in ('GET', 'POST', 'PUT'):
                 print(f"Error: Unsupported HTTP method {method}.")
                 return None
+            if method != 'GET':
+                headers['Content-Type'] = 'application/json'
+            response = self._send(method, url, headers, params, data, priority, deadline, endpoint_family(endpoint))
+            if response is None:
+                return None
             
             # If token expired, attempt refresh and retry once
             if response.status_code == 401:
                 print("Token expired, attempting refresh.")
                 if self.refresh_token():
                     headers['Authorization'] = f"Bearer {self.tokens['access_token']}"
-                    if method == 'GET':
-                        response = requests.get(url, headers=headers, params=params, timeout=10)
-                    elif method == 'POST':
-                        response = requests.post(url, headers=headers, json=data, timeout=10)
-                    elif method == 'PUT':
-                        response = requests.put(url, headers=headers, json=data, timeout=10)
+                    response = self._send(method, url, headers, params, data, priority, deadline, endpoint_family(endpoint))
+                    if response is None:
+                        return None
                     if response.status_code not in (200, 201):
                         print(f"Error: Retried API request after token refresh failed with status {response.status_code}. Response: {response.text}")
                         return None
@@ -214,13 +506,9 @@ class SpotifyService:
                 print(f"Error: API request failed with status {response.status_code}. Response: {response.text}")
                 return None
             
-            response_data = response.json()
-            # Cache successful GET responses
-            if method == 'GET':
-                expiry = cache_expiry if cache_expiry is not None else self._default_cache_expiry
-                self._set_to_cache(cache_key, response_data, expiry)
-            
-            return response_data
+            return response.json()
+        except CircuitOpenError:
+            raise
         except requests.exceptions.RequestException as e:
             print(f"Network error during API request: {str(e)}")
             return None
@@ -232,47 +520,92 @@ class SpotifyService:
         """Get the current user's profile, use extended cache as profile data changes infrequently"""
         if access_token:
             headers = {'Authorization': f"Bearer {access_token}"}
-            response = requests.get(f"{self.base_url}/me", headers=headers)
+            response = self._http.get(f"{self.base_url}/me", headers=headers, timeout=10)
             if response.status_code != 200:
                 return None
             return response.json()
         
-        return self.make_api_request('me', cache_expiry=self._extended_cache_expiry)
+        return self.make_api_request('me', cache_expiry=self._extended_cache_expiry, stale_ok=True)
     
-    def get_liked_songs(self, limit=50):
-        """Get the user's liked songs"""
-        songs = []
-        offset = 0
+    def _parse_saved_track(self, item):
+        """Flatten a saved-track item from me/tracks into the fields the app uses"""
+        track = item['track']
+        artists = [artist['name'] for artist in track['artists']]
+        return {
+            'name': track['name'],
+            'artist': ', '.join(artists),
+            'uri': track['uri'],
+            'popularity': track['popularity'],
+            'album': track['album']['name'],
+            'release_date': track['album']['release_date'],
+            'added_at': item.get('added_at')
+        }
+    
+    def get_liked_songs_page(self, offset=0, limit=50, deadline=None):
+        """Get one page of liked songs (newest first) along with the library total"""
+        params = {'limit': limit, 'offset': offset}
+        response = self.make_api_request('me/tracks', params=params, deadline=deadline)
         
-        while True:
-            params = {'limit': 50, 'offset': offset}
-            response = self.make_api_request('me/tracks', params=params)
-            
-            if not response or 'items' not in response:
-                break
-            
-            items = response['items']
-            if not items:
-                break
-            
-            for item in items:
-                track = item['track']
-                artists = [artist['name'] for artist in track['artists']]
-                songs.append({
-                    'name': track['name'],
-                    'artist': ', '.join(artists),
-                    'uri': track['uri'],
-                    'popularity': track['popularity'],
-                    'album': track['album']['name'],
-                    'release_date': track['album']['release_date']
-                })
-            
-            offset += len(items)
-            if len(items) < 50 or offset >= limit:
-                break
+        if not response or 'items' not in response:
+            return None
         
+        return {
+            'tracks': [self._parse_saved_track(item) for item in response['items']],
+            'total': response.get('total', 0)
+        }
+    
+    def get_liked_songs(self, limit=50):
+        """Get the user's liked songs"""
+        songs, _, _ = self._fetch_pages('me/tracks', self._parse_saved_track, limit=limit)
         return songs
     
+    def get_all_liked_songs(self, deadline=None, offset=0):
+        """Crawl the Liked Songs library from offset, returning {'tracks', 'total', 'complete'}, or None if no page came back.
+        
+        A crawl cut short by the deadline or a failing page returns the tracks before the gap with complete False,
+        so the caller can keep them and resume from offset + len(tracks)."""
+        # Pages are persisted by LibraryService, so skip caching thousands of raw pages in memory;
+        # a full crawl is bulk work, so it queues behind interactive calls for the same app
+        songs, total, complete = self._fetch_pages('me/tracks', self._parse_saved_track, limit=None, use_cache=False,
+                                                   priority=BACKGROUND, deadline=deadline, start=offset)
+        if not complete and not songs:
+            return None
+        return {'tracks': songs, 'total': total, 'complete': complete}
+    
+    def _fetch_pages(self, endpoint, parse_item, limit=None, page_size=50, cache_expiry=None, use_cache=True,
+                     priority=INTERACTIVE, stale_ok=False, deadline=None, start=0):
+        """Fetch a paged endpoint from offset start, reading total from the first page and fetching the remaining offsets concurrently.
+        
+        Each page is parsed as soon as it arrives so raw page JSON isn't held. Returns (items, total, complete);
+        when a page still fails after retries, or the deadline passes, items stop before it so the result stays in order."""
+        def fetch(offset):
+            for attempt in range(self._page_retries + 1):
+                params = {'limit': page_size, 'offset': offset}
+                response = self.make_api_request(endpoint, params=params, cache_expiry=cache_expiry, use_cache=use_cache,
+                                                 priority=priority, stale_ok=stale_ok, deadline=deadline)
+                if response and 'items' in response:
+                    return [parse_item(item) for item in response['items']], response.get('total', 0)
+                if expired(deadline):
+                    break
+                if attempt < self._page_retries:
+                    time.sleep(0.5 * (attempt + 1))
+            return None
+        
+        first = fetch(start)
+        if first is None:
+            return [], 0, False
+        items, total = first
+        wanted = total if limit is None else min(total, limit)
+        offsets = list(range(start + page_size, wanted, page_size))
+        if offsets and len(items) == page_size:
+            with ThreadPoolExecutor(max_workers=max(1, self._pagination_concurrency)) as executor:
+                # map yields pages in offset order regardless of completion order
+                for page in executor.map(fetch, offsets):
+                    if page is None:
+                        return items[:wanted], total, False
+                    items.extend(page[0])
+        return items[:wanted], total, True
+    
     def create_playlist(self, name, track_uris):
         """Create a playlist with the given tracks, invalidate user playlists cache after creation"""
         # Get user ID
@@ -307,10 +640,7 @@ class SpotifyService:
                 return {"success": False, "message": f"Failed to add tracks to playlist. Only {added_tracks} tracks were added."}
         
         # Invalidate cache for user playlists to ensure updated list is fetched next time
-        cache_key = self._get_cache_key(f'users/{user_id}/playlists')
-        if cache_key in self._cache:
-            del self._cache[cache_key]
-            del self._cache_timestamps[cache_key]
+        self._invalidate_cache(f'users/{user_id}/playlists')
         
         return {
             "success": True,
@@ -329,36 +659,27 @@ class SpotifyService:
             return {"success": False, "message": "Failed to retrieve user profile. Please authenticate again."}
         
         user_id = user_profile['id']
-        playlists = []
-        offset = 0
-        
-        while True:
-            params = {'limit': 50, 'offset': offset}
-            response = self.make_api_request(f'users/{user_id}/playlists', params=params, cache_expiry=self._default_cache_expiry)
-            
-            if not response or 'items' not in response:
-                break
-            
-            items = response['items']
-            if not items:
-                break
-            
-            for item in items:
-                playlists.append({
-                    'id': item['id'],
-                    'name': item['name'],
-                    'description': item.get('description', ''),
-                    'track_count': item['tracks']['total'],
-                    'owner': item['owner']['display_name'],
-                    'external_url': item['external_urls']['spotify']
-                })
-            
-            offset += len(items)
-            if len(items) < 50 or offset >= limit:
-                break
+        playlists, _, _ = self._fetch_pages(
+            f'users/{user_id}/playlists',
+            self._parse_playlist,
+            limit=limit,
+            cache_expiry=self._default_cache_expiry,
+            stale_ok=True
+        )
         
         return {"success": True, "playlists": playlists}
     
+    def _parse_playlist(self, item):
+        """Flatten a playlist item into the fields the dashboard uses"""
+        return {
+            'id': item['id'],
+            'name': item['name'],
+            'description': item.get('description', ''),
+            'track_count': item['tracks']['total'],
+            'owner': item['owner']['display_name'],
+            'external_url': item['external_urls']['spotify']
+        }
+    
     def add_tracks_to_playlist(self, playlist_id, track_uris):
         """Add tracks to an existing playlist, invalidate playlist cache after update"""
         added_tracks = 0
@@ -373,10 +694,7 @@ class SpotifyService:
                 return {"success": False, "message": f"Failed to add tracks to playlist. Only {added_tracks} tracks were added."}
         
         # Invalidate cache for this playlist to ensure updated track list is fetched next time
-        cache_key = self._get_cache_key(f'playlists/{playlist_id}/tracks')
-        if cache_key in self._cache:
-            del self._cache[cache_key]
-            del self._cache_timestamps[cache_key]
+        self._invalidate_cache(f'playlists/{playlist_id}/tracks')
         
         return {
             "success": True,
@@ -384,7 +702,7 @@ class SpotifyService:
             "track_count": added_tracks
         }
     
-    def search_tracks(self, query, limit=10):
+    def search_tracks(self, query, limit=10, deadline=None, priority=INTERACTIVE):
         """Search for tracks on Spotify with extended cache expiry"""
         params = {
             'q': query,
@@ -392,29 +710,32 @@ class SpotifyService:
             'limit': limit
         }
         
-        response = self.make_api_request('search', params=params, cache_expiry=self._extended_cache_expiry)
+        response = self.make_api_request('search', params=params, cache_expiry=self._extended_cache_expiry,
+                                         priority=priority, deadline=deadline)
         
+        # None signals a failed search, as opposed to an empty list for a search with no matches
         if not response or 'tracks' not in response:
-            return []
+            return None
         
-        tracks = []
-        for item in response['tracks']['items']:
-            artists = [artist['name'] for artist in item['artists']]
-            tracks.append({
-                'name': item['name'],
-                'artist': ', '.join(artists),
-                'uri': item['uri'],
-                'popularity': item['popularity'],
-                'album': item['album']['name'],
-                'release_date': item['album']['release_date'],
-                'preview_url': item['preview_url']
-            })
-        
-        return tracks
+        return [self._parse_search_track(item) for item in response['tracks']['items']]
+    
+    def _parse_search_track(self, item):
+        """Flatten a track from search results into the fields the app uses"""
+        artists = [artist['name'] for artist in item['artists']]
+        return {
+            'name': item['name'],
+            'artist': ', '.join(artists),
+            'uri': item['uri'],
+            'popularity': item['popularity'],
+            'album': item['album']['name'],
+            'release_date': item['album']['release_date'],
+            'preview_url': item['preview_url']
+        }
     
     def get_available_genres(self):
         """Get a list of available genre seeds for recommendations from Spotify API"""
-        response = self.make_api_request('recommendations/available-genre-seeds', cache_expiry=self._extended_cache_expiry)
+        response = self.make_api_request('recommendations/available-genre-seeds', cache_expiry=self._extended_cache_expiry,
+                                         stale_ok=True)
         
         if not response or 'genres' not in response:
             return []
@@ -432,10 +753,12 @@ class SpotifyService:
             data = {
                 'grant_type': 'client_credentials'
             }
-            response = requests.post('https://accounts.spotify.com/api/token', headers=headers, data=data)
+            response = self._post_token(headers, data)
             if response.status_code == 200:
                 return True
             return False
+        except CircuitOpenError:
+            raise
         except Exception as e:
             print(f"Error validating Spotify credentials: {str(e)}")
             return False
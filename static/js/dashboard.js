@@ -1,5 +1,6 @@
 document.addEventListener('DOMContentLoaded', function() {
     const generateBtn = document.getElementById('generate-btn');
+    const differentBtn = document.getElementById('different-btn');
     const selectAllBtn = document.getElementById('select-all-btn');
     const createPlaylistBtn = document.getElementById('create-playlist-btn');
     const tracksContainer = document.getElementById('tracks-container');
@@ -176,87 +177,144 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     if (generateBtn) {
-        generateBtn.addEventListener('click', function() {
-            const count = parseInt(document.getElementById('count').value);
-            const discoveryLevel = parseInt(document.getElementById('discovery-level').value);
-            const minYear = parseInt(document.getElementById('min-year').value);
-            const maxPopularity = parseInt(document.getElementById('max-popularity').value);
-            const tempoSelect = document.getElementById('tempo');
-            const energySelect = document.getElementById('energy');
-            const targetTempo = tempoSelect ? tempoSelect.value : '';
-            const targetEnergy = energySelect ? energySelect.value : '';
-            const genres = getSelectedGenres();
-            const moods = document.getElementById('moods').value.split(',').map(m => m.trim()).filter(m => m);
-
-            // Input validation
-            if (isNaN(count) || count < 1 || count > 50) {
-                showError('Please enter a valid number of tracks (1-50).');
-                return;
-            }
-            if (isNaN(discoveryLevel) || discoveryLevel < 0 || discoveryLevel > 100) {
-                showError('Please enter a valid discovery level (0-100).');
-                return;
+        generateBtn.addEventListener('click', () => generateRecommendations(false));
+    }
+
+    if (differentBtn) {
+        // Skip the cached result and ask for tracks that haven't been suggested yet
+        differentBtn.addEventListener('click', () => generateRecommendations(true));
+    }
+
+    function generateRecommendations(different) {
+        const count = parseInt(document.getElementById('count').value);
+        const discoveryLevel = parseInt(document.getElementById('discovery-level').value);
+        const minYear = parseInt(document.getElementById('min-year').value);
+        const maxPopularity = parseInt(document.getElementById('max-popularity').value);
+        const tempoSelect = document.getElementById('tempo');
+        const energySelect = document.getElementById('energy');
+        const targetTempo = tempoSelect ? tempoSelect.value : '';
+        const targetEnergy = energySelect ? energySelect.value : '';
+        const genres = getSelectedGenres();
+        const moods = document.getElementById('moods').value.split(',').map(m => m.trim()).filter(m => m);
+
+        // Input validation
+        if (isNaN(count) || count < 1 || count > 50) {
+            showError('Please enter a valid number of tracks (1-50).');
+            return;
+        }
+        if (isNaN(discoveryLevel) || discoveryLevel < 0 || discoveryLevel > 100) {
+            showError('Please enter a valid discovery level (0-100).');
+            return;
+        }
+        if (isNaN(minYear) || minYear < 1900 || minYear > 2025) {
+            showError('Please enter a valid minimum year (1900-2025).');
+            return;
+        }
+        if (isNaN(maxPopularity) || maxPopularity < 0 || maxPopularity > 100) {
+            showError('Please enter a valid maximum popularity (0-100).');
+            return;
+        }
+
+        // Show loading indicator
+        loadingIndicator.classList.remove('hidden');
+        errorMessage.classList.add('hidden');
+        recommendationsResults.classList.add('hidden');
+        noTracksMessage.classList.add('hidden');
+
+        // Stream recommendations, rendering each track as soon as it has been verified
+        recommendedTracks = [];
+        selectedTracks = [];
+        renderTracks(recommendedTracks);
+        streamRecommendations({
+            count: count,
+            discovery_level: discoveryLevel,
+            min_year: minYear,
+            max_popularity: maxPopularity,
+            tempo: targetTempo,
+            energy: targetEnergy,
+            genres: genres,
+            moods: moods,
+            different: different
+        }, track => {
+            recommendedTracks.push(track);
+            appendTrack(track);
+            recommendationsResults.classList.remove('hidden');
+        })
+        .then(summary => {
+            console.log('Recommendations stream finished:', summary);
+            loadingIndicator.classList.add('hidden');
+            if (recommendedTracks.length === 0) {
+                noTracksMessage.textContent = "No recommendations could be verified with Spotify. Please try different parameters or generate again.";
+                noTracksMessage.classList.remove('hidden');
+                recommendationsResults.classList.add('hidden');
+            } else if (summary.partial) {
+                showError(`Only ${summary.count} of ${summary.requested} tracks could be verified in time. Generate again for more.`);
             }
-            if (isNaN(minYear) || minYear < 1900 || minYear > 2025) {
-                showError('Please enter a valid minimum year (1900-2025).');
-                return;
+        })
+        .catch(err => {
+            // Tracks that already arrived stay on screen and can still be saved
+            loadingIndicator.classList.add('hidden');
+            showError(`Error: ${err.message}`);
+        });
+    }
+
+    function streamRecommendations(params, onTrack) {
+        // POST to the server-sent events endpoint; EventSource can't send a body, so read the stream directly
+        return fetch('/api/recommendations/stream', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Accept': 'text/event-stream'
+            },
+            body: JSON.stringify(params)
+        })
+        .then(response => {
+            if (!response.ok) {
+                return response.json().then(errorData => {
+                    throw new Error(errorData.error || 'Failed to fetch recommendations. Please try again.');
+                });
             }
-            if (isNaN(maxPopularity) || maxPopularity < 0 || maxPopularity > 100) {
-                showError('Please enter a valid maximum popularity (0-100).');
-                return;
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+
+            function handleEvent(frame) {
+                let event = 'message';
+                let data = '';
+                frame.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) {
+                        event = line.slice(6).trim();
+                    } else if (line.startsWith('data:')) {
+                        data += line.slice(5).trim();
+                    }
+                });
+                const payload = data ? JSON.parse(data) : {};
+                if (event === 'track') {
+                    onTrack(payload);
+                } else if (event === 'error') {
+                    throw new Error(payload.error || 'Failed to fetch recommendations. Please try again.');
+                }
+                return event === 'done' ? payload : null;
             }
 
-            // Show loading indicator
-            loadingIndicator.classList.remove('hidden');
-            errorMessage.classList.add('hidden');
-            recommendationsResults.classList.add('hidden');
-            noTracksMessage.classList.add('hidden');
-
-            // Make API request
-            fetch('/api/recommendations', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    count: count,
-                    discovery_level: discoveryLevel,
-                    min_year: minYear,
-                    max_popularity: maxPopularity,
-                    tempo: targetTempo,
-                    energy: targetEnergy,
-                    genres: genres,
-                    moods: moods
-                })
-            })
-            .then(response => {
-                loadingIndicator.classList.add('hidden');
-                if (!response.ok) {
-                    return response.json().then(errorData => {
-                        throw new Error(errorData.error || 'Failed to fetch recommendations. Please try again.');
-                    });
-                }
-                return response.json();
-            })
-            .then(data => {
-                console.log('Raw API response:', data);
-                recommendedTracks = data.tracks || (Array.isArray(data) ? data : []);
-                console.log('Processed recommendedTracks:', recommendedTracks);
-                selectedTracks = [];
-                renderTracks(recommendedTracks);
-                
-                if (recommendedTracks.length === 0) {
-                    noTracksMessage.textContent = "No recommendations could be verified with Spotify. Please try different parameters or generate again.";
-                    noTracksMessage.classList.remove('hidden');
-                    recommendationsResults.classList.add('hidden');
-                } else {
-                    recommendationsResults.classList.remove('hidden');
-                    noTracksMessage.classList.add('hidden');
-                }
-            })
-            .catch(err => {
-                showError(`Error: ${err.message}`);
-            });
+            function read() {
+                return reader.read().then(({ done, value }) => {
+                    if (done) {
+                        throw new Error('The connection closed before all recommendations arrived.');
+                    }
+                    buffer += decoder.decode(value, { stream: true });
+                    let boundary;
+                    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                        const summary = handleEvent(buffer.slice(0, boundary));
+                        buffer = buffer.slice(boundary + 2);
+                        if (summary) {
+                            return summary;
+                        }
+                    }
+                    return read();
+                });
+            }
+            return read();
         });
     }
 
@@ -493,28 +551,30 @@ document.addEventListener('DOMContentLoaded', function() {
             return;
         }
 
-        tracks.forEach(track => {
-            const trackCard = document.createElement('div');
-            trackCard.className = 'track-card';
-            trackCard.innerHTML = `
-                <div class="track-info flex-1">
-                    <div class="font-medium text-white">${track.title}</div>
-                    <div class="text-sm text-gray-400">${track.artist}</div>
-                </div>
-                <input type="checkbox" data-track-id="${track.uri}" class="ml-4 w-5 h-5 text-green-500 focus:ring-green-500 border-gray-600 bg-gray-700 rounded">
-            `;
-            tracksContainer.appendChild(trackCard);
+        tracks.forEach(appendTrack);
+    }
 
-            const checkbox = trackCard.querySelector('input[type="checkbox"]');
-            checkbox.addEventListener('change', function() {
-                if (this.checked) {
-                    if (!selectedTracks.includes(track.uri)) {
-                        selectedTracks.push(track.uri);
-                    }
-                } else {
-                    selectedTracks = selectedTracks.filter(uri => uri !== track.uri);
+    function appendTrack(track) {
+        const trackCard = document.createElement('div');
+        trackCard.className = 'track-card';
+        trackCard.innerHTML = `
+            <div class="track-info flex-1">
+                <div class="font-medium text-white">${track.title}</div>
+                <div class="text-sm text-gray-400">${track.artist}</div>
+            </div>
+            <input type="checkbox" data-track-id="${track.uri}" class="ml-4 w-5 h-5 text-green-500 focus:ring-green-500 border-gray-600 bg-gray-700 rounded">
+        `;
+        tracksContainer.appendChild(trackCard);
+
+        const checkbox = trackCard.querySelector('input[type="checkbox"]');
+        checkbox.addEventListener('change', function() {
+            if (this.checked) {
+                if (!selectedTracks.includes(track.uri)) {
+                    selectedTracks.push(track.uri);
                 }
-            });
+            } else {
+                selectedTracks = selectedTracks.filter(uri => uri !== track.uri);
+            }
         });
     }
 
@@ -0,0 +1,84 @@
+import pytest
+from unittest.mock import patch, MagicMock, AsyncMock
+from starlette.testclient import TestClient
+from asgi import app, flask_app
+from user_service import UserContext
+
+@pytest.fixture
+def client():
+    """Fixture to create a test client for the ASGI app."""
+    with TestClient(app) as client:
+        yield client
+
+def _login(client, user_id='test_user'):
+    """Set a Flask-signed session cookie, as the WSGI login flow would."""
+    cookie = flask_app.session_interface.get_signing_serializer(flask_app).dumps({'user_id': user_id})
+    client.cookies.set(flask_app.config['SESSION_COOKIE_NAME'], cookie)
+
+def _context(user_id='test_user'):
+    """Build a fully set up user context."""
+    return UserContext(user_id=user_id, spotify_client_id='mock_client_id', spotify_client_secret='mock_client_secret',
+                       spotify_access_token='mock_access_token', spotify_refresh_token='mock_refresh_token',
+                       gemini_api_key='mock_api_key')
+
+def test_recommendations_not_authenticated(client):
+    """Test that the async recommendations route rejects requests without a session."""
+    response = client.post('/api/recommendations', json={})
+    assert response.status_code == 401
+    assert response.json() == {"error": "Not authenticated"}
+
+def test_recommendations_invalid_params(client):
+    """Test that the async route applies the same validation as the Flask route."""
+    _login(client)
+    with patch('blueprints.api_async.user_service.get_user_context', return_value=_context()):
+        response = client.post('/api/recommendations', json={"count": 0})
+    assert response.status_code == 400
+    assert response.json() == {"error": "Count must be between 1 and 50"}
+
+def test_recommendations_awaits_async_service(client):
+    """Test that recommendations are produced by the coroutine path with the validated parameters."""
+    _login(client)
+    tracks = [{"title": "Song", "artist": "Artist", "uri": "spotify:track:1"}]
+    mock_service = MagicMock()
+    mock_service.get_recommendations_async = AsyncMock(return_value=tracks)
+    with patch('blueprints.api_async.user_service.get_user_context', return_value=_context()), \
+         patch('blueprints.api_async.library_service.get_liked_songs', return_value=[{"name": "Liked", "artist": "Artist"}]), \
+         patch('blueprints.api_async.RecommendationService', return_value=mock_service):
+        response = client.post('/api/recommendations', json={"count": 5, "genres": ["rock"]})
+    assert response.status_code == 200
+    assert response.json() == tracks
+    kwargs = mock_service.get_recommendations_async.await_args.kwargs
+    assert kwargs["count"] == 5
+    assert kwargs["genres"] == ["rock"]
+
+def test_stream_recommendations_async(client):
+    """Test that the async stream route emits track events from the async generator and a final summary."""
+    _login(client)
+    async def tracks(*args, **kwargs):
+        yield {"title": "Song", "uri": "spotify:track:1"}
+    mock_service = MagicMock()
+    mock_service.aiter_recommendations.side_effect = tracks
+    with patch('blueprints.api_async.user_service.get_user_context', return_value=_context()), \
+         patch('blueprints.api_async.library_service.get_liked_songs', return_value=[{"name": "Liked", "artist": "Artist"}]), \
+         patch('blueprints.api_async.RecommendationService', return_value=mock_service):
+        response = client.post('/api/recommendations/stream', json={"count": 3})
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/event-stream')
+    assert response.text == ('event: track\ndata: {"title": "Song", "uri": "spotify:track:1"}\n\n'
+                             'event: done\ndata: {"count": 1, "requested": 3, "partial": false}\n\n')
+
+def test_filter_suggestions_prefer_respond_async(client):
+    """Test that the async route also queues a job when the client prefers not to wait."""
+    _login(client)
+    with patch('blueprints.api_async.user_service.get_user_context', return_value=_context()), \
+         patch('blueprints.api.shared_job_queue.submit', return_value='job123') as mock_submit:
+        response = client.get('/api/filter-suggestions', headers={'Prefer': 'respond-async'})
+    assert response.status_code == 202
+    assert response.json() == {"job_id": "job123", "status": "queued"}
+    assert response.headers['location'] == '/api/jobs/job123'
+    mock_submit.assert_called_once_with('test_user', 'filter_suggestions', {})
+
+def test_other_paths_served_by_flask(client):
+    """Test that non-async paths fall through to the Flask app."""
+    response = client.get('/', follow_redirects=False)
+    assert response.status_code == 200
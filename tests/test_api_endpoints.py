@@ -146,4 +146,146 @@ def test_save_api_key_unauthenticated(client):
     assert response.status_code == 401
     assert "error" in response.json
 
+def _user_context():
+    """Build a fully set up user context for the API blueprint."""
+    from user_service import UserContext
+    return UserContext(user_id='test_user', spotify_client_id='mock_client_id', spotify_client_secret='mock_client_secret',
+                       spotify_access_token='mock_access_token', spotify_refresh_token='mock_refresh_token',
+                       gemini_api_key='mock_api_key')
+
+def test_stream_recommendations_sends_tracks_then_summary(client):
+    """Test that the stream endpoint emits one event per verified track followed by a done event."""
+    with client.session_transaction() as sess:
+        sess['user_id'] = 'test_user'
+    tracks = [{"title": "Song 1", "uri": "spotify:track:1"}, {"title": "Song 2", "uri": "spotify:track:2"}]
+    mock_service = MagicMock()
+    mock_service.iter_recommendations.return_value = iter(tracks)
+    with patch('blueprints.api.user_service.get_request_context', return_value=_user_context()), \
+         patch('blueprints.api.library_service.get_liked_songs', return_value=[{"name": "Liked", "artist": "Artist"}]), \
+         patch('blueprints.api.RecommendationService', return_value=mock_service):
+        response = client.post('/api/recommendations/stream', json={"count": 2})
+        body = response.get_data(as_text=True)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    assert body.split('\n\n')[:3] == [
+        'event: track\ndata: {"title": "Song 1", "uri": "spotify:track:1"}',
+        'event: track\ndata: {"title": "Song 2", "uri": "spotify:track:2"}',
+        'event: done\ndata: {"count": 2, "requested": 2, "partial": false}'
+    ]
+
+def test_stream_recommendations_reports_errors_in_stream(client):
+    """Test that a failure after streaming has started is sent as an error event."""
+    with client.session_transaction() as sess:
+        sess['user_id'] = 'test_user'
+    def tracks():
+        yield {"title": "Song 1", "uri": "spotify:track:1"}
+        raise Exception("Gemini went away")
+    mock_service = MagicMock()
+    mock_service.iter_recommendations.return_value = tracks()
+    with patch('blueprints.api.user_service.get_request_context', return_value=_user_context()), \
+         patch('blueprints.api.library_service.get_liked_songs', return_value=[{"name": "Liked", "artist": "Artist"}]), \
+         patch('blueprints.api.RecommendationService', return_value=mock_service):
+        response = client.post('/api/recommendations/stream', json={"count": 2})
+        body = response.get_data(as_text=True)
+    assert body.endswith('event: error\ndata: {"error": "Gemini went away", "count": 1}\n\n')
+
+def test_open_circuit_maps_to_503_with_retry_after(client):
+    """Test that a call rejected by an open circuit breaker is a 503 telling the client when to retry."""
+    from circuit_breaker import CircuitOpenError
+    with client.session_transaction() as sess:
+        sess['user_id'] = 'test_user'
+    mock_service = MagicMock()
+    mock_service.get_recommendations.side_effect = CircuitOpenError('gemini:generate', 12)
+    with patch('blueprints.api.user_service.get_request_context', return_value=_user_context()), \
+         patch('blueprints.api.library_service.get_liked_songs', return_value=[{"name": "Liked", "artist": "Artist"}]), \
+         patch('blueprints.api.RecommendationService', return_value=mock_service):
+        response = client.post('/api/recommendations', json={"count": 2})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '12'
+    assert "Gemini is not responding right now" in response.json["error"]
+
+    # Raised outside the route's own error handling, e.g. while syncing the library
+    with patch('blueprints.api.user_service.get_request_context', return_value=_user_context()), \
+         patch('blueprints.api.library_service.get_liked_songs', side_effect=CircuitOpenError('spotify:library', 5)):
+        response = client.post('/api/recommendations', json={"count": 2})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '5'
+
+def test_stream_recommendations_validates_before_streaming(client):
+    """Test that invalid parameters get a normal JSON error rather than an event stream."""
+    with client.session_transaction() as sess:
+        sess['user_id'] = 'test_user'
+    with patch('blueprints.api.user_service.get_request_context', return_value=_user_context()):
+        response = client.post('/api/recommendations/stream', json={"count": 0})
+    assert response.status_code == 400
+    assert response.json == {"error": "Count must be between 1 and 50"}
+
+def test_stream_recommendations_rejects_non_boolean_different(client):
+    """Test that the different flag must be a boolean."""
+    with client.session_transaction() as sess:
+        sess['user_id'] = 'test_user'
+    with patch('blueprints.api.user_service.get_request_context', return_value=_user_context()):
+        response = client.post('/api/recommendations/stream', json={"count": 5, "different": "yes"})
+    assert response.status_code == 400
+    assert response.json == {"error": "Different must be true or false"}
+
+def test_recommendations_prefer_respond_async_queues_job(client):
+    """Test that Prefer: respond-async answers 202 with a job id instead of generating in the request."""
+    with client.session_transaction() as sess:
+        sess['user_id'] = 'test_user'
+    with patch('blueprints.api.user_service.get_request_context', return_value=_user_context()), \
+         patch('blueprints.api.shared_job_queue.submit', return_value='job123') as mock_submit, \
+         patch('blueprints.api.RecommendationService') as mock_service:
+        response = client.post('/api/recommendations', json={"count": 50}, headers={'Prefer': 'respond-async'})
+    assert response.status_code == 202
+    assert response.json == {"job_id": "job123", "status": "queued"}
+    assert response.headers['Location'] == '/api/jobs/job123'
+    assert mock_submit.call_args[0][:2] == ('test_user', 'recommendations')
+    assert mock_submit.call_args[0][2]['count'] == 50
+    mock_service.assert_not_called()
+
+def test_create_job_validates_params(client):
+    """Test that a job is only queued once its parameters are valid."""
+    with client.session_transaction() as sess:
+        sess['user_id'] = 'test_user'
+    with patch('blueprints.api.user_service.get_request_context', return_value=_user_context()), \
+         patch('blueprints.api.shared_job_queue.submit') as mock_submit:
+        unknown = client.post('/api/jobs', json={"kind": "delete_everything"})
+        invalid = client.post('/api/jobs', json={"kind": "create_playlist", "params": {"track_uris": ["bad"]}})
+    assert unknown.status_code == 400
+    assert invalid.status_code == 400
+    assert invalid.json == {"error": "Invalid track URI format"}
+    mock_submit.assert_not_called()
+
+def test_get_job_returns_owned_job(client):
+    """Test polling a job, and that unknown or foreign jobs are 404."""
+    job = {"id": "job123", "kind": "recommendations", "status": "succeeded", "result": [{"title": "Song 1"}]}
+    with client.session_transaction() as sess:
+        sess['user_id'] = 'test_user'
+    with patch('blueprints.api.shared_job_queue.get', side_effect=lambda job_id, user_id: job if job_id == 'job123' else None) as mock_get:
+        found = client.get('/api/jobs/job123')
+        missing = client.get('/api/jobs/other')
+    assert found.json == job
+    assert missing.status_code == 404
+    mock_get.assert_any_call('job123', 'test_user')
+
+def test_recommendations_job_stops_when_cancelled():
+    """Test that the recommendations handler returns its tracks with a partial flag, and stops between tracks once its job is cancelled."""
+    from blueprints.api import run_recommendations_job
+    from job_queue import JobCancelled
+    mock_service = MagicMock()
+    mock_service.iter_recommendations.return_value = iter([{"title": "Song 1"}, {"title": "Song 2"}])
+    with patch('blueprints.api.user_service.get_user_context', return_value=_user_context()), \
+         patch('blueprints.api.library_service.get_liked_songs', return_value=[{"name": "Liked", "artist": "Artist"}]), \
+         patch('blueprints.api.RecommendationService', return_value=mock_service):
+        assert run_recommendations_job('test_user', {"count": 2}, lambda: False) == {
+            "tracks": [{"title": "Song 1"}, {"title": "Song 2"}], "partial": False}
+        mock_service.iter_recommendations.return_value = iter([{"title": "Song 1"}])
+        with patch('blueprints.api.Deadline') as mock_deadline:
+            mock_deadline.return_value.expired.return_value = True
+            assert run_recommendations_job('test_user', {"count": 2}, lambda: False)["partial"] is True
+        mock_service.iter_recommendations.return_value = iter([{"title": "Song 1"}, {"title": "Song 2"}])
+        with pytest.raises(JobCancelled):
+            run_recommendations_job('test_user', {"count": 2}, lambda: True)
+
 # Additional integration tests can be added for other endpoints like /callback, /api/recommendations, /api/create-playlist, etc.
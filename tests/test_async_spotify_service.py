@@ -0,0 +1,146 @@
+import asyncio
+import json
+import threading
+import time
+import httpx
+import pytest
+from unittest.mock import patch, MagicMock
+from async_spotify_service import AsyncSpotifyService
+from request_scheduler import RequestScheduler
+from response_cache import shared_response_cache
+from spotify_service import SpotifyService
+
+def _run(handler, coroutine_factory):
+    """Run a coroutine against a mock Spotify transport, returning its result and the requests made."""
+    requests = []
+    def record(request):
+        requests.append(request)
+        return handler(request)
+    async def main():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(record)) as client:
+            with patch('async_spotify_service.get_async_http_client', return_value=client):
+                return await coroutine_factory()
+    return asyncio.run(main()), requests
+
+@pytest.fixture
+def async_spotify():
+    """Fixture to create an AsyncSpotifyService with its own scheduler and a clean shared cache."""
+    shared_response_cache.clear()
+    tokens = {"access_token": "mock_access_token", "refresh_token": "mock_refresh_token"}
+    service = AsyncSpotifyService("mock_client_id", "mock_client_secret", tokens, user_id="async_user")
+    service._scheduler = RequestScheduler(rate=1000, burst=1000)
+    yield service
+    shared_response_cache.clear()
+
+def test_make_api_request_shares_cache_with_sync_service(async_spotify):
+    """Test that a GET made by the async client is served from cache to SpotifyService for the same user."""
+    handler = lambda request: httpx.Response(200, json={"genres": ["rock"]})
+    genres, requests = _run(handler, async_spotify.get_available_genres)
+    assert genres == ["rock"]
+    assert len(requests) == 1
+    
+    sync = SpotifyService("mock_client_id", "mock_client_secret", dict(async_spotify.tokens), user_id="async_user")
+    with patch.object(sync._http, 'get') as mock_get:
+        assert sync.get_available_genres() == ["rock"]
+        mock_get.assert_not_called()
+
+def test_make_api_request_refreshes_on_401(async_spotify):
+    """Test that a 401 refreshes the token, persists it and retries the call."""
+    saved = []
+    async_spotify.on_token_refresh = saved.append
+    def handler(request):
+        if request.url.host == "accounts.spotify.com":
+            return httpx.Response(200, json={"access_token": "new_access_token", "expires_in": 3600})
+        if request.headers["Authorization"] == "Bearer new_access_token":
+            return httpx.Response(200, json={"id": "mock_user"})
+        return httpx.Response(401, json={"error": "expired"})
+    
+    profile, requests = _run(handler, lambda: async_spotify.make_api_request('me', use_cache=False))
+    assert profile == {"id": "mock_user"}
+    assert len(requests) == 3
+    assert saved[0]["access_token"] == "new_access_token"
+
+def test_fetch_pages_gathers_in_order(async_spotify):
+    """Test that remaining pages are fetched concurrently and reassembled in offset order."""
+    def handler(request):
+        offset = int(request.url.params["offset"])
+        limit = int(request.url.params["limit"])
+        return httpx.Response(200, json={"items": [{"n": n} for n in range(offset, min(offset + limit, 180))], "total": 180})
+    
+    result, requests = _run(handler, lambda: async_spotify._fetch_pages('me/tracks', lambda item: item["n"]))
+    assert result == (list(range(180)), 180, True)
+    assert len(requests) == 4
+
+def test_create_playlist(async_spotify):
+    """Test that a playlist is created and tracks are added in batches of 100."""
+    def handler(request):
+        if request.url.path == "/v1/me":
+            return httpx.Response(200, json={"id": "mock_user"})
+        if request.url.path == "/v1/users/mock_user/playlists":
+            return httpx.Response(201, json={"id": "playlist_id", "name": json.loads(request.content)["name"],
+                                             "external_urls": {"spotify": "https://open.spotify.com/playlist/playlist_id"}})
+        return httpx.Response(201, json={"snapshot_id": "snapshot"})
+    uris = [f"spotify:track:{i}" for i in range(150)]
+    
+    result, requests = _run(handler, lambda: async_spotify.create_playlist("Mix", uris))
+    assert result["success"] is True
+    assert result["track_count"] == 150
+    assert len(requests) == 4
+
+def test_search_tracks_failure_returns_none(async_spotify):
+    """Test that a failed search is distinguished from a search with no matches."""
+    failed, _ = _run(lambda request: httpx.Response(404, json={}), lambda: async_spotify.search_tracks("track:missing"))
+    assert failed is None
+    empty, _ = _run(lambda request: httpx.Response(200, json={"tracks": {"items": []}}), lambda: async_spotify.search_tracks("track:none"))
+    assert empty == []
+
+def test_token_persistence_and_cache_run_off_the_event_loop(async_spotify):
+    """Test that the database write after a refresh and, with the SQLite tier, the shared cache reads and writes run in worker threads."""
+    loop_thread = threading.get_ident()
+    threads = []
+    async_spotify.on_token_refresh = lambda tokens: threads.append(threading.get_ident())
+    async_spotify.user_id = "threaded_user"
+    async_spotify.tokens["expires_at"] = 1
+    def handler(request):
+        if request.url.host == "accounts.spotify.com":
+            return httpx.Response(200, json={"access_token": "new_access_token", "expires_in": 3600})
+        return httpx.Response(200, json={"genres": ["rock"]})
+    lookup, store = async_spotify._lookup_cache, async_spotify._set_to_cache
+    l2 = MagicMock()
+    l2.get.return_value = None
+    l2.invalidations_since.return_value = []
+    with patch.object(async_spotify, '_lookup_cache', side_effect=lambda *args: threads.append(threading.get_ident()) or lookup(*args)), \
+         patch.object(async_spotify, '_set_to_cache', side_effect=lambda *args: threads.append(threading.get_ident()) or store(*args)), \
+         patch.object(shared_response_cache, 'l2', l2):
+        genres, _ = _run(handler, async_spotify.get_available_genres)
+    assert genres == ["rock"]
+    assert len(threads) == 3
+    assert loop_thread not in threads
+
+def test_memory_only_cache_stays_on_the_event_loop(async_spotify):
+    """Test that without the SQLite tier the shared cache is read and written on the loop, with no thread hop."""
+    threads = []
+    lookup, store = async_spotify._lookup_cache, async_spotify._set_to_cache
+    with patch.object(async_spotify, '_lookup_cache', side_effect=lambda *args: threads.append(threading.get_ident()) or lookup(*args)), \
+         patch.object(async_spotify, '_set_to_cache', side_effect=lambda *args: threads.append(threading.get_ident()) or store(*args)), \
+         patch('async_spotify_service.asyncio.to_thread') as mock_to_thread:
+        genres, _ = _run(lambda request: httpx.Response(200, json={"genres": ["jazz"]}), async_spotify.get_available_genres)
+    assert genres == ["jazz"]
+    assert threads == [threading.get_ident()] * 2
+    mock_to_thread.assert_not_called()
+
+def test_async_refresh_waits_for_a_threaded_refresh(async_spotify):
+    """Test that an async refresh queues behind a sync refresh of the same user and adopts its token."""
+    from spotify_service import _refresh_lock, _remember_tokens
+    async_spotify.user_id = "shared_lock_user"
+    lock = _refresh_lock("shared_lock_user")
+    lock.acquire()
+    def finish_refresh():
+        time.sleep(0.2)
+        _remember_tokens("shared_lock_user", {"access_token": "threaded_access_token", "refresh_token": "mock_refresh_token", "expires_at": time.time() + 3600})
+        lock.release()
+    threading.Thread(target=finish_refresh).start()
+    refreshed, requests = _run(lambda request: httpx.Response(200, json={"access_token": "async_access_token"}), async_spotify.refresh_token)
+    assert refreshed is True
+    assert requests == []
+    assert async_spotify.tokens["access_token"] == "threaded_access_token"
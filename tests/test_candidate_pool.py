@@ -0,0 +1,72 @@
+import asyncio
+import threading
+from unittest.mock import patch
+from candidate_pool import CandidatePool
+
+def _track(title, year=2020, popularity=50):
+    """Build a verified track as RecommendationService formats them."""
+    return {"title": title, "artist": "Artist", "uri": f"spotify:track:{title}", "release_date": f"{year}-01-01", "popularity": popularity}
+
+def test_take_keeps_order_and_applies_filter():
+    """Test that take returns matching tracks in ranking order and leaves the rest pooled."""
+    pool = CandidatePool()
+    pool.add("key", [_track("A", 1990), _track("B"), _track("C", 1980), _track("D")])
+    assert [t["title"] for t in pool.take("key", 2, lambda t: t["release_date"] >= "2000")] == ["B", "D"]
+    assert pool.size("key") == 2
+    assert [t["title"] for t in pool.take("key", 5)] == ["A", "C"]
+
+def test_seen_tracks_are_not_added_again():
+    """Test that tracks already pooled or served are never handed out twice."""
+    pool = CandidatePool()
+    pool.add("key", [_track("A")])
+    pool.take("key", 1)
+    pool.mark_seen("key", [_track("B")])
+    assert pool.add("key", [_track("a"), _track("B"), _track("C")]) == 1
+    assert [t["title"] for t in pool.take("key", 5)] == ["C"]
+
+def test_refill_runs_once_below_watermark():
+    """Test that one background refill runs while the pool is low and its tracks are added when it finishes."""
+    pool = CandidatePool(low_watermark=2)
+    release = threading.Event()
+    calls = []
+    def fill():
+        calls.append(1)
+        release.wait(5)
+        return [_track("A"), _track("B")]
+    assert pool.refill("key", fill) is True
+    assert pool.refill("key", fill) is False
+    release.set()
+    pool._executor.shutdown(wait=True)
+    assert len(calls) == 1
+    assert pool.size("key") == 2
+    assert pool.refill("key", fill) is False  # back above the watermark
+
+def test_failed_refill_clears_flag():
+    """Test that a refill that raises is logged and a later refill can start."""
+    pool = CandidatePool(workers=1)
+    def fill():
+        raise Exception("Gemini unavailable")
+    pool.refill("key", fill)
+    pool._executor.submit(lambda: None).result()
+    assert pool.stats()["refill_failures"] == 1
+    assert pool.refill("key", lambda: [_track("A")]) is True
+
+def test_refill_async_runs_on_event_loop():
+    """Test that async refills run as tasks on the running loop."""
+    pool = CandidatePool()
+    async def fill():
+        await asyncio.sleep(0)
+        return [_track("A")]
+    async def run():
+        assert pool.refill_async("key", fill) is True
+        await asyncio.gather(*pool._tasks)
+    asyncio.run(run())
+    assert pool.size("key") == 1
+
+def test_stale_pool_discarded():
+    """Test that a pool untouched for longer than ttl starts over."""
+    pool = CandidatePool(ttl=60)
+    with patch('candidate_pool.time.monotonic', return_value=1000):
+        pool.add("key", [_track("A")])
+    with patch('candidate_pool.time.monotonic', return_value=1100):
+        assert pool.take("key", 1) == []
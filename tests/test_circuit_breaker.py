@@ -0,0 +1,95 @@
+import pytest
+from unittest.mock import patch
+from circuit_breaker import CircuitBreaker, CircuitBreakerRegistry, CircuitOpenError, CLOSED, OPEN, HALF_OPEN
+
+@pytest.fixture
+def clock():
+    """Fixture to control the time the breakers see."""
+    now = [1000.0]
+    with patch('circuit_breaker.time.monotonic', side_effect=lambda: now[0]):
+        yield now
+
+def _fail(breaker, times=1):
+    for _ in range(times):
+        with pytest.raises(ConnectionError):
+            with breaker.attempt():
+                raise ConnectionError("connection reset")
+
+def test_opens_on_failure_rate(clock):
+    """Test that the circuit opens once enough of the recent calls failed, and then rejects calls unsent."""
+    breaker = CircuitBreaker('spotify:search', window=10, min_calls=4, failure_rate=0.5, reset_timeout=30)
+    with breaker.attempt():
+        pass
+    _fail(breaker, 2)
+    assert breaker.state == CLOSED
+    _fail(breaker)
+    assert breaker.state == OPEN
+
+    sent = []
+    with pytest.raises(CircuitOpenError) as error:
+        with breaker.attempt():
+            sent.append(True)
+    assert sent == []
+    assert error.value.retry_after == 30
+    assert "Spotify is not responding right now" in str(error.value)
+    assert breaker.stats()['rejected'] == 1
+
+def test_opens_on_slow_calls(clock):
+    """Test that calls which succeed but take too long open the circuit too."""
+    breaker = CircuitBreaker('gemini:generate', min_calls=3, slow_rate=0.6, slow_call_duration=5)
+    for _ in range(3):
+        with breaker.attempt():
+            clock[0] += 6
+    assert breaker.state == OPEN
+
+def test_stream_timed_to_first_chunk(clock):
+    """Test that a streamed call that answered quickly is not slow however long it ran."""
+    breaker = CircuitBreaker('gemini:generate', min_calls=1, slow_rate=0.5, slow_call_duration=5)
+    with breaker.attempt() as call:
+        clock[0] += 1
+        call.responded()
+        clock[0] += 60
+    assert breaker.state == CLOSED
+
+def test_half_open_probe_closes_or_reopens(clock):
+    """Test that after the reset timeout one probe is let through, closing the circuit if it succeeds."""
+    breaker = CircuitBreaker('spotify:library', min_calls=1, reset_timeout=30)
+    _fail(breaker)
+    clock[0] += 10
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.check()
+    assert error.value.retry_after == 20
+
+    clock[0] += 20
+    assert breaker.state == HALF_OPEN
+    _fail(breaker)
+    assert breaker.state == OPEN
+
+    clock[0] += 30
+    with breaker.attempt():
+        # Only one probe at a time while half open
+        with pytest.raises(CircuitOpenError):
+            breaker.check()
+    assert breaker.state == CLOSED
+
+def test_error_responses_and_ignored_exceptions(clock):
+    """Test that call.failed counts as a failure and exceptions rejected by is_failure do not."""
+    breaker = CircuitBreaker('spotify:playlists', min_calls=2)
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            with breaker.attempt(lambda e: isinstance(e, ConnectionError)):
+                raise ValueError("bad input")
+    assert breaker.state == CLOSED
+
+    for _ in range(2):
+        with breaker.attempt() as call:
+            call.failed = True
+    assert breaker.state == OPEN
+
+def test_registry_shares_breakers_by_name():
+    """Test that the registry returns one breaker per name, applying overrides on creation."""
+    registry = CircuitBreakerRegistry(min_calls=5)
+    breaker = registry.get('spotify:search', slow_call_duration=2)
+    assert registry.get('spotify:search') is breaker
+    assert breaker.min_calls == 5 and breaker.slow_call_duration == 2
+    assert registry.stats()['spotify:search']['state'] == CLOSED
@@ -0,0 +1,78 @@
+import asyncio
+from unittest.mock import patch
+from gemini_pool import GeminiModelPool
+
+MODEL_NAME = "gemini-2.5-flash-preview-05-20"
+
+def _client_key(client):
+    """Read the API key a generated gRPC client authenticates with; async clients wrap a sync one."""
+    return getattr(client, '_client', client)._transport._credentials.token
+
+def test_model_reused_per_key():
+    """Test that repeated requests with one key share a model and its client."""
+    pool = GeminiModelPool()
+    model = pool.model("key_a", MODEL_NAME)
+    assert pool.model("key_a", MODEL_NAME) is model
+    assert model._client is pool.model("key_a", MODEL_NAME)._client
+
+def test_each_key_uses_its_own_client():
+    """Test that models for different keys authenticate with their own key, not a global one."""
+    pool = GeminiModelPool()
+    with patch('google.generativeai.configure') as mock_configure:
+        model_a = pool.model("key_a", MODEL_NAME)
+        model_b = pool.model("key_b", MODEL_NAME)
+        assert _client_key(model_a._client) == "key_a"
+        assert _client_key(model_b._client) == "key_b"
+    mock_configure.assert_not_called()
+
+def test_async_client_per_event_loop():
+    """Test that the async client is bound to the running loop and keeps the key."""
+    pool = GeminiModelPool()
+    model = pool.model("key_a", MODEL_NAME)
+    async def client():
+        return model._async_client, model._async_client
+    first, same_loop = asyncio.run(client())
+    second, _ = asyncio.run(client())
+    assert first is same_loop
+    assert first is not second
+    assert _client_key(first) == "key_a"
+
+def test_idle_keys_evicted():
+    """Test that keys unused for idle_ttl seconds are dropped on the next lookup."""
+    pool = GeminiModelPool(idle_ttl=60)
+    with patch('gemini_pool.time.monotonic', return_value=1000):
+        model = pool.model("key_a", MODEL_NAME)
+    with patch('gemini_pool.time.monotonic', return_value=1030):
+        pool.model("key_b", MODEL_NAME)
+    with patch('gemini_pool.time.monotonic', return_value=1070):
+        pool.model("key_b", MODEL_NAME)
+        assert len(pool) == 1
+        assert pool.model("key_a", MODEL_NAME) is not model
+
+def test_least_recently_used_key_evicted_when_full():
+    """Test that the pool holds at most max_keys keys."""
+    pool = GeminiModelPool(max_keys=2)
+    model_a = pool.model("key_a", MODEL_NAME)
+    pool.model("key_b", MODEL_NAME)
+    pool.model("key_a", MODEL_NAME)
+    pool.model("key_c", MODEL_NAME)
+    assert len(pool) == 2
+    assert pool.model("key_a", MODEL_NAME) is model_a
+
+def test_discard_forgets_key():
+    """Test that a discarded key gets fresh clients next time."""
+    pool = GeminiModelPool()
+    model = pool.model("key_a", MODEL_NAME)
+    pool.discard("key_a")
+    assert len(pool) == 0
+    assert pool.model("key_a", MODEL_NAME) is not model
+
+def test_request_options_timeout_reaches_client():
+    """Test that request_options={'timeout': ...} is passed to the key's client call."""
+    import google.ai.generativelanguage as glm
+    pool = GeminiModelPool()
+    model = pool.model("key_a", MODEL_NAME)
+    with patch.object(model._clients, '_client') as mock_client:
+        mock_client.generate_content.return_value = glm.GenerateContentResponse()
+        model.generate_content("Hello", request_options={'timeout': 4.5})
+    assert mock_client.generate_content.call_args.kwargs == {'timeout': 4.5}
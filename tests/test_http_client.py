@@ -0,0 +1,45 @@
+import pytest
+from unittest.mock import patch
+from http_client import build_http_session, get_http_session
+from spotify_service import SpotifyService
+
+def test_get_http_session_is_shared():
+    """Test that every caller and SpotifyService instance gets the same pooled session."""
+    first = SpotifyService(client_id="mock_client_id", client_secret="mock_client_secret")
+    second = SpotifyService(client_id="mock_client_id", client_secret="mock_client_secret")
+    assert first._http is second._http
+    assert first._http is get_http_session()
+
+def test_build_http_session_per_host_pools():
+    """Test that the API and accounts hosts get separately sized, blocking pools with retries."""
+    with patch.dict('os.environ', {'SPOTIFY_HTTP_POOL_SIZE': '16', 'SPOTIFY_HTTP_ACCOUNTS_POOL_SIZE': '2'}):
+        session = build_http_session()
+    api_adapter = session.get_adapter('https://api.spotify.com/v1/me')
+    accounts_adapter = session.get_adapter('https://accounts.spotify.com/api/token')
+    assert api_adapter is not accounts_adapter
+    assert api_adapter._pool_maxsize == 16
+    assert accounts_adapter._pool_maxsize == 2
+    assert api_adapter._pool_block is True
+    assert 503 in api_adapter.max_retries.status_forcelist
+
+def test_build_http_session_does_not_retry_post():
+    """Test that non-idempotent POSTs are not replayed on server errors."""
+    session = build_http_session()
+    retry = session.get_adapter('https://api.spotify.com/v1/me').max_retries
+    assert 'GET' in retry.allowed_methods
+    assert 'POST' not in retry.allowed_methods
+
+def test_session_without_retries_and_bounded_pool_wait():
+    """Test that the deadline session has no transport retries and that waiting for a pooled connection is bounded."""
+    from urllib3.exceptions import EmptyPoolError
+    from urllib3.util.timeout import Timeout
+    session = get_http_session(retries=False)
+    assert session is not get_http_session()
+    assert session.get_adapter('https://api.spotify.com/v1/me').max_retries.total == 0
+    
+    with patch.dict('os.environ', {'SPOTIFY_HTTP_POOL_SIZE': '1'}):
+        adapter = build_http_session().get_adapter('https://api.spotify.com/v1/me')
+    pool = adapter.poolmanager.connection_from_url('https://api.spotify.com/v1/me')
+    pool._get_conn()
+    with pytest.raises(EmptyPoolError):
+        pool.urlopen('GET', '/v1/me', timeout=Timeout(connect=0.05, read=0.05))
@@ -0,0 +1,150 @@
+import threading
+import time
+import pytest
+from unittest.mock import patch
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.sql import text
+from database import Base
+from job_queue import JobQueue, JobCancelled, shared_job_queue
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """Fixture to point the job queue at a temporary database file."""
+    # Importing the app starts the shared queue's workers, which would otherwise claim these tests' jobs
+    shared_job_queue.stop(timeout=5)
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    with patch('job_queue.get_session', side_effect=lambda: Session()):
+        yield Session
+
+@pytest.fixture
+def queue(session_factory):
+    """Fixture for a queue without worker threads; tests claim and run jobs themselves."""
+    queue = JobQueue(workers=0, poll_interval=0)
+    queue.register('echo', lambda user_id, params, cancelled: {"user": user_id, **params})
+    return queue
+
+def _run_next(queue):
+    """Claim and run one job the way a worker does, returning its id or None."""
+    job = queue._claim_next()
+    if job is None:
+        return None
+    queue._run(job)
+    return job.id
+
+def test_submit_then_poll_result(queue):
+    """Test that a submitted job is queued, then holds the handler's result once run."""
+    job_id = queue.submit('user_a', 'echo', {"count": 5})
+    assert queue.get(job_id, 'user_a')['status'] == 'queued'
+
+    assert _run_next(queue) == job_id
+    job = queue.get(job_id, 'user_a')
+    assert job['status'] == 'succeeded'
+    assert job['result'] == {"user": "user_a", "count": 5}
+    assert job['finished_at'] is not None
+
+def test_jobs_are_private_to_their_user(queue):
+    """Test that another user can neither read nor cancel a job."""
+    job_id = queue.submit('user_a', 'echo')
+    assert queue.get(job_id, 'user_b') is None
+    assert queue.cancel(job_id, 'user_b') is None
+    assert queue.get(job_id, 'user_a')['status'] == 'queued'
+
+def test_unknown_kind_rejected(queue):
+    """Test that submitting a kind without a handler fails up front."""
+    with pytest.raises(ValueError):
+        queue.submit('user_a', 'missing')
+
+def test_claims_are_fair_across_users(queue):
+    """Test that a user with a running job waits while other users' jobs start."""
+    first = queue.submit('user_a', 'echo')
+    second = queue.submit('user_a', 'echo')
+    other = queue.submit('user_b', 'echo')
+
+    assert queue._claim_next().id == first
+    # user_a already has a job running, so user_b goes next even though user_a's job is older
+    assert queue._claim_next().id == other
+    assert queue._claim_next() is None
+    assert queue.get(second, 'user_a')['status'] == 'queued'
+
+def test_cancel_queued_job(queue):
+    """Test that cancelling a queued job finishes it without running."""
+    job_id = queue.submit('user_a', 'echo')
+    assert queue.cancel(job_id, 'user_a')['status'] == 'cancelled'
+    assert _run_next(queue) is None
+
+def test_cancel_running_job(queue):
+    """Test that a running handler sees cancelled() turn true and the job ends cancelled."""
+    started = threading.Event()
+    def slow(user_id, params, cancelled):
+        started.set()
+        while not cancelled():
+            time.sleep(0.01)
+        raise JobCancelled()
+    queue.register('slow', slow)
+    job_id = queue.submit('user_a', 'slow')
+
+    worker = threading.Thread(target=_run_next, args=(queue,))
+    worker.start()
+    assert started.wait(5)
+    assert queue.cancel(job_id, 'user_a')['cancel_requested'] is True
+    worker.join(5)
+    assert queue.get(job_id, 'user_a')['status'] == 'cancelled'
+
+def test_failed_job_records_error(queue):
+    """Test that a handler exception marks the job failed with its message."""
+    def broken(user_id, params, cancelled):
+        raise Exception("Spotify credentials not set")
+    queue.register('broken', broken)
+    job_id = queue.submit('user_a', 'broken')
+
+    _run_next(queue)
+    job = queue.get(job_id, 'user_a')
+    assert job['status'] == 'failed'
+    assert job['error'] == "Spotify credentials not set"
+    assert job['result'] is None
+
+def test_stale_running_job_marked_failed(queue, session_factory):
+    """Test that a running job whose heartbeat stopped is failed instead of left running forever."""
+    job_id = queue.submit('user_a', 'echo')
+    queue._claim_next()
+    session = session_factory()
+    session.execute(text('UPDATE jobs SET heartbeat_at = :old WHERE id = :id'), {'old': time.time() - 3600, 'id': job_id})
+    session.commit()
+    session.close()
+
+    queue._claim_next()
+    job = queue.get(job_id, 'user_a')
+    assert job['status'] == 'failed'
+    assert job['error'] == 'Job was interrupted before it finished'
+
+def test_finished_jobs_pruned_after_retention(queue):
+    """Test that finished jobs older than the retention period are deleted."""
+    queue.retention = 60
+    old = queue.submit('user_a', 'echo')
+    _run_next(queue)
+    with patch('job_queue.time.time', return_value=time.time() + 120):
+        recent = queue.submit('user_a', 'echo')
+        queue._prune()
+    assert queue.get(old, 'user_a') is None
+    assert queue.get(recent, 'user_a')['status'] == 'queued'
+
+def test_start_runs_jobs_queued_before_it(session_factory):
+    """Test that workers started without a new submission pick up a job another process left queued."""
+    earlier = JobQueue(workers=0)
+    earlier.register('echo', lambda user_id, params, cancelled: {"user": user_id})
+    job_id = earlier.submit('user_a', 'echo')
+
+    queue = JobQueue(workers=1, poll_interval=0.05)
+    queue.register('echo', lambda user_id, params, cancelled: {"user": user_id})
+    queue.start()
+    try:
+        for _ in range(100):
+            if queue.get(job_id)['status'] == 'succeeded':
+                break
+            time.sleep(0.05)
+    finally:
+        queue.stop()
+    assert queue.get(job_id)['result'] == {"user": "user_a"}
@@ -0,0 +1,33 @@
+from json_stream import JSONArrayStreamParser
+
+def test_objects_emitted_as_they_close():
+    """Test that objects split across chunks are emitted by the chunk that closes them."""
+    parser = JSONArrayStreamParser()
+    assert parser.feed('[{"title": "A", "art') == []
+    assert parser.feed('ist": "X"}, {"title"') == [{"title": "A", "artist": "X"}]
+    assert parser.feed(': "B", "artist": "Y"}]') == [{"title": "B", "artist": "Y"}]
+    assert parser.finished
+
+def test_brackets_and_escaped_quotes_inside_strings():
+    """Test that braces, brackets and escaped quotes inside strings don't end an object early."""
+    parser = JSONArrayStreamParser()
+    objects = parser.feed('[{"title": "Song {Live] \\"Remix\\"", "artist": "A\\\\"}]')
+    assert objects == [{"title": 'Song {Live] "Remix"', "artist": "A\\"}]
+
+def test_code_fence_and_nested_values():
+    """Test that text before the array is skipped and nested objects stay part of their parent."""
+    parser = JSONArrayStreamParser()
+    objects = parser.feed('```json\n[{"title": "A", "meta": {"tags": [1, 2]}}]\n```')
+    assert objects == [{"title": "A", "meta": {"tags": [1, 2]}}]
+
+def test_undecodable_object_is_skipped():
+    """Test that a malformed object is dropped and parsing carries on with the next one."""
+    parser = JSONArrayStreamParser()
+    objects = parser.feed('[{"title": "A",}, {"title": "B"}]')
+    assert objects == [{"title": "B"}]
+
+def test_text_after_array_is_ignored():
+    """Test that nothing after the closing bracket is parsed."""
+    parser = JSONArrayStreamParser()
+    assert parser.feed('[{"a": 1}] {"b": 2}') == [{"a": 1}]
+    assert parser.feed('[{"c": 3}]') == []
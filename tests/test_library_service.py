@@ -0,0 +1,107 @@
+import pytest
+from unittest.mock import patch, MagicMock
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from database import Base
+from library_service import LibraryService
+
+def _track(i):
+    """Build a parsed liked song added on day i."""
+    return {"name": f"Song {i}", "artist": "Artist", "uri": f"spotify:track:{i}", "popularity": 50,
+            "album": "Album", "release_date": "2020-01-01", "added_at": f"2024-01-{i:02d}T00:00:00Z"}
+
+def _spotify_with_library(tracks):
+    """Mock SpotifyService serving liked songs pages newest first."""
+    mock_spotify = MagicMock()
+    mock_spotify.user_id = "test_user"
+    def page(offset=0, limit=50, deadline=None):
+        ordered = sorted(tracks, key=lambda t: t["added_at"], reverse=True)
+        return {"tracks": ordered[offset:offset + limit], "total": len(ordered)}
+    mock_spotify.get_liked_songs_page.side_effect = page
+    mock_spotify.get_all_liked_songs.side_effect = lambda deadline=None, offset=0: dict(page(offset, len(tracks)), complete=True)
+    return mock_spotify
+
+@pytest.fixture
+def library_service(tmp_path):
+    """Fixture to create a LibraryService backed by a temporary database file."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'library.db'}")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    with patch('library_service.get_session', side_effect=lambda: Session()):
+        yield LibraryService(min_sync_interval=0, page_size=2)
+
+def test_first_sync_crawls_whole_library(library_service):
+    """Test that the first sync stores every liked song, newest first."""
+    mock_spotify = _spotify_with_library([_track(i) for i in range(1, 6)])
+
+    songs = library_service.get_liked_songs(mock_spotify)
+    assert [song["uri"] for song in songs] == [f"spotify:track:{i}" for i in range(5, 0, -1)]
+    mock_spotify.get_all_liked_songs.assert_called_once()
+
+def test_incremental_sync_fetches_only_new_pages(library_service):
+    """Test that later syncs stop at the watermark instead of re-crawling the library."""
+    tracks = [_track(i) for i in range(1, 8)]
+    mock_spotify = _spotify_with_library(tracks)
+    library_service.sync(mock_spotify)
+    mock_spotify.get_liked_songs_page.reset_mock()
+
+    tracks.append(_track(8))
+    songs = library_service.get_liked_songs(mock_spotify)
+    assert songs[0]["uri"] == "spotify:track:8"
+    assert len(songs) == 8
+    assert mock_spotify.get_liked_songs_page.call_count == 1
+
+def test_sync_detects_removed_tracks(library_service):
+    """Test that a total mismatch after unliking a song triggers a full re-crawl."""
+    tracks = [_track(i) for i in range(1, 5)]
+    mock_spotify = _spotify_with_library(tracks)
+    library_service.sync(mock_spotify)
+
+    tracks.remove(tracks[0])
+    songs = library_service.get_liked_songs(mock_spotify)
+    assert "spotify:track:1" not in [song["uri"] for song in songs]
+    assert len(songs) == 3
+
+def test_sync_failure_serves_local_copy(library_service):
+    """Test that a failed sync keeps serving the previously stored songs."""
+    mock_spotify = _spotify_with_library([_track(1), _track(2)])
+    library_service.sync(mock_spotify)
+
+    mock_spotify.get_liked_songs_page.side_effect = None
+    mock_spotify.get_liked_songs_page.return_value = None
+    mock_spotify.get_all_liked_songs.side_effect = None
+    mock_spotify.get_all_liked_songs.return_value = None
+    songs = library_service.get_liked_songs(mock_spotify)
+    assert len(songs) == 2
+
+def test_sync_passes_deadline_to_page_fetches(library_service):
+    """Test that the request deadline reaches every Spotify page fetch of a sync."""
+    from deadline import Deadline
+    mock_spotify = _spotify_with_library([_track(i) for i in range(1, 4)])
+    deadline = Deadline(30)
+    library_service.get_liked_songs(mock_spotify, deadline=deadline)
+    assert mock_spotify.get_all_liked_songs.call_args.kwargs["deadline"] is deadline
+
+    mock_spotify = _spotify_with_library([_track(i) for i in range(1, 5)])
+    library_service.get_liked_songs(mock_spotify, deadline=deadline)
+    assert all(call.kwargs["deadline"] is deadline for call in mock_spotify.get_liked_songs_page.call_args_list)
+
+def test_full_sync_cut_short_resumes_where_it_stopped(library_service):
+    """Test that a crawl cut short keeps the pages it fetched and the next sync continues from there before writing the watermark."""
+    tracks = [_track(i) for i in range(1, 6)]
+    mock_spotify = _spotify_with_library(tracks)
+    ordered = sorted(tracks, key=lambda t: t["added_at"], reverse=True)
+    # Each call only gets two tracks in before its deadline
+    mock_spotify.get_all_liked_songs.side_effect = lambda deadline=None, offset=0: {
+        "tracks": ordered[offset:offset + 2], "total": 5, "complete": offset + 2 >= 5}
+
+    assert library_service.sync(mock_spotify) is False
+    assert [song["uri"] for song in library_service.get_tracks("test_user")] == ["spotify:track:5", "spotify:track:4"]
+    assert library_service._get_sync_state("test_user").watermark is None
+    assert library_service.sync(mock_spotify) is False
+    assert library_service.sync(mock_spotify) is True
+    assert [call.kwargs["offset"] for call in mock_spotify.get_all_liked_songs.call_args_list] == [0, 2, 4]
+    assert len(library_service.get_tracks("test_user")) == 5
+    state = library_service._get_sync_state("test_user")
+    assert state.watermark == _track(5)["added_at"]
+    assert state.crawl_offset is None
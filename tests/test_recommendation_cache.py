@@ -0,0 +1,42 @@
+from unittest.mock import patch
+from recommendation_cache import RecommendationCache
+
+LIKED = [{"name": "Song 1", "artist": "Artist 1"}, {"name": "Song 2", "artist": "Artist 2"}]
+PARAMS = {"count": 10, "discovery_level": 50, "genres": ["rock"], "moods": []}
+
+def test_fingerprint_depends_on_sample_and_params():
+    """Test that the fingerprint is stable for identical input and changes with any setting or liked song."""
+    fingerprint = RecommendationCache.fingerprint(LIKED, PARAMS)
+    assert fingerprint == RecommendationCache.fingerprint(list(LIKED), dict(PARAMS))
+    assert fingerprint != RecommendationCache.fingerprint(LIKED, dict(PARAMS, discovery_level=51))
+    assert fingerprint != RecommendationCache.fingerprint(LIKED[:1], PARAMS)
+
+def test_results_expire_after_ttl():
+    """Test that a cached result is served within the TTL and dropped after it."""
+    cache = RecommendationCache(ttl=60)
+    tracks = [{"title": "Song", "artist": "Artist", "uri": "spotify:track:1"}]
+    with patch('response_cache.time.time', return_value=1000):
+        cache.put("user_1", "fp", tracks)
+    with patch('response_cache.time.time', return_value=1030):
+        assert cache.get("user_1", "fp") == tracks
+        assert cache.get("user_2", "fp") is None
+    with patch('response_cache.time.time', return_value=1061):
+        assert cache.get("user_1", "fp") is None
+
+def test_served_history_is_bounded_and_normalized():
+    """Test that served tracks are keyed like the verification cache and only the newest are kept."""
+    cache = RecommendationCache(served_limit=2)
+    cache.mark_served("user_1", [{"title": "Song A", "artist": "Artist"}, {"title": "Song B", "artist": "Artist"}])
+    cache.mark_served("user_1", [{"title": "Song C", "artist": "Artíst"}])
+    served = cache.served("user_1")
+    assert list(served) == ["song b|artist", "song c|artist"]
+    assert served["song c|artist"] == "Song C by Artíst"
+    assert cache.served("user_2") == {}
+
+def test_invalidate_forgets_user():
+    """Test that invalidate drops a user's results and history."""
+    cache = RecommendationCache()
+    cache.put("user_1", "fp", [{"title": "Song", "artist": "Artist"}])
+    cache.invalidate("user_1")
+    assert cache.get("user_1", "fp") is None
+    assert cache.served("user_1") == {}
@@ -1,3 +1,4 @@
+import json
 import pytest
 from unittest.mock import patch, MagicMock
 from recommendation_service import RecommendationService
@@ -130,4 +131,442 @@ def test_get_recommendations_parsing_failure(recommendation_service):
             )
             assert len(recommendations["tracks"]) == 0  # Should return empty list on parsing failure
 
+def _search_result(name):
+    """Build a search_tracks result for a verified track."""
+    return [{"name": name, "artist": "Artist", "uri": f"spotify:track:{name}", "album": "Album", "release_date": "2020-01-01", "popularity": 50, "preview_url": None}]
+
+def test_verify_recommendations_keeps_ranking_order():
+    """Test that parallel verification returns tracks in the model's order even when later searches finish first."""
+    import time
+    service = RecommendationService(api_key="mock_api_key", verify_concurrency=4)
+    mock_spotify = MagicMock()
+    delays = {"Song 0": 0.2, "Song 1": 0.1, "Song 2": 0.0, "Song 3": 0.05}
+    def search(query, limit=1, deadline=None, priority=None):
+        title = query.split("track:")[1].split(" artist:")[0]
+        time.sleep(delays[title])
+        return [] if title == "Song 1" else _search_result(title)
+    mock_spotify.search_tracks.side_effect = search
+    recs = [{"title": f"Song {i}", "artist": "Artist"} for i in range(4)]
+    
+    verified = service._verify_recommendations(mock_spotify, recs, count=3)
+    assert [track["title"] for track in verified] == ["Song 0", "Song 2", "Song 3"]
+
+def test_verify_recommendations_stops_at_count():
+    """Test that outstanding searches are cancelled once enough tracks are verified."""
+    service = RecommendationService(api_key="mock_api_key", verify_concurrency=1)
+    mock_spotify = MagicMock()
+    mock_spotify.search_tracks.side_effect = lambda query, limit=1, deadline=None, priority=None: _search_result(query)
+    recs = [{"title": f"Song {i}", "artist": "Artist"} for i in range(30)]
+    
+    verified = service._verify_recommendations(mock_spotify, recs, count=2)
+    assert len(verified) == 2
+    assert mock_spotify.search_tracks.call_count <= 4
+
+def test_verify_filter_extremes_all_categories():
+    """Test that every category's tracks are verified and kept in their suggested order."""
+    service = RecommendationService(api_key="mock_api_key", verify_concurrency=3)
+    mock_spotify = MagicMock()
+    mock_spotify.search_tracks.side_effect = lambda query, limit=1, deadline=None, priority=None: _search_result(query.split("track:")[1].split(" artist:")[0])
+    suggestions = [
+        {"filter": "Target Tempo", "extreme": "Slowest", "tracks": [{"title": "Slow 1", "artist": "A", "tempo": "60 BPM"}, {"title": "Slow 2", "artist": "A"}]},
+        {"filter": "Target Tempo", "extreme": "Fastest", "tracks": [{"title": "Fast 1", "artist": "B"}]}
+    ]
+    
+    verified = service._verify_filter_extremes(mock_spotify, suggestions, time_budget=5)
+    assert [track["title"] for track in verified[0]["tracks"]] == ["Slow 1", "Slow 2"]
+    assert verified[0]["tracks"][0]["tempo"] == "60 BPM"
+    assert verified[1]["tracks"][0]["title"] == "Fast 1"
+    assert not verified[0]["partial"] and not verified[1]["partial"]
+
+def test_verify_filter_extremes_time_budget_returns_partial():
+    """Test that categories still being verified when the budget runs out come back partial instead of failing."""
+    import threading
+    service = RecommendationService(api_key="mock_api_key", verify_concurrency=2)
+    release = threading.Event()
+    mock_spotify = MagicMock()
+    def search(query, limit=1, deadline=None, priority=None):
+        title = query.split("track:")[1].split(" artist:")[0]
+        if title.startswith("Stuck"):
+            release.wait(5)
+        return _search_result(title)
+    mock_spotify.search_tracks.side_effect = search
+    suggestions = [
+        {"filter": "Moods", "extreme": "Calmest", "tracks": [{"title": "Calm 1", "artist": "A"}]},
+        {"filter": "Moods", "extreme": "Most Energetic", "tracks": [{"title": "Stuck 1", "artist": "B"}]}
+    ]
+    
+    verified = service._verify_filter_extremes(mock_spotify, suggestions, time_budget=0.2)
+    release.set()
+    assert verified[0]["tracks"][0]["title"] == "Calm 1"
+    assert verified[0]["partial"] is False
+    assert verified[1]["tracks"] == []
+    assert verified[1]["partial"] is True
+
+def test_verify_filter_extremes_searches_share_the_budget_as_deadline():
+    """Test that each search is bounded by the time budget, so one in flight gives up when the budget ends."""
+    from request_scheduler import BACKGROUND
+    service = RecommendationService(api_key="mock_api_key")
+    mock_spotify = MagicMock()
+    calls = []
+    def search(query, limit=1, deadline=None, priority=None):
+        calls.append((deadline, priority))
+        return _search_result(query.split("track:")[1].split(" artist:")[0])
+    mock_spotify.search_tracks.side_effect = search
+    suggestions = [{"filter": "Moods", "extreme": "Calmest", "tracks": [{"title": "Calm 1", "artist": "A"}, {"title": "Calm 2", "artist": "A"}]}]
+    
+    service._verify_filter_extremes(mock_spotify, suggestions, time_budget=5, priority=BACKGROUND)
+    assert len(calls) == 2
+    assert calls[0][0] is calls[1][0]
+    assert 0 < calls[0][0].remaining() <= 5
+    assert all(priority == BACKGROUND for _, priority in calls)
+
+def test_verify_filter_extremes_failed_search_marks_category_partial():
+    """Test that one search raising drops only its track and flags its category, while an open circuit still fails the request."""
+    from circuit_breaker import CircuitOpenError
+    service = RecommendationService(api_key="mock_api_key")
+    mock_spotify = MagicMock()
+    def search(query, limit=1, deadline=None, priority=None):
+        title = query.split("track:")[1].split(" artist:")[0]
+        if title == "Broken":
+            raise ValueError("unexpected search payload")
+        return _search_result(title)
+    mock_spotify.search_tracks.side_effect = search
+    suggestions = [
+        {"filter": "Moods", "extreme": "Calmest", "tracks": [{"title": "Calm 1", "artist": "A"}, {"title": "Broken", "artist": "A"}]},
+        {"filter": "Moods", "extreme": "Most Energetic", "tracks": [{"title": "Loud 1", "artist": "B"}]}
+    ]
+    
+    verified = service._verify_filter_extremes(mock_spotify, suggestions, time_budget=5)
+    assert [track["title"] for track in verified[0]["tracks"]] == ["Calm 1"]
+    assert verified[0]["partial"] is True
+    assert verified[1]["partial"] is False
+    
+    mock_spotify.search_tracks.side_effect = CircuitOpenError('spotify:search', 30)
+    with pytest.raises(CircuitOpenError):
+        service._verify_filter_extremes(mock_spotify, suggestions, time_budget=5)
+
+def test_verify_track_uses_verification_cache():
+    """Test that a cached lookup skips the Spotify search entirely."""
+    mock_cache = MagicMock()
+    mock_cache.get.return_value = (True, _search_result("Cached")[0])
+    service = RecommendationService(api_key="mock_api_key", verification_cache=mock_cache)
+    mock_spotify = MagicMock()
+    
+    track = service._verify_track(mock_spotify, {"title": "Cached", "artist": "Artist"})
+    assert track["uri"] == "spotify:track:Cached"
+    mock_spotify.search_tracks.assert_not_called()
+
+def test_verify_track_does_not_cache_failed_search():
+    """Test that searches which failed, rather than found nothing, are not cached as not found."""
+    mock_cache = MagicMock()
+    mock_cache.get.return_value = (False, None)
+    service = RecommendationService(api_key="mock_api_key", verification_cache=mock_cache)
+    mock_spotify = MagicMock()
+    mock_spotify.search_tracks.return_value = None
+    assert service._verify_track(mock_spotify, {"title": "Song", "artist": "Artist"}) is None
+    mock_cache.put.assert_not_called()
+    
+    mock_spotify.search_tracks.return_value = []
+    assert service._verify_track(mock_spotify, {"title": "Song", "artist": "Artist"}) is None
+    mock_cache.put.assert_called_once_with("Song", "Artist", None)
+
+def test_verify_recommendations_async_keeps_order_and_stops():
+    """Test that async verification runs searches concurrently, keeps ranking order and stops at count."""
+    import asyncio
+    service = RecommendationService(api_key="mock_api_key")
+    mock_spotify = MagicMock()
+    started = []
+    async def search(query, limit=1, deadline=None, priority=None):
+        title = query.split("track:")[1].split(" artist:")[0]
+        started.append(title)
+        await asyncio.sleep(0.05 if title == "Song 0" else 0)
+        return [] if title == "Song 1" else _search_result(title)
+    mock_spotify.search_tracks.side_effect = search
+    recs = [{"title": f"Song {i}", "artist": "Artist"} for i in range(10)]
+    
+    verified = asyncio.run(service._verify_recommendations_async(mock_spotify, recs, count=3))
+    assert [track["title"] for track in verified] == ["Song 0", "Song 2", "Song 3"]
+    assert len(started) == 10
+
+def test_search_track_async_reads_cache_off_the_event_loop():
+    """Test that the async search path reads and writes the SQLite-backed verification cache in worker threads."""
+    import asyncio
+    import threading
+    threads = []
+    mock_cache = MagicMock()
+    mock_cache.get.side_effect = lambda title, artist: threads.append(threading.get_ident()) or (False, None)
+    mock_cache.put.side_effect = lambda title, artist, track: threads.append(threading.get_ident())
+    service = RecommendationService(api_key="mock_api_key", verification_cache=mock_cache)
+    mock_spotify = MagicMock()
+    async def search(query, limit=1, deadline=None, priority=None):
+        return _search_result("Song")
+    mock_spotify.search_tracks.side_effect = search
+    async def main():
+        track = await service._search_track_async(mock_spotify, {"title": "Song", "artist": "Artist"})
+        return track, threading.get_ident()
+    track, loop_thread = asyncio.run(main())
+    assert track["uri"] == "spotify:track:Song"
+    assert len(threads) == 2
+    assert loop_thread not in threads
+
+def _chunk(text):
+    """Build a streamed Gemini response chunk."""
+    chunk = MagicMock()
+    chunk.text = text
+    return chunk
+
+def test_streaming_verifies_tracks_before_generation_finishes():
+    """Test that each suggestion is searched as soon as its JSON object closes, before the stream ends."""
+    service = RecommendationService(api_key="mock_api_key", verify_concurrency=2, streaming=True)
+    mock_spotify = MagicMock()
+    searched = []
+    def search(query, limit=1, deadline=None, priority=None):
+        title = query.split("track:")[1].split(" artist:")[0]
+        searched.append(title)
+        return _search_result(title)
+    mock_spotify.search_tracks.side_effect = search
+    searched_before_last_chunk = []
+    def stream():
+        yield _chunk('```json\n[{"title": "Song 0", "artist": "A"}, {"title": "Song')
+        yield _chunk(' 1", "artist": "B \\"live\\""},')
+        import time
+        time.sleep(0.2)
+        searched_before_last_chunk.extend(searched)
+        yield _chunk(' {"title": "Song 2", "artist": "C"}]\n```')
+    service.model = MagicMock()
+    service.model.generate_content.return_value = stream()
+    
+    tracks = list(service.iter_recommendations(mock_spotify, count=3, liked_songs=[{"name": "Liked", "artist": "X"}]))
+    assert [track["title"] for track in tracks] == ["Song 0", "Song 1", "Song 2"]
+    assert sorted(searched_before_last_chunk) == ["Song 0", "Song 1"]
+    service.model.generate_content.assert_called_once()
+    assert service.model.generate_content.call_args[1] == {"stream": True}
+
+def test_streaming_stops_reading_gemini_once_enough_tracks_are_verified():
+    """Test that the Gemini stream is cancelled rather than read to the end after an early exit."""
+    import threading
+    import time
+    service = RecommendationService(api_key="mock_api_key", verify_concurrency=1, streaming=True)
+    mock_spotify = MagicMock()
+    mock_spotify.search_tracks.side_effect = lambda query, limit=1, deadline=None, priority=None: _search_result(query.split("track:")[1].split(" artist:")[0])
+    read = []
+    class Stream:
+        def __init__(self):
+            self._iterator = MagicMock()
+            self.closed = threading.Event()
+        def __iter__(self):
+            yield _chunk('[{"title": "Song 0", "artist": "A"},')
+            for i in range(1, 20):
+                time.sleep(0.05)
+                read.append(i)
+                yield _chunk(f' {{"title": "Song {i}", "artist": "A"}},')
+    stream = Stream()
+    stream._iterator.cancel.side_effect = lambda: stream.closed.set()
+    service.model = MagicMock()
+    service.model.generate_content.return_value = stream
+    
+    with patch('builtins.print'):
+        tracks = list(service.iter_recommendations(mock_spotify, count=1, liked_songs=[{"name": "Liked", "artist": "X"}]))
+    assert [track["title"] for track in tracks] == ["Song 0"]
+    assert stream.closed.wait(2)
+    assert len(read) < 5
+
+def test_streaming_falls_back_to_full_text_parse():
+    """Test that a streamed response without a JSON array is parsed as a whole once the stream ends."""
+    service = RecommendationService(api_key="mock_api_key", streaming=True)
+    mock_spotify = MagicMock()
+    mock_spotify.search_tracks.side_effect = lambda query, limit=1, deadline=None, priority=None: _search_result("Song")
+    service.model = MagicMock()
+    service.model.generate_content.return_value = iter([_chunk("1. Song - "), _chunk("Artist")])
+    
+    with patch.object(service, '_parse_recommendations', return_value=[{"title": "Song", "artist": "Artist"}]) as mock_parse:
+        tracks = list(service.iter_recommendations(mock_spotify, count=1, liked_songs=[{"name": "Liked", "artist": "X"}]))
+    mock_parse.assert_called_once_with("1. Song - Artist")
+    assert [track["title"] for track in tracks] == ["Song"]
+
+def test_streaming_async_verifies_tracks_in_order():
+    """Test that the async streaming path verifies concurrently and keeps ranking order."""
+    import asyncio
+    service = RecommendationService(api_key="mock_api_key", streaming=True)
+    mock_spotify = MagicMock()
+    async def search(query, limit=1, deadline=None, priority=None):
+        title = query.split("track:")[1].split(" artist:")[0]
+        await asyncio.sleep(0.05 if title == "Song 0" else 0)
+        return [] if title == "Song 1" else _search_result(title)
+    mock_spotify.search_tracks.side_effect = search
+    async def chunks():
+        for i in range(6):
+            yield _chunk(('[' if i == 0 else ',') + f'{{"title": "Song {i}", "artist": "A"}}')
+    async def generate(prompt, stream=False):
+        return chunks()
+    service.model = MagicMock()
+    service.model.generate_content_async.side_effect = generate
+    
+    result = asyncio.run(service.get_recommendations_async(mock_spotify, count=3, liked_songs=[{"name": "Liked", "artist": "X"}]))
+    assert [track["title"] for track in result] == ["Song 0", "Song 2", "Song 3"]
+
+def test_result_cache_answers_repeat_requests():
+    """Test that an identical second request is served from the result cache without calling Gemini."""
+    from recommendation_cache import RecommendationCache
+    cache = RecommendationCache()
+    service = RecommendationService(api_key="mock_api_key", streaming=False, result_cache=cache)
+    mock_spotify = MagicMock()
+    mock_spotify.user_id = "user_1"
+    mock_spotify.search_tracks.side_effect = lambda query, limit=1, deadline=None, priority=None: _search_result(query.split("track:")[1].split(" artist:")[0])
+    service.model = MagicMock()
+    service.model.generate_content.return_value = _chunk('[{"title": "Song 0", "artist": "A"}]')
+    liked = [{"name": "Liked", "artist": "X"}]
+    
+    first = service.get_recommendations(mock_spotify, count=1, liked_songs=liked)
+    second = service.get_recommendations(mock_spotify, count=1, liked_songs=liked)
+    assert first == second
+    assert service.model.generate_content.call_count == 1
+    service.get_recommendations(mock_spotify, count=1, discovery_level=80, liked_songs=liked)
+    assert service.model.generate_content.call_count == 2
+
+def test_different_bypasses_cache_and_excludes_served_tracks():
+    """Test that different=True regenerates, tells Gemini what was served and drops repeats before searching."""
+    from recommendation_cache import RecommendationCache
+    cache = RecommendationCache()
+    cache.mark_served("user_1", [{"title": "Song 0", "artist": "A"}])
+    service = RecommendationService(api_key="mock_api_key", streaming=True, result_cache=cache)
+    mock_spotify = MagicMock()
+    mock_spotify.user_id = "user_1"
+    searched = []
+    def search(query, limit=1, deadline=None, priority=None):
+        title = query.split("track:")[1].split(" artist:")[0]
+        searched.append(title)
+        return _search_result(title)
+    mock_spotify.search_tracks.side_effect = search
+    service.model = MagicMock()
+    service.model.generate_content.return_value = iter([_chunk('[{"title": "song 0", "artist": "a"}, {"title": "Song 1", "artist": "B"}]')])
+    
+    tracks = service.get_recommendations(mock_spotify, count=1, liked_songs=[{"name": "Liked", "artist": "X"}], different=True)
+    assert [track["title"] for track in tracks] == ["Song 1"]
+    assert searched == ["Song 1"]
+    assert "- Song 0 by A" in service.model.generate_content.call_args[0][0]
+    assert "song 1|artist" in cache.served("user_1")
+
+def test_candidate_pool_serves_first_and_refills_in_background():
+    """Test that pooled tracks passing the filters are served first, the shortfall is generated, and a wide batch refills the pool
+    in the background lane under a deadline of its own."""
+    from candidate_pool import CandidatePool
+    from request_scheduler import INTERACTIVE, BACKGROUND
+    pool = CandidatePool(low_watermark=5, batch_size=10)
+    service = RecommendationService(api_key="mock_api_key", streaming=False, candidate_pool=pool)
+    mock_spotify = MagicMock()
+    mock_spotify.user_id = "user_1"
+    lanes = []
+    def search(query, limit=1, deadline=None, priority=None):
+        lanes.append(priority)
+        return _search_result(query.split("track:")[1].split(" artist:")[0])
+    mock_spotify.search_tracks.side_effect = search
+    service.model = MagicMock()
+    service.model.generate_content.return_value = _chunk('[{"title": "Fresh", "artist": "A"}, {"title": "Pooled 1", "artist": "Artist"}, {"title": "Fresh 2", "artist": "A"}]')
+    liked = [{"name": "Liked", "artist": "X"}]
+    
+    pool_key, _ = service._take_pooled(mock_spotify, liked, {}, 0, 50, 1900, 100, None, None, None, None)
+    old = dict(service._format_verified_track(_search_result("Old")[0]), release_date="1970-01-01")
+    pool.add(pool_key, [service._format_verified_track(_search_result("Pooled 1")[0]), old])
+    
+    tracks = service.get_recommendations(mock_spotify, count=2, min_year=2000, liked_songs=liked)
+    assert [track["title"] for track in tracks] == ["Pooled 1", "Fresh"]
+    shortfall_prompt = service.model.generate_content.call_args_list[0][0][0]
+    assert "recommend 1 new songs" in shortfall_prompt
+    assert "- Pooled 1 by Artist" in shortfall_prompt
+    
+    pool._executor.shutdown(wait=True)
+    batch_prompt = service.model.generate_content.call_args_list[1][0][0]
+    assert "recommend 10 new songs" in batch_prompt
+    assert "released in or after 1900" in batch_prompt
+    assert [track["title"] for track in pool.take(pool_key, 10)] == ["Old", "Fresh 2"]
+    # The request's own searches stay interactive
+    assert set(lanes) == {INTERACTIVE, BACKGROUND}
+    assert service.model.generate_content.call_args_list[1][1]["request_options"]["timeout"] > 0
+
+def test_deadline_returns_tracks_verified_so_far():
+    """Test that once the deadline passes, the tracks already verified are returned, but not cached, instead of waiting on stuck searches."""
+    import threading
+    import time
+    from deadline import Deadline
+    from recommendation_cache import RecommendationCache
+    cache = RecommendationCache()
+    service = RecommendationService(api_key="mock_api_key", verify_concurrency=2, streaming=True, result_cache=cache)
+    release = threading.Event()
+    mock_spotify = MagicMock()
+    mock_spotify.user_id = "user_1"
+    deadlines = []
+    def search(query, limit=1, deadline=None, priority=None):
+        deadlines.append(deadline)
+        title = query.split("track:")[1].split(" artist:")[0]
+        if title == "Stuck":
+            release.wait(5)
+        return _search_result(title)
+    mock_spotify.search_tracks.side_effect = search
+    service.model = MagicMock()
+    service.model.generate_content.return_value = iter([_chunk('[{"title": "Fast", "artist": "A"}, {"title": "Stuck", "artist": "B"}]')])
+    deadline = Deadline(0.3)
+    
+    started = time.monotonic()
+    tracks = service.get_recommendations(mock_spotify, count=2, liked_songs=[{"name": "Liked", "artist": "X"}], deadline=deadline)
+    release.set()
+    assert [track["title"] for track in tracks] == ["Fast"]
+    assert time.monotonic() - started < 2
+    assert all(d is deadline for d in deadlines)
+    assert 0 < service.model.generate_content.call_args[1]["request_options"]["timeout"] <= 0.3
+    # The short list must not be served from the cache to the next identical request
+    assert cache.served("user_1") == {}
+
+def test_deadline_keeps_suggestions_streamed_before_gemini_timeout():
+    """Test that a Gemini stream cut off by the deadline still yields the suggestions that arrived."""
+    from google.api_core import exceptions as google_exceptions
+    from deadline import Deadline
+    service = RecommendationService(api_key="mock_api_key", streaming=True)
+    mock_spotify = MagicMock()
+    mock_spotify.search_tracks.side_effect = lambda query, limit=1, deadline=None, priority=None: _search_result(query.split("track:")[1].split(" artist:")[0])
+    def stream():
+        yield _chunk('[{"title": "Song 0", "artist": "A"}, ')
+        raise google_exceptions.DeadlineExceeded("Deadline Exceeded")
+    service.model = MagicMock()
+    service.model.generate_content.return_value = stream()
+    
+    tracks = list(service.iter_recommendations(mock_spotify, count=5, liked_songs=[{"name": "Liked", "artist": "X"}], deadline=Deadline(5)))
+    assert [track["title"] for track in tracks] == ["Song 0"]
+
+def test_expired_deadline_without_tracks_fails():
+    """Test that running out of time before anything was verified is reported as a timeout."""
+    from deadline import Deadline
+    service = RecommendationService(api_key="mock_api_key", streaming=False)
+    service.model = MagicMock()
+    
+    with pytest.raises(Exception, match="timed out before any recommendation was verified"):
+        service.get_recommendations(MagicMock(), count=5, liked_songs=[{"name": "Liked", "artist": "X"}], deadline=Deadline(0))
+    service.model.generate_content.assert_not_called()
+
+def test_liked_and_repeated_suggestions_are_not_searched():
+    """Test that suggestions already in Liked Songs or repeated by Gemini are dropped before any search, and URI collisions after."""
+    service = RecommendationService(api_key="mock_api_key", verify_concurrency=1, streaming=True)
+    mock_spotify = MagicMock()
+    searched = []
+    def search(query, limit=1, deadline=None, priority=None):
+        title = query.split("track:")[1].split(" artist:")[0]
+        searched.append(title)
+        # Song 2 turns out to be another name for Song 1
+        return _search_result("Song 1" if title == "Song 2" else title)
+    mock_spotify.search_tracks.side_effect = search
+    service.model = MagicMock()
+    service.model.generate_content.return_value = iter([_chunk(json.dumps([
+        {"title": "Liked Song", "artist": "Band"},
+        {"title": "Song 0", "artist": "A"},
+        {"title": "song 0", "artist": "a"},
+        {"title": "Song 1", "artist": "B"},
+        {"title": "Song 2", "artist": "B"},
+        {"title": "Song 3", "artist": "C"}
+    ]))])
+    liked_songs = [{"name": "Liked Song", "artist": "Band, Guest", "uri": "spotify:track:liked"}]
+    
+    tracks = list(service.iter_recommendations(mock_spotify, count=3, liked_songs=liked_songs))
+    assert [track["title"] for track in tracks] == ["Song 0", "Song 1", "Song 3"]
+    assert searched == ["Song 0", "Song 1", "Song 2", "Song 3"]
+
 # Additional tests can be added for other edge cases like API failures, invalid parameters, etc.
@@ -0,0 +1,48 @@
+import threading
+import time
+from request_scheduler import RequestScheduler, parse_retry_after, INTERACTIVE, BACKGROUND
+
+def test_acquire_throttles_beyond_burst():
+    """Test that calls beyond the burst wait for the bucket to refill."""
+    scheduler = RequestScheduler(rate=10, burst=2)
+    start = time.monotonic()
+    for _ in range(3):
+        assert scheduler.acquire("client") is True
+    assert time.monotonic() - start >= 0.08
+
+def test_buckets_are_per_client_id():
+    """Test that one app's exhausted bucket does not hold up another app."""
+    scheduler = RequestScheduler(rate=1, burst=1)
+    assert scheduler.acquire("busy_client") is True
+    assert scheduler.acquire("busy_client", timeout=0.05) is False
+    assert scheduler.acquire("other_client", timeout=0.05) is True
+
+def test_penalize_honours_retry_after():
+    """Test that a 429 blocks the client until Retry-After has passed."""
+    scheduler = RequestScheduler(rate=100, burst=10)
+    scheduler.penalize("client", 0.2)
+    assert scheduler.acquire("client", timeout=0.05) is False
+    assert scheduler.acquire("client", timeout=1) is True
+    assert scheduler.stats()["rate_limited"] == 1
+
+def test_interactive_first_without_starving_background():
+    """Test that interactive calls jump the queue but background calls still get a regular turn."""
+    scheduler = RequestScheduler(rate=20, burst=1, background_share=2)
+    scheduler.penalize("client", 0.2)
+    order = []
+    def worker(priority):
+        scheduler.acquire("client", priority)
+        order.append(priority)
+    threads = [threading.Thread(target=worker, args=(BACKGROUND,))]
+    threads += [threading.Thread(target=worker, args=(INTERACTIVE,)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.01)
+    for thread in threads:
+        thread.join()
+    assert order == [INTERACTIVE, INTERACTIVE, BACKGROUND, INTERACTIVE, INTERACTIVE]
+
+def test_parse_retry_after():
+    """Test that Retry-After seconds are parsed, falling back to a default when missing."""
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after(None) == 1.0
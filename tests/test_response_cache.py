@@ -0,0 +1,97 @@
+import pytest
+from unittest.mock import patch
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from database import Base
+from response_cache import ResponseCache, SQLiteCacheTier
+
+@pytest.fixture
+def cache():
+    """Fixture to create a small ResponseCache instance."""
+    return ResponseCache(max_entries=2)
+
+@pytest.fixture
+def shared_tier(tmp_path):
+    """Fixture to create a SQLiteCacheTier backed by a temporary database file."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'cache.db'}")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    with patch('response_cache.get_session', side_effect=lambda: Session()):
+        yield SQLiteCacheTier(max_entries=2, prune_every=1)
+
+def test_get_returns_stored_data(cache):
+    """Test that a stored entry is returned and counted as a hit."""
+    cache.set("user1", "me", {"id": "user1"})
+    assert cache.get("user1", "me", 300) == {"id": "user1"}
+    assert cache.stats()["hits"] == 1
+
+def test_get_is_namespaced_per_user(cache):
+    """Test that one user's entries are not visible to another user."""
+    cache.set("user1", "me", {"id": "user1"})
+    assert cache.get("user2", "me", 300) is None
+    assert cache.stats()["misses"] == 1
+
+def test_get_expired_entry(cache):
+    """Test that entries older than the expiry are removed and counted as misses."""
+    with patch('response_cache.time.time', return_value=1000):
+        cache.set("user1", "me", {"id": "user1"})
+    with patch('response_cache.time.time', return_value=1400):
+        assert cache.get("user1", "me", 300) is None
+    assert len(cache) == 0
+
+def test_lookup_returns_stale_entry_with_age(cache):
+    """Test that lookup returns an entry past its expiry but within max_age, counted as a stale hit."""
+    with patch('response_cache.time.time', return_value=1000):
+        cache.set("user1", "me", {"id": "user1"})
+    with patch('response_cache.time.time', return_value=1400):
+        assert cache.lookup("user1", "me", 300, max_age=600) == (400, {"id": "user1"})
+        assert cache.get("user1", "me", 300) is None
+    assert cache.stats()["stale_hits"] == 1
+
+def test_lru_eviction(cache):
+    """Test that the least recently used entry is evicted when the cache is full."""
+    cache.set("user1", "a", 1)
+    cache.set("user1", "b", 2)
+    cache.get("user1", "a", 300)
+    cache.set("user1", "c", 3)
+    assert cache.get("user1", "b", 300) is None
+    assert cache.get("user1", "a", 300) == 1
+    assert cache.stats()["evictions"] == 1
+
+def test_invalidate_endpoint_with_any_params():
+    """Test that invalidating an endpoint drops every params variant but not similarly named endpoints."""
+    cache = ResponseCache()
+    cache.set("user1", "users/u/playlists:limit=50&offset=0", 1)
+    cache.set("user1", "users/u/playlists:limit=50&offset=50", 2)
+    cache.set("user1", "users/u/playlists2", 3)
+    cache.invalidate("user1", "users/u/playlists")
+    assert cache.get("user1", "users/u/playlists:limit=50&offset=0", 300) is None
+    assert cache.get("user1", "users/u/playlists:limit=50&offset=50", 300) is None
+    assert cache.get("user1", "users/u/playlists2", 300) == 3
+
+def test_shared_tier_visible_to_other_workers(shared_tier):
+    """Test that an entry written by one worker is served from the shared tier to another."""
+    worker_a = ResponseCache(l2=shared_tier, invalidation_poll_interval=0)
+    worker_b = ResponseCache(l2=shared_tier, invalidation_poll_interval=0)
+    worker_a.set("user1", "me", {"id": "user1"}, 300)
+    assert worker_b.get("user1", "me", 300) == {"id": "user1"}
+    assert worker_b.stats()["l2_hits"] == 1
+
+def test_shared_tier_invalidation_reaches_other_workers(shared_tier):
+    """Test that invalidating in one worker drops the entry from another worker's memory tier."""
+    worker_a = ResponseCache(l2=shared_tier, invalidation_poll_interval=0)
+    worker_b = ResponseCache(l2=shared_tier, invalidation_poll_interval=0)
+    worker_b.get("user1", "users/u/playlists", 300)
+    worker_a.set("user1", "users/u/playlists:limit=50&offset=0", [1], 300)
+    assert worker_b.get("user1", "users/u/playlists:limit=50&offset=0", 300) == [1]
+    worker_a.invalidate("user1", "users/u/playlists")
+    assert worker_b.get("user1", "users/u/playlists:limit=50&offset=0", 300) is None
+
+def test_shared_tier_size_bound(shared_tier):
+    """Test that the shared tier keeps only the newest max_entries rows."""
+    with patch('response_cache.time.time', return_value=1003):
+        shared_tier.set("user1", "a", 1, 300, stored_at=1000)
+        shared_tier.set("user1", "b", 2, 300, stored_at=1001)
+        shared_tier.set("user1", "c", 3, 300, stored_at=1002)
+        assert shared_tier.get("user1", "a", 3600) is None
+        assert shared_tier.get("user1", "c", 3600) == (1002, 3)
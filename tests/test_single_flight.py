@@ -0,0 +1,83 @@
+import asyncio
+import threading
+import time
+import pytest
+from single_flight import SingleFlight
+
+def _concurrently(count, target):
+    """Run target on count threads at once, returning their results in thread order."""
+    results = [None] * count
+    def run(i):
+        try:
+            results[i] = target()
+        except Exception as e:
+            results[i] = e
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def test_identical_calls_share_one_execution():
+    """Test that concurrent calls with the same key run the function once and all get its result."""
+    flights = SingleFlight()
+    calls = []
+    def fetch():
+        calls.append(1)
+        time.sleep(0.1)
+        return {"id": "user1"}
+    results = _concurrently(4, lambda: flights.do(("user1", "me"), fetch))
+    assert calls == [1]
+    assert results == [{"id": "user1"}] * 4
+    assert flights.stats() == {"calls": 4, "coalesced": 3, "in_flight": 0}
+
+def test_different_keys_and_later_calls_run_separately():
+    """Test that only calls in flight at the same time for the same key are coalesced."""
+    flights = SingleFlight()
+    assert flights.do("a", lambda: 1) == 1
+    assert flights.do("a", lambda: 2) == 2
+    assert flights.do("b", lambda: 3) == 3
+    assert flights.stats()["coalesced"] == 0
+
+def test_exception_reaches_every_caller():
+    """Test that callers who joined a failing call get its exception."""
+    flights = SingleFlight()
+    def fail():
+        time.sleep(0.1)
+        raise ConnectionError("connection reset")
+    results = _concurrently(3, lambda: flights.do("me", fail))
+    assert all(isinstance(result, ConnectionError) for result in results)
+
+def test_joined_caller_times_out():
+    """Test that a caller waiting on someone else's call gives up after its own timeout."""
+    flights = SingleFlight()
+    started = threading.Event()
+    def slow():
+        started.set()
+        time.sleep(0.3)
+        return 1
+    leader = threading.Thread(target=flights.do, args=("me", slow))
+    leader.start()
+    assert started.wait(5)
+    with pytest.raises(TimeoutError):
+        flights.do("me", slow, timeout=0.05)
+    leader.join()
+
+def test_async_calls_share_one_task():
+    """Test that coroutines on one loop share a call, and a caller timing out does not cancel it for the rest."""
+    flights = SingleFlight()
+    calls = []
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return "page"
+    async def main():
+        impatient = asyncio.ensure_future(flights.do_async("me", fetch, timeout=0.01))
+        results = await asyncio.gather(*(flights.do_async("me", fetch) for _ in range(3)))
+        with pytest.raises(asyncio.TimeoutError):
+            await impatient
+        return results
+    assert asyncio.run(main()) == ["page"] * 3
+    assert calls == [1]
+    assert flights.stats()["coalesced"] == 3
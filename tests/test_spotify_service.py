@@ -1,6 +1,9 @@
 import pytest
+import threading
+import time
 from unittest.mock import patch, MagicMock
 from spotify_service import SpotifyService
+from http_client import get_http_session
 
 @pytest.fixture
 def spotify_service():
@@ -9,7 +12,7 @@ def spotify_service():
 
 def test_validate_credentials_success(spotify_service):
     """Test that validate_credentials returns True with valid credentials."""
-    with patch('requests.post') as mock_post:
+    with patch.object(spotify_service._http, 'post') as mock_post:
         mock_response = MagicMock()
         mock_response.status_code = 200
         mock_response.json.return_value = {"access_token": "mock_token"}
@@ -20,7 +23,7 @@ def test_validate_credentials_success(spotify_service):
 
 def test_validate_credentials_failure(spotify_service):
     """Test that validate_credentials returns False with invalid credentials."""
-    with patch('requests.post') as mock_post:
+    with patch.object(spotify_service._http, 'post') as mock_post:
         mock_response = MagicMock()
         mock_response.status_code = 401
         mock_post.return_value = mock_response
@@ -40,7 +43,7 @@ def test_get_auth_url(spotify_service):
 
 def test_get_tokens_success(spotify_service):
     """Test that get_tokens returns tokens with a valid authorization code."""
-    with patch('requests.post') as mock_post:
+    with patch.object(spotify_service._http, 'post') as mock_post:
         mock_response = MagicMock()
         mock_response.status_code = 200
         mock_response.json.return_value = {
@@ -57,7 +60,7 @@ def test_get_tokens_success(spotify_service):
 
 def test_get_tokens_failure(spotify_service):
     """Test that get_tokens returns None when token request fails."""
-    with patch('requests.post') as mock_post:
+    with patch.object(spotify_service._http, 'post') as mock_post:
         mock_response = MagicMock()
         mock_response.status_code = 400
         mock_post.return_value = mock_response
@@ -67,7 +70,7 @@ def test_get_tokens_failure(spotify_service):
 
 def test_get_user_profile_success(spotify_service):
     """Test that get_user_profile returns user data with a valid access token."""
-    with patch('requests.get') as mock_get:
+    with patch.object(spotify_service._http, 'get') as mock_get:
         mock_response = MagicMock()
         mock_response.status_code = 200
         mock_response.json.return_value = {
@@ -82,11 +85,290 @@ def test_get_user_profile_success(spotify_service):
 
 def test_get_user_profile_failure(spotify_service):
     """Test that get_user_profile returns None when request fails."""
-    with patch('requests.get') as mock_get:
+    with patch.object(spotify_service._http, 'get') as mock_get:
         mock_response = MagicMock()
         mock_response.status_code = 401
         mock_get.return_value = mock_response
         
         profile = spotify_service.get_user_profile("invalid_token")
         assert profile is None
+
+def test_make_api_request_cache_shared_across_instances():
+    """Test that a GET cached by one SpotifyService is served to a new instance for the same user."""
+    from response_cache import shared_response_cache
+    shared_response_cache.clear()
+    tokens = {"access_token": "mock_access_token", "refresh_token": "mock_refresh_token"}
+    with patch.object(get_http_session(), 'get') as mock_get:
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {"genres": ["rock"]}
+        mock_get.return_value = mock_response
+        
+        first = SpotifyService("mock_client_id", "mock_client_secret", dict(tokens), user_id="test_user")
+        second = SpotifyService("mock_client_id", "mock_client_secret", dict(tokens), user_id="test_user")
+        assert first.get_available_genres() == ["rock"]
+        assert second.get_available_genres() == ["rock"]
+        assert mock_get.call_count == 1
+    shared_response_cache.clear()
+
+def _paged_response(total, failures=None):
+    """Build a make_api_request side effect serving numbered items, failing some offsets a number of times."""
+    failures = dict(failures or {})
+    def request(endpoint, params=None, **kwargs):
+        offset = params['offset']
+        if failures.get(offset, 0) > 0:
+            failures[offset] -= 1
+            return None
+        items = [{"n": n} for n in range(offset, min(offset + params['limit'], total))]
+        return {"items": items, "total": total}
+    return request
+
+def test_fetch_pages_concurrent_in_order(spotify_service):
+    """Test that remaining pages are fetched after reading total and reassembled in offset order."""
+    with patch.object(spotify_service, 'make_api_request', side_effect=_paged_response(230, {100: 1})) as mock_request:
+        with patch('spotify_service.time.sleep'):
+            items, total, complete = spotify_service._fetch_pages('me/tracks', lambda item: item["n"])
+    assert items == list(range(230))
+    assert total == 230
+    assert complete is True
+    assert mock_request.call_count == 6
+
+def test_fetch_pages_respects_limit(spotify_service):
+    """Test that only the pages needed for the requested limit are fetched."""
+    with patch.object(spotify_service, 'make_api_request', side_effect=_paged_response(1000)) as mock_request:
+        items, _, complete = spotify_service._fetch_pages('me/tracks', lambda item: item["n"], limit=100)
+    assert items == list(range(100))
+    assert complete is True
+    assert mock_request.call_count == 2
+
+def test_fetch_pages_stops_before_failed_page(spotify_service):
+    """Test that a page failing after all retries truncates the result and reports it incomplete."""
+    with patch.object(spotify_service, 'make_api_request', side_effect=_paged_response(200, {100: 5})):
+        with patch('spotify_service.time.sleep'):
+            items, _, complete = spotify_service._fetch_pages('me/tracks', lambda item: item["n"])
+    assert items == list(range(100))
+    assert complete is False
+
+def test_get_all_liked_songs_resumes_from_offset(spotify_service):
+    """Test that a crawl can start part-way through the library and returns what it got when a page fails."""
+    with patch.object(spotify_service, 'make_api_request', side_effect=_paged_response(230, {200: 5})), \
+         patch.object(spotify_service, '_parse_saved_track', side_effect=lambda item: item["n"]):
+        with patch('spotify_service.time.sleep'):
+            library = spotify_service.get_all_liked_songs(offset=100)
+    assert library == {"tracks": list(range(100, 200)), "total": 230, "complete": False}
+
+def _token_response(access_token):
+    """Build a successful token endpoint response."""
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.json.return_value = {"access_token": access_token, "expires_in": 3600}
+    return mock_response
+
+def test_refresh_token_persists_new_tokens():
+    """Test that a refreshed token records its expiry and is handed to the persistence callback."""
+    saved = []
+    tokens = {"access_token": "old_access_token", "refresh_token": "mock_refresh_token"}
+    spotify = SpotifyService("mock_client_id", "mock_client_secret", tokens, user_id="persist_user", on_token_refresh=saved.append)
+    with patch.object(spotify._http, 'post', return_value=_token_response("new_access_token")):
+        assert spotify.refresh_token() is True
+    assert saved[0]["access_token"] == "new_access_token"
+    assert saved[0]["refresh_token"] == "mock_refresh_token"
+    assert saved[0]["expires_at"] > time.time() + 3000
+
+def test_make_api_request_refreshes_before_expiry():
+    """Test that an access token about to expire is refreshed before the request instead of after a 401."""
+    tokens = {"access_token": "old_access_token", "refresh_token": "mock_refresh_token", "expires_at": time.time() + 10}
+    spotify = SpotifyService("mock_client_id", "mock_client_secret", tokens, user_id="proactive_user")
+    with patch.object(spotify._http, 'post', return_value=_token_response("new_access_token")) as mock_post, \
+         patch.object(spotify._http, 'get') as mock_get:
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {"id": "mock_user"}
+        mock_get.return_value = mock_response
+        
+        assert spotify.make_api_request('me', use_cache=False) == {"id": "mock_user"}
+    assert mock_post.call_count == 1
+    assert mock_get.call_count == 1
+    assert mock_get.call_args.kwargs["headers"]["Authorization"] == "Bearer new_access_token"
+
+def test_concurrent_refreshes_are_single_flight():
+    """Test that concurrent refreshes for one user make a single token call and share its result."""
+    tokens = {"access_token": "old_access_token", "refresh_token": "mock_refresh_token"}
+    services = [SpotifyService("mock_client_id", "mock_client_secret", dict(tokens), user_id="single_flight_user") for _ in range(4)]
+    def slow_post(*args, **kwargs):
+        time.sleep(0.1)
+        return _token_response("new_access_token")
+    with patch.object(get_http_session(), 'post', side_effect=slow_post) as mock_post:
+        threads = [threading.Thread(target=service.refresh_token) for service in services]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert mock_post.call_count == 1
+    assert all(service.tokens["access_token"] == "new_access_token" for service in services)
+
+def test_refreshed_tokens_expire_and_are_purged_on_logout():
+    """Test that the in-memory copy of refreshed tokens is dropped once expired, when over size, and on logout."""
+    import spotify_service
+    spotify_service._remember_tokens("expired_user", {"access_token": "old", "expires_at": time.time() - 1})
+    assert spotify_service._recent_tokens("expired_user") is None
+    spotify_service._remember_tokens("logged_in_user", {"access_token": "fresh", "expires_at": time.time() + 3600})
+    assert spotify_service._recent_tokens("logged_in_user")["access_token"] == "fresh"
+    spotify_service.purge_user_tokens("logged_in_user")
+    assert spotify_service._recent_tokens("logged_in_user") is None
+    with patch.object(spotify_service, 'DEFAULT_LATEST_TOKENS_SIZE', 2):
+        for user in ("lru_a", "lru_b", "lru_c"):
+            spotify_service._remember_tokens(user, {"access_token": user, "expires_at": time.time() + 3600})
+    assert spotify_service._recent_tokens("lru_a") is None
+    assert spotify_service._recent_tokens("lru_c")["access_token"] == "lru_c"
+
+def test_make_api_request_waits_out_rate_limit():
+    """Test that a 429 is retried after Retry-After instead of being returned as a failure."""
+    from request_scheduler import RequestScheduler
+    tokens = {"access_token": "mock_access_token", "refresh_token": "mock_refresh_token"}
+    spotify = SpotifyService("rate_limited_client", "mock_client_secret", tokens, user_id="rate_limited_user")
+    spotify._scheduler = RequestScheduler()
+    limited = MagicMock(status_code=429, headers={"Retry-After": "0.1"})
+    ok = MagicMock(status_code=200)
+    ok.json.return_value = {"id": "mock_user"}
+    with patch.object(spotify._http, 'get', side_effect=[limited, ok]) as mock_get:
+        assert spotify.make_api_request('me', use_cache=False) == {"id": "mock_user"}
+    assert mock_get.call_count == 2
+    assert spotify._scheduler.stats()["rate_limited"] == 1
+
+def test_make_api_request_bounded_by_deadline():
+    """Test that a request's HTTP timeout is what is left of its deadline, and none is sent once it has passed."""
+    from deadline import Deadline
+    tokens = {"access_token": "mock_access_token", "refresh_token": "mock_refresh_token"}
+    spotify = SpotifyService("deadline_client", "mock_client_secret", tokens, user_id="deadline_user")
+    ok = MagicMock(status_code=200)
+    ok.json.return_value = {"id": "mock_user"}
+    with patch.object(spotify._deadline_http, 'get', return_value=ok) as mock_get:
+        assert spotify.make_api_request('me', use_cache=False, deadline=Deadline(2)) == {"id": "mock_user"}
+        assert 0 < mock_get.call_args.kwargs["timeout"] <= 2
+        assert spotify.make_api_request('me', use_cache=False, deadline=Deadline(0)) is None
+    assert mock_get.call_count == 1
+
+def test_deadline_requests_retry_server_errors_within_deadline():
+    """Test that calls with a deadline skip transport retries and retry a 5xx themselves only while the backoff fits."""
+    from deadline import Deadline
+    tokens = {"access_token": "mock_access_token", "refresh_token": "mock_refresh_token"}
+    spotify = SpotifyService("retry_client", "mock_client_secret", tokens, user_id="retry_user")
+    spotify._server_error_backoff = 0.01
+    assert spotify._deadline_http.get_adapter('https://api.spotify.com/v1/me').max_retries.total == 0
+    failing = MagicMock(status_code=503, text="unavailable")
+    ok = MagicMock(status_code=200)
+    ok.json.return_value = {"id": "mock_user"}
+    with patch.object(spotify._deadline_http, 'get', side_effect=[failing, ok]) as mock_get:
+        assert spotify.make_api_request('me', use_cache=False, deadline=Deadline(5)) == {"id": "mock_user"}
+    assert mock_get.call_count == 2
+    
+    spotify._server_error_backoff = 10
+    with patch.object(spotify._deadline_http, 'get', return_value=failing) as mock_get:
+        assert spotify.make_api_request('me', use_cache=False, deadline=Deadline(5)) is None
+    assert mock_get.call_count == 1
+
+def test_open_circuit_fails_fast_without_request():
+    """Test that once search keeps failing, its breaker rejects calls unsent while other endpoint families still work."""
+    from circuit_breaker import CircuitBreakerRegistry, CircuitOpenError
+    tokens = {"access_token": "mock_access_token", "refresh_token": "mock_refresh_token"}
+    spotify = SpotifyService("circuit_client", "mock_client_secret", tokens, user_id="circuit_user")
+    spotify._circuit_breakers = CircuitBreakerRegistry(min_calls=2, reset_timeout=30)
+    failing = MagicMock(status_code=503)
+    ok = MagicMock(status_code=200)
+    ok.json.return_value = {"id": "mock_user"}
+    with patch.object(spotify._http, 'get', return_value=failing) as mock_get:
+        for _ in range(2):
+            assert spotify.make_api_request('search', params={"q": "song"}, use_cache=False) is None
+        with pytest.raises(CircuitOpenError):
+            spotify.make_api_request('search', params={"q": "song"}, use_cache=False)
+        assert mock_get.call_count == 2
+        mock_get.return_value = ok
+        assert spotify.make_api_request('me', use_cache=False) == {"id": "mock_user"}
+
+def test_deadline_timeouts_leave_circuit_closed():
+    """Test that timeouts cut short by the caller's own deadline do not count against the shared breaker, while full-length ones do."""
+    import requests
+    from circuit_breaker import CircuitBreakerRegistry, CircuitOpenError, CLOSED, OPEN
+    from deadline import Deadline
+    tokens = {"access_token": "mock_access_token", "refresh_token": "mock_refresh_token"}
+    spotify = SpotifyService("timeout_client", "mock_client_secret", tokens, user_id="timeout_user")
+    spotify._circuit_breakers = CircuitBreakerRegistry(min_calls=2, reset_timeout=30)
+    with patch.object(spotify._deadline_http, 'get', side_effect=requests.exceptions.ReadTimeout("read timed out")), \
+         patch.object(spotify._http, 'get', side_effect=requests.exceptions.ReadTimeout("read timed out")):
+        for _ in range(3):
+            assert spotify.make_api_request('search', params={"q": "song"}, use_cache=False, deadline=Deadline(2)) is None
+        assert spotify._breaker('search').state == CLOSED
+        with pytest.raises(CircuitOpenError):
+            for _ in range(4):
+                assert spotify.make_api_request('search', params={"q": "song"}, use_cache=False) is None
+        assert spotify._breaker('search').state == OPEN
+
+def test_stale_profile_served_while_refreshing():
+    """Test that an expired profile within the grace window is returned at once and refreshed in the background."""
+    tokens = {"access_token": "mock_access_token", "refresh_token": "mock_refresh_token"}
+    spotify = SpotifyService("stale_client", "mock_client_secret", tokens, user_id="stale_user")
+    with patch('response_cache.time.time', return_value=time.time() - spotify._extended_cache_expiry - 10):
+        spotify._set_to_cache('me', {"id": "old"}, spotify._extended_cache_expiry, stale_ok=True)
+    fresh = MagicMock(status_code=200)
+    fresh.json.return_value = {"id": "new"}
+    with patch.object(spotify._http, 'get', return_value=fresh) as mock_get, \
+         patch('spotify_service._revalidation_executor.submit') as mock_submit:
+        assert spotify.get_user_profile() == {"id": "old"}
+        assert mock_get.call_count == 0
+        # Run the queued background refresh
+        mock_submit.call_args.args[0]()
+        assert spotify.get_user_profile() == {"id": "new"}
+    assert mock_get.call_count == 1
+
+def test_stale_response_served_when_spotify_fails():
+    """Test that an entry past the grace window is refetched first and only served if that fails."""
+    tokens = {"access_token": "mock_access_token", "refresh_token": "mock_refresh_token"}
+    spotify = SpotifyService("stale_error_client", "mock_client_secret", tokens, user_id="stale_error_user")
+    spotify._stale_while_revalidate = 60
+    with patch('response_cache.time.time', return_value=time.time() - spotify._extended_cache_expiry - 600):
+        spotify._set_to_cache('me', {"id": "old"}, spotify._extended_cache_expiry, stale_ok=True)
+    with patch.object(spotify._http, 'get', return_value=MagicMock(status_code=502)) as mock_get:
+        assert spotify.get_user_profile() == {"id": "old"}
+    assert mock_get.call_count == 1
+    # Endpoints that don't opt in never see stale data
+    assert spotify.make_api_request('me', cache_expiry=spotify._extended_cache_expiry, use_cache=True) is None
+
+def test_only_stale_ok_responses_kept_past_expiry():
+    """Test that the shared cache keeps an entry past its TTL only for endpoints that may be served stale."""
+    tokens = {"access_token": "mock_access_token", "refresh_token": "mock_refresh_token"}
+    spotify = SpotifyService("stale_ttl_client", "mock_client_secret", tokens, user_id="stale_ttl_user")
+    ok = MagicMock(status_code=200)
+    ok.json.return_value = {"tracks": {"items": []}}
+    with patch.object(spotify._http, 'get', return_value=ok), patch.object(spotify._cache, 'set') as mock_set:
+        spotify.make_api_request('search', params={"q": "song"}, cache_expiry=300)
+        spotify.make_api_request('me', cache_expiry=300, stale_ok=True)
+    assert mock_set.call_args_list[0].args[3] == 300
+    assert mock_set.call_args_list[1].args[3] == 300 + spotify._max_staleness()
+
+def test_identical_concurrent_gets_are_coalesced():
+    """Test that simultaneous identical GETs for one user make a single HTTP call and share its response."""
+    from single_flight import SingleFlight
+    tokens = {"access_token": "mock_access_token", "refresh_token": "mock_refresh_token"}
+    services = [SpotifyService("coalesce_client", "mock_client_secret", dict(tokens), user_id="coalesce_user") for _ in range(4)]
+    flights = SingleFlight()
+    for service in services:
+        service._single_flight = flights
+    ok = MagicMock(status_code=200)
+    ok.json.return_value = {"items": [], "total": 0}
+    def slow_get(*args, **kwargs):
+        time.sleep(0.1)
+        return ok
+    results = []
+    with patch.object(get_http_session(), 'get', side_effect=slow_get) as mock_get:
+        threads = [threading.Thread(target=lambda s=service: results.append(
+            s.make_api_request('me/tracks', params={"limit": 50, "offset": 0}, use_cache=False))) for service in services]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert mock_get.call_count == 1
+    assert results == [{"items": [], "total": 0}] * 4
+    assert flights.stats()["coalesced"] == 3
+
 # Additional tests can be added for other methods like get_liked_songs, search_track, create_playlist, etc.
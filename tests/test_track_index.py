@@ -0,0 +1,18 @@
+from track_index import TrackIndex
+
+def test_library_tracks_match_suggestions_by_folded_key_and_any_artist():
+    """Test that a liked track matches suggestions differing in case, accents or naming only one of its artists."""
+    index = TrackIndex([{"name": "Café Del Mar", "artist": "Energy 52, Kid Paul", "uri": "spotify:track:1"}])
+    assert {"title": "cafe del mar", "artist": "ENERGY 52"} in index
+    assert {"title": "Cafe Del Mar", "artist": "Kid Paul"} in index
+    assert {"title": "Cafe Del Mar", "artist": "Someone Else"} not in index
+    assert {"name": "Other", "artist": "X", "uri": "spotify:track:1"} in index
+
+def test_claim_admits_each_suggestion_and_uri_once():
+    """Test that claim and claim_uri accept the first occurrence only."""
+    index = TrackIndex(keys={"avoided|artist"})
+    assert index.claim({"title": "Avoided", "artist": "Artist"}) is False
+    assert index.claim({"title": "Song", "artist": "Artist"}) is True
+    assert index.claim({"title": "Song!", "artist": "artist"}) is False
+    assert index.claim_uri({"uri": "spotify:track:2"}) is True
+    assert index.claim_uri({"uri": "spotify:track:2"}) is False
@@ -120,4 +120,75 @@ def test_get_gemini_api_key_none(user_service, mock_session):
         api_key = user_service.get_gemini_api_key(user_id)
         assert api_key is None
 
+def _encrypted_user_row(user_service, **fields):
+    """Build a users row with each given field encrypted under a fresh per-user key."""
+    from types import SimpleNamespace
+    from cryptography.fernet import Fernet
+    user_key = Fernet.generate_key()
+    user_cipher = Fernet(user_key)
+    row = {name: None for name in ('spotify_client_id', 'spotify_client_secret', 'spotify_access_token',
+                                   'spotify_refresh_token', 'gemini_api_key', 'code_verifier')}
+    row.update({name: user_cipher.encrypt(value.encode()).decode() for name, value in fields.items()})
+    row['spotify_token_expires_at'] = None
+    row['encryption_key'] = Fernet(user_service.master_key).encrypt(user_key).decode()
+    return SimpleNamespace(**row)
+
+def test_get_user_context(user_service, mock_session):
+    """Test that one query returns every decrypted credential for a user."""
+    mock_session.execute.return_value.fetchone.return_value = _encrypted_user_row(
+        user_service,
+        spotify_client_id="mock_client_id",
+        spotify_client_secret="mock_client_secret",
+        spotify_access_token="mock_access_token",
+        spotify_refresh_token="mock_refresh_token",
+        gemini_api_key="mock_api_key"
+    )
+    
+    with patch('user_service.get_session', return_value=mock_session):
+        context = user_service.get_user_context("test_user")
+    assert mock_session.execute.call_count == 1
+    assert context.spotify_credentials == {"client_id": "mock_client_id", "client_secret": "mock_client_secret"}
+    assert context.spotify_tokens == {"access_token": "mock_access_token", "refresh_token": "mock_refresh_token"}
+    assert context.gemini_api_key == "mock_api_key"
+    assert context.has_gemini_api_key is True
+    assert context.code_verifier is None
+
+def test_get_request_context_memoized_per_request(user_service, mock_session):
+    """Test that the context is loaded once per request and reloaded after a write."""
+    from flask import Flask
+    mock_session.execute.return_value.fetchone.return_value = _encrypted_user_row(user_service, gemini_api_key="mock_api_key")
+    
+    with patch('user_service.get_session', return_value=mock_session):
+        with Flask(__name__).app_context():
+            user_service.get_request_context("test_user")
+            user_service.get_request_context("test_user")
+            assert mock_session.execute.call_count == 1
+            user_service.clear_code_verifier("test_user")
+            user_service.get_request_context("test_user")
+            assert mock_session.execute.call_count == 3
+
+def test_user_cipher_cached_across_calls(user_service, mock_session):
+    """Test that the per-user key is decrypted with the master key only once while cached."""
+    from user_service import purge_user_cipher
+    purge_user_cipher("test_user")
+    mock_session.execute.return_value.fetchone.return_value = _encrypted_user_row(user_service, gemini_api_key="mock_api_key")
+    
+    with patch('user_service.get_session', return_value=mock_session), \
+         patch.object(user_service._master_cipher, 'decrypt', wraps=user_service._master_cipher.decrypt) as mock_decrypt:
+        assert user_service.get_gemini_api_key("test_user") == "mock_api_key"
+        assert user_service.get_user_context("test_user").gemini_api_key == "mock_api_key"
+        assert mock_decrypt.call_count == 1
+        
+        user_service.purge_user_cipher("test_user")
+        assert user_service.get_gemini_api_key("test_user") == "mock_api_key"
+        assert mock_decrypt.call_count == 2
+
+def test_user_cipher_cache_follows_key_rotation(user_service, mock_session):
+    """Test that a changed stored key is never served the previously cached cipher."""
+    with patch('user_service.get_session', return_value=mock_session):
+        mock_session.execute.return_value.fetchone.return_value = _encrypted_user_row(user_service, gemini_api_key="old_key")
+        assert user_service.get_gemini_api_key("test_user") == "old_key"
+        mock_session.execute.return_value.fetchone.return_value = _encrypted_user_row(user_service, gemini_api_key="new_key")
+        assert user_service.get_gemini_api_key("test_user") == "new_key"
+
 # Additional tests can be added for other edge cases like database errors, invalid user IDs, etc.
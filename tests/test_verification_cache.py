@@ -0,0 +1,56 @@
+import pytest
+from unittest.mock import patch
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from database import Base
+from verification_cache import VerificationCache, normalize_track_key
+
+@pytest.fixture
+def verification_cache(tmp_path):
+    """Fixture to create a VerificationCache backed by a temporary database file."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'lookups.db'}")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    with patch('verification_cache.get_session', side_effect=lambda: Session()):
+        yield VerificationCache(found_ttl=3600, not_found_ttl=60)
+
+def test_normalize_track_key_folds_case_and_punctuation():
+    """Test that spelling variants of the same suggestion share one key."""
+    assert normalize_track_key("Don't Stop Me Now!", "Queen") == normalize_track_key("dont stop me now", "QUEEN")
+    assert normalize_track_key("Café del Mar", "Energy 52") == normalize_track_key("cafe del mar", "energy 52")
+    assert normalize_track_key("Song", "Artist A") != normalize_track_key("Song", "Artist B")
+
+def test_found_track_shared_across_lookups(verification_cache):
+    """Test that a stored track is returned for a differently cased suggestion."""
+    track = {"name": "Hey Jude", "uri": "spotify:track:1"}
+    verification_cache.put("Hey Jude", "The Beatles", track)
+    assert verification_cache.get("hey jude", "the beatles") == (True, track)
+
+def test_not_found_expires_sooner(verification_cache):
+    """Test that "not found" answers use the shorter TTL."""
+    with patch('verification_cache.time.time', return_value=1000):
+        verification_cache.put("Missing", "Nobody", None)
+        verification_cache.put("Hey Jude", "The Beatles", {"uri": "spotify:track:1"})
+        assert verification_cache.get("Missing", "Nobody") == (True, None)
+    with patch('verification_cache.time.time', return_value=1000 + 120):
+        assert verification_cache.get("Missing", "Nobody") == (False, None)
+        assert verification_cache.get("Hey Jude", "The Beatles")[0] is True
+
+def test_expired_lookups_pruned_every_n_writes(tmp_path):
+    """Test that expired rows are deleted from the table as writes accumulate, not just ignored by get()."""
+    from sqlalchemy.sql import text
+    engine = create_engine(f"sqlite:///{tmp_path / 'lookups.db'}")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    count = lambda: Session().execute(text('SELECT COUNT(*) FROM track_lookups')).scalar()
+    with patch('verification_cache.get_session', side_effect=lambda: Session()):
+        cache = VerificationCache(found_ttl=3600, not_found_ttl=60, prune_every=3)
+        with patch('verification_cache.time.time', return_value=1000):
+            cache.put("Missing", "Nobody", None)
+            cache.put("Hey Jude", "The Beatles", {"uri": "spotify:track:1"})
+        with patch('verification_cache.time.time', return_value=1000 + 120):
+            assert count() == 2
+            cache.put("Yesterday", "The Beatles", {"uri": "spotify:track:2"})
+            assert count() == 2
+            assert cache.get("Hey Jude", "The Beatles")[0] is True
+            assert cache.get("Missing", "Nobody") == (False, None)
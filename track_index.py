@@ -0,0 +1,59 @@
+from verification_cache import normalize_track_key
+
+
+def _keys(track):
+    """Folded (title, artist) keys for a library track, suggestion or verified track.
+
+    Spotify joins a track's artists as "A, B" while Gemini usually names just one of them, so each
+    listed artist gets a key of its own besides the full string."""
+    title = track.get('title') or track.get('name')
+    artist = track.get('artist')
+    if not isinstance(title, str) or not isinstance(artist, str) or not title or not artist:
+        return set()
+    keys = {normalize_track_key(title, artist)}
+    if ',' in artist:
+        keys.update(normalize_track_key(title, name) for name in artist.split(',') if name.strip())
+    return keys
+
+
+class TrackIndex:
+    """Hash sets of Spotify URIs and folded (title, artist) keys for one recommendations run.
+
+    Seeded with the user's Liked Songs and anything to avoid, it drops suggestions the user already has
+    or that Gemini repeated before any search is spent on them, and verified tracks whose URI was
+    already returned or liked."""
+
+    def __init__(self, tracks=(), keys=()):
+        self.uris = set()
+        self.keys = set(keys)
+        self.update(tracks)
+
+    def add(self, track):
+        if track.get('uri'):
+            self.uris.add(track['uri'])
+        self.keys.update(_keys(track))
+
+    def update(self, tracks):
+        for track in tracks:
+            self.add(track)
+
+    def __contains__(self, track):
+        if track.get('uri') in self.uris:
+            return True
+        return not self.keys.isdisjoint(_keys(track))
+
+    def claim(self, suggestion):
+        """Index a suggestion and return True, or False if it is liked, avoided or already suggested"""
+        if suggestion in self:
+            return False
+        self.add(suggestion)
+        return True
+
+    def claim_uri(self, track):
+        """Index a verified track's URI and return True, or False if that URI was liked or already returned"""
+        uri = track.get('uri')
+        if uri in self.uris:
+            return False
+        if uri:
+            self.uris.add(uri)
+        return True
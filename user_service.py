@@ -1,13 +1,65 @@
 from cryptography.fernet import Fernet, InvalidToken
 from database import get_session
 from sqlalchemy.sql import text
+from dataclasses import dataclass
+from typing import Optional
+from flask import g, has_app_context
+from collections import OrderedDict
 import os
+import threading
+import time
 import logging
 
 # Set up logging for error tracking
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Decrypted per-user ciphers are kept in memory briefly so repeated requests skip the master-key decrypt
+DEFAULT_CIPHER_CACHE_SIZE = int(os.environ.get('USER_CIPHER_CACHE_SIZE', 1000))
+DEFAULT_CIPHER_CACHE_TTL = int(os.environ.get('USER_CIPHER_CACHE_TTL', 900))
+
+# Shared by every UserService instance in the process: user_id -> (encrypted_key, cipher, expires_at)
+_cipher_cache = OrderedDict()
+_cipher_cache_lock = threading.Lock()
+
+def purge_user_cipher(user_id):
+    """Drop a user's decrypted cipher from memory, e.g. on logout or key rotation"""
+    with _cipher_cache_lock:
+        _cipher_cache.pop(user_id, None)
+
+@dataclass
+class UserContext:
+    """Everything stored for a user, decrypted once per request"""
+    user_id: str
+    spotify_client_id: Optional[str] = None
+    spotify_client_secret: Optional[str] = None
+    spotify_access_token: Optional[str] = None
+    spotify_refresh_token: Optional[str] = None
+    gemini_api_key: Optional[str] = None
+    code_verifier: Optional[str] = None
+    spotify_token_expires_at: Optional[float] = None
+    
+    @property
+    def spotify_credentials(self):
+        """Spotify client credentials in the shape get_spotify_credentials returns, or None"""
+        if not self.spotify_client_id or not self.spotify_client_secret:
+            return None
+        return {'client_id': self.spotify_client_id, 'client_secret': self.spotify_client_secret}
+    
+    @property
+    def spotify_tokens(self):
+        """Spotify tokens in the shape get_spotify_tokens returns, or None"""
+        if not self.spotify_access_token or not self.spotify_refresh_token:
+            return None
+        tokens = {'access_token': self.spotify_access_token, 'refresh_token': self.spotify_refresh_token}
+        if self.spotify_token_expires_at:
+            tokens['expires_at'] = self.spotify_token_expires_at
+        return tokens
+    
+    @property
+    def has_gemini_api_key(self):
+        return self.gemini_api_key is not None
+
 class UserService:
     def __init__(self):
         # Prioritize local key file for development and testing
@@ -22,6 +74,36 @@ class UserService:
                 raise ValueError("MASTER_ENCRYPTION_KEY environment variable not set and no local key file found at 'dev_master_key.txt'")
             else:
                 print("Loaded master key from environment variable")
+        self._master_cipher = Fernet(self.master_key)
+        self.cipher_cache_size = DEFAULT_CIPHER_CACHE_SIZE
+        self.cipher_cache_ttl = DEFAULT_CIPHER_CACHE_TTL
+    
+    def _cipher_for_key(self, user_id, encrypted_key):
+        """Return the user's Fernet cipher for a stored encryption_key, decrypting it at most once per TTL"""
+        now = time.time()
+        with _cipher_cache_lock:
+            entry = _cipher_cache.get(user_id)
+            # The stored key is part of the entry so a key rotated elsewhere never serves a stale cipher
+            if entry and entry[0] == encrypted_key and entry[2] > now:
+                _cipher_cache.move_to_end(user_id)
+                return entry[1]
+        try:
+            cipher = Fernet(self._master_cipher.decrypt(encrypted_key.encode()))
+        except InvalidToken as e:
+            logger.error(f"Decryption failed for user {user_id} encryption key: {e}")
+            purge_user_cipher(user_id)
+            return None
+        with _cipher_cache_lock:
+            _cipher_cache[user_id] = (encrypted_key, cipher, now + self.cipher_cache_ttl)
+            _cipher_cache.move_to_end(user_id)
+            while len(_cipher_cache) > self.cipher_cache_size:
+                _cipher_cache.popitem(last=False)
+        return cipher
+    
+    def purge_user_cipher(self, user_id):
+        """Forget the user's decrypted cipher and any credentials loaded for this request"""
+        purge_user_cipher(user_id)
+        self._forget_request_context(user_id)
     
     def _get_user_cipher(self, user_id):
         # Note: Consider reusing sessions within a request context for performance
@@ -32,14 +114,7 @@ class UserService:
             session.close()
             
             if user and hasattr(user, 'encryption_key') and user.encryption_key:
-                # Decrypt the user's encryption key using the master key
-                try:
-                    master_cipher = Fernet(self.master_key)
-                    user_key = master_cipher.decrypt(user.encryption_key.encode())
-                    return Fernet(user_key)
-                except InvalidToken as e:
-                    logger.error(f"Decryption failed for user {user_id} encryption key: {e}")
-                    return None
+                return self._cipher_for_key(user_id, user.encryption_key)
             return None
         except Exception as e:
             logger.error(f"Database error while fetching cipher for user {user_id}: {e}")
@@ -48,20 +123,68 @@ class UserService:
     def _generate_user_key(self, user_id):
         try:
             user_key = Fernet.generate_key()
-            master_cipher = Fernet(self.master_key)
-            encrypted_key = master_cipher.encrypt(user_key).decode()
+            encrypted_key = self._master_cipher.encrypt(user_key).decode()
             
             session = get_session()
             session.execute(text('INSERT OR REPLACE INTO users (id, encryption_key) VALUES (:user_id, :encrypted_key)'), 
                         {'user_id': user_id, 'encrypted_key': encrypted_key})
             session.commit()
             session.close()
+            self.purge_user_cipher(user_id)
             
             return Fernet(user_key)
         except Exception as e:
             logger.error(f"Error generating user key for user {user_id}: {e}")
             raise
 
+    def get_user_context(self, user_id):
+        """Load every credential column in one query and decrypt them with a single cipher derivation"""
+        context = UserContext(user_id=user_id)
+        try:
+            session = get_session()
+            user = session.execute(text('''
+                SELECT spotify_client_id, spotify_client_secret, spotify_access_token, spotify_refresh_token,
+                       gemini_api_key, code_verifier, encryption_key, spotify_token_expires_at
+                FROM users WHERE id = :user_id
+            '''), {'user_id': user_id}).fetchone()
+            session.close()
+        except Exception as e:
+            logger.error(f"Error loading user context for user {user_id}: {e}")
+            return context
+        
+        if not user or not user.encryption_key:
+            return context
+        context.spotify_token_expires_at = user.spotify_token_expires_at
+        
+        cipher = self._cipher_for_key(user_id, user.encryption_key)
+        if not cipher:
+            return context
+        
+        for field in ('spotify_client_id', 'spotify_client_secret', 'spotify_access_token',
+                      'spotify_refresh_token', 'gemini_api_key', 'code_verifier'):
+            value = getattr(user, field)
+            if not value:
+                continue
+            try:
+                setattr(context, field, cipher.decrypt(value.encode()).decode())
+            except InvalidToken as e:
+                logger.error(f"Decryption failed for user {user_id} {field}: {e}")
+        return context
+    
+    def get_request_context(self, user_id):
+        """Return the user's context, loading it at most once per Flask request"""
+        if not has_app_context():
+            return self.get_user_context(user_id)
+        contexts = g.setdefault('user_contexts', {})
+        if user_id not in contexts:
+            contexts[user_id] = self.get_user_context(user_id)
+        return contexts[user_id]
+    
+    def _forget_request_context(self, user_id):
+        """Drop the memoized context after a write so the rest of the request sees fresh values"""
+        if has_app_context():
+            g.get('user_contexts', {}).pop(user_id, None)
+    
     def save_spotify_credentials(self, user_id, client_id, client_secret):
         try:
             cipher = self._get_user_cipher(user_id) or self._generate_user_key(user_id)
@@ -80,6 +203,7 @@ class UserService:
             '''), {'client_id': encrypted_client_id, 'client_secret': encrypted_client_secret, 'user_id': user_id})
             session.commit()
             session.close()
+            self._forget_request_context(user_id)
             return {"success": True, "message": "Spotify credentials saved successfully"}
         except ValueError as ve:
             logger.error(f"Value error saving Spotify credentials for user {user_id}: {ve}")
@@ -108,13 +232,7 @@ class UserService:
                 
             cipher = None
             if hasattr(user, 'encryption_key') and user.encryption_key:
-                try:
-                    master_cipher = Fernet(self.master_key)
-                    user_key = master_cipher.decrypt(user.encryption_key.encode())
-                    cipher = Fernet(user_key)
-                except InvalidToken as e:
-                    logger.error(f"Decryption failed for user {user_id} encryption key: {e}")
-                    return None
+                cipher = self._cipher_for_key(user_id, user.encryption_key)
             if not cipher:
                 return None
                 
@@ -139,12 +257,14 @@ class UserService:
             encrypted_refresh = cipher.encrypt(tokens['refresh_token'].encode()).decode()
             
             session = get_session()
-            session.execute(
-                text('UPDATE users SET spotify_access_token = :access, spotify_refresh_token = :refresh WHERE id = :user_id'),
-                {'access': encrypted_access, 'refresh': encrypted_refresh, 'user_id': user_id}
-            )
+            session.execute(text('''
+                UPDATE users
+                SET spotify_access_token = :access, spotify_refresh_token = :refresh, spotify_token_expires_at = :expires_at
+                WHERE id = :user_id
+            '''), {'access': encrypted_access, 'refresh': encrypted_refresh, 'expires_at': tokens.get('expires_at'), 'user_id': user_id})
             session.commit()
             session.close()
+            self._forget_request_context(user_id)
         except Exception as e:
             logger.error(f"Error saving Spotify tokens for user {user_id}: {e}")
             raise
@@ -165,13 +285,7 @@ class UserService:
             
             cipher = None
             if hasattr(user, 'encryption_key') and user.encryption_key:
-                try:
-                    master_cipher = Fernet(self.master_key)
-                    user_key = master_cipher.decrypt(user.encryption_key.encode())
-                    cipher = Fernet(user_key)
-                except InvalidToken as e:
-                    logger.error(f"Decryption failed for user {user_id} encryption key: {e}")
-                    return None
+                cipher = self._cipher_for_key(user_id, user.encryption_key)
             if not cipher:
                 return None
                 
@@ -205,6 +319,7 @@ class UserService:
             )
             session.commit()
             session.close()
+            self._forget_request_context(user_id)
             return {"success": True, "message": "Google Gemini AI API key saved successfully"}
         except ValueError as ve:
             logger.error(f"Value error saving Gemini API key for user {user_id}: {ve}")
@@ -234,13 +349,7 @@ class UserService:
             
             cipher = None
             if hasattr(user, 'encryption_key') and user.encryption_key:
-                try:
-                    master_cipher = Fernet(self.master_key)
-                    user_key = master_cipher.decrypt(user.encryption_key.encode())
-                    cipher = Fernet(user_key)
-                except InvalidToken as e:
-                    logger.error(f"Decryption failed for user {user_id} encryption key: {e}")
-                    return None
+                cipher = self._cipher_for_key(user_id, user.encryption_key)
             if not cipher:
                 return None
                 
@@ -283,6 +392,7 @@ class UserService:
             )
             session.commit()
             session.close()
+            self._forget_request_context(user_id)
         except Exception as e:
             logger.error(f"Error saving code verifier for user {user_id}: {e}")
             raise
@@ -302,13 +412,7 @@ class UserService:
             
             cipher = None
             if hasattr(user, 'encryption_key') and user.encryption_key:
-                try:
-                    master_cipher = Fernet(self.master_key)
-                    user_key = master_cipher.decrypt(user.encryption_key.encode())
-                    cipher = Fernet(user_key)
-                except InvalidToken as e:
-                    logger.error(f"Decryption failed for user {user_id} encryption key: {e}")
-                    return None
+                cipher = self._cipher_for_key(user_id, user.encryption_key)
             if not cipher:
                 return None
                 
@@ -328,6 +432,7 @@ class UserService:
             )
             session.commit()
             session.close()
+            self._forget_request_context(user_id)
         except Exception as e:
             logger.error(f"Error clearing code verifier for user {user_id}: {e}")
             raise
@@ -0,0 +1,92 @@
+from database import get_session
+from sqlalchemy.sql import text
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Found tracks rarely disappear from Spotify, so positive lookups are kept for a long time
+DEFAULT_FOUND_TTL = int(os.environ.get('TRACK_LOOKUP_TTL', 30 * 86400))
+# "Not found" answers may change as catalogues update, so they expire much sooner
+DEFAULT_NOT_FOUND_TTL = int(os.environ.get('TRACK_LOOKUP_NOT_FOUND_TTL', 86400))
+
+
+def _fold(value):
+    value = unicodedata.normalize('NFKD', value or '')
+    value = ''.join(c for c in value if not unicodedata.combining(c))
+    # Apostrophes join words ("don't" -> "dont"); other punctuation separates them
+    value = re.sub(r"['\u2019`]", '', value.casefold())
+    value = re.sub(r'[^\w\s]', ' ', value)
+    return ' '.join(value.split())
+
+
+def normalize_track_key(title, artist):
+    """Case-, accent- and punctuation-folded key for a (title, artist) pair"""
+    return f"{_fold(title)}|{_fold(artist)}"
+
+
+class VerificationCache:
+    """Shared (title, artist) -> Spotify track cache so popular suggestions are searched once for everyone"""
+
+    def __init__(self, found_ttl=None, not_found_ttl=None, prune_every=100):
+        self.found_ttl = found_ttl if found_ttl is not None else DEFAULT_FOUND_TTL
+        self.not_found_ttl = not_found_ttl if not_found_ttl is not None else DEFAULT_NOT_FOUND_TTL
+        # Expired rows are deleted every prune_every writes to keep the write path cheap
+        self.prune_every = prune_every
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def get(self, title, artist):
+        """Return (hit, track); track is None for a cached "not found" answer"""
+        try:
+            session = get_session()
+            row = session.execute(
+                text('SELECT track FROM track_lookups WHERE lookup_key = :key AND expires_at > :now'),
+                {'key': normalize_track_key(title, artist), 'now': time.time()}
+            ).fetchone()
+            session.close()
+            if row is None:
+                return False, None
+            return True, json.loads(row.track) if row.track else None
+        except Exception as e:
+            logger.error(f"Error reading track lookup for {title} by {artist}: {e}")
+            return False, None
+
+    def put(self, title, artist, track):
+        """Store a search outcome; pass None to record that Spotify has no match"""
+        ttl = self.found_ttl if track else self.not_found_ttl
+        try:
+            session = get_session()
+            session.execute(text('''
+                INSERT OR REPLACE INTO track_lookups (lookup_key, track, expires_at)
+                VALUES (:key, :track, :expires_at)
+            '''), {
+                'key': normalize_track_key(title, artist),
+                'track': json.dumps(track) if track else None,
+                'expires_at': time.time() + ttl
+            })
+            session.commit()
+            session.close()
+        except Exception as e:
+            logger.error(f"Error storing track lookup for {title} by {artist}: {e}")
+            return
+        with self._lock:
+            self._writes += 1
+            should_prune = self._writes % self.prune_every == 0
+        if should_prune:
+            self.prune()
+
+    def prune(self):
+        """Drop expired lookups, which get() already ignores"""
+        try:
+            session = get_session()
+            session.execute(text('DELETE FROM track_lookups WHERE expires_at <= :now'), {'now': time.time()})
+            session.commit()
+            session.close()
+        except Exception as e:
+            logger.error(f"Error pruning expired track lookups: {e}")